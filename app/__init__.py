@@ -41,6 +41,18 @@ def create_app():
     app.register_blueprint(dash_bp)
     app.register_blueprint(settings_bp)
 
+    # Background jobs run in one process only: every gunicorn worker builds
+    # the app, and each extra scheduler would poll (and IDLE-watch) every
+    # mailbox again. The other workers wait on the lock and take over when
+    # the holder is recycled or dies.
+    from .process_locks import scheduler_lock
+    scheduler_lock.when_acquired(lambda: _start_background_jobs(app))
+
+    return app
+
+
+def _start_background_jobs(app):
+    """Scheduler jobs and IDLE watchers; runs in the scheduler lock holder only."""
     # Start scheduler
     try:
         scheduler.start()
@@ -51,11 +63,26 @@ def create_app():
     try:
         from .tasks import check_all_inboxes
         # add job that calls check_all_inboxes with current app
-        scheduler.add_job(func=lambda: check_all_inboxes(app), trigger='interval', minutes=3, id='check_all_inboxes', replace_existing=True)
+        poll_minutes = app.config.get('INBOX_POLL_MINUTES', 3)
+        if app.config.get('IMAP_IDLE_ENABLED'):
+            poll_minutes = app.config.get('IMAP_IDLE_FALLBACK_POLL_MINUTES', 15)
+        scheduler.add_job(func=lambda: check_all_inboxes(app), trigger='interval', minutes=poll_minutes, id='check_all_inboxes', replace_existing=True)
     except Exception:
         pass
-
-    return app
+    # failed listing pages are retried by their own job, apart from the inbox pass
+    if app.config.get('SCRAPE_RETRY_ENABLED'):
+        try:
+            from .tasks import retry_failed_scrapes
+            scheduler.add_job(func=lambda: retry_failed_scrapes(app), trigger='interval', minutes=app.config.get('SCRAPE_RETRY_INTERVAL_MINUTES', 2), id='retry_failed_scrapes', replace_existing=True, max_instances=1, coalesce=True)
+        except Exception:
+            pass
+    # push delivery via IMAP IDLE; the interval job above stays as fallback
+    if app.config.get('IMAP_IDLE_ENABLED'):
+        try:
+            from .imap_idle import start_idle_watchers
+            start_idle_watchers(app, scheduler)
+        except Exception:
+            pass
 
 
 # Import tasks to register job functions
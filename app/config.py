@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -23,4 +24,113 @@ class Config:
         }
     # APScheduler config
     SCHEDULER_API_ENABLED = True
+    # Mailbox ingestion
+    INBOX_POLL_MINUTES = int(os.environ.get('INBOX_POLL_MINUTES', '3'))
+    # Prefetch headers + BODYSTRUCTURE and download only the text parts of
+    # mobile.de mails (attachments on demand) instead of whole messages
+    IMAP_BULK_FETCH = os.environ.get('IMAP_BULK_FETCH', '1').lower() in ('1', 'true', 'yes')
+    # Optionally select mobile.de mail server-side (Gmail X-GM-RAW, else
+    # SEARCH FROM) so unrelated mail is never downloaded. Off by default:
+    # listings forwarded from another address are then never seen.
+    IMAP_SERVER_FILTER = os.environ.get('IMAP_SERVER_FILTER', '0').lower() in ('1', 'true', 'yes')
+    IMAP_GMAIL_RAW_QUERY = os.environ.get('IMAP_GMAIL_RAW_QUERY', 'from:mobile.de')
+    # Negotiate COMPRESS=DEFLATE (RFC 4978) when the server offers it
+    IMAP_COMPRESS = os.environ.get('IMAP_COMPRESS', '1').lower() in ('1', 'true', 'yes')
+    # Bounded-memory streaming: bytes of mail bodies per FETCH, and attachment
+    # size above which payloads are spooled to temp files
+    IMAP_FETCH_BUDGET_BYTES = int(os.environ.get('IMAP_FETCH_BUDGET_BYTES', str(8 * 1024 * 1024)))
+    IMAP_SPOOL_THRESHOLD_BYTES = int(os.environ.get('IMAP_SPOOL_THRESHOLD_BYTES', str(256 * 1024)))
+    # Parse full messages with compat32 and decode only text parts up front
+    IMAP_LEAN_MIME = os.environ.get('IMAP_LEAN_MIME', '1').lower() in ('1', 'true', 'yes')
+    # \Seen flags of a cycle are stored in batches of this many UIDs
+    IMAP_SEEN_FLUSH_EVERY = int(os.environ.get('IMAP_SEEN_FLUSH_EVERY', '25'))
+    # IMAP IDLE push: one long-lived connection per auto-posting mailbox,
+    # opened only by the process holding the scheduler lock (process_locks).
+    IMAP_IDLE_ENABLED = os.environ.get('IMAP_IDLE_ENABLED', '0').lower() in ('1', 'true', 'yes')
+    IMAP_IDLE_RENEW_SECONDS = int(os.environ.get('IMAP_IDLE_RENEW_SECONDS', '600'))
+    IMAP_IDLE_SYNC_MINUTES = int(os.environ.get('IMAP_IDLE_SYNC_MINUTES', '5'))
+    # With IDLE active the interval poll is only a safety net
+    IMAP_IDLE_FALLBACK_POLL_MINUTES = int(os.environ.get('IMAP_IDLE_FALLBACK_POLL_MINUTES', '15'))
+    # Email tracking links -> listing URL cache (memory LRU, optionally Postgres)
+    REDIRECT_CACHE_SIZE = int(os.environ.get('REDIRECT_CACHE_SIZE', '5000'))
+    REDIRECT_CACHE_TTL_SECONDS = int(os.environ.get('REDIRECT_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+    REDIRECT_CACHE_NEGATIVE_TTL_SECONDS = int(os.environ.get('REDIRECT_CACHE_NEGATIVE_TTL_SECONDS', '3600'))
+    REDIRECT_CACHE_PERSIST = os.environ.get('REDIRECT_CACHE_PERSIST', '0').lower() in ('1', 'true', 'yes')
+    # Listing photos: parallel downloads and an overall deadline per listing
+    PHOTO_FETCH_CONCURRENCY = int(os.environ.get('PHOTO_FETCH_CONCURRENCY', '6'))
+    PHOTO_FETCH_DEADLINE_SECONDS = float(os.environ.get('PHOTO_FETCH_DEADLINE_SECONDS', '20'))
+    # Per-host token bucket for all mobile.de traffic; the rate adapts (AIMD)
+    # to 429/403/Retry-After between these bounds
+    SCRAPE_RATE_PER_SECOND = float(os.environ.get('SCRAPE_RATE_PER_SECOND', '1'))
+    SCRAPE_BURST = float(os.environ.get('SCRAPE_BURST', '3'))
+    SCRAPE_MAX_RATE_PER_SECOND = float(os.environ.get('SCRAPE_MAX_RATE_PER_SECOND', '4'))
+    PHOTO_CDN_RATE_PER_SECOND = float(os.environ.get('PHOTO_CDN_RATE_PER_SECOND', '10'))
+    # The rates above apply to all worker processes on the host together: the
+    # bucket state lives in PROCESS_LOCK_DIR under flock. Off = per process
+    SCRAPE_RATE_SHARED = os.environ.get('SCRAPE_RATE_SHARED', '1').lower() in ('1', 'true', 'yes')
+    # Parsed listings (incl. photos) by ad id: in-process LRU, plus an optional
+    # directory shared by all workers on the host
+    LISTING_CACHE_TTL_SECONDS = int(os.environ.get('LISTING_CACHE_TTL_SECONDS', str(6 * 3600)))
+    LISTING_CACHE_SIZE = int(os.environ.get('LISTING_CACHE_SIZE', '50'))
+    LISTING_CACHE_DIR = os.environ.get('LISTING_CACHE_DIR') or None
+    # Saved-search e-mails: 'details' opens every ad page, 'search' fetches the
+    # search-results page once and opens an ad page only when its summary lacks
+    # title/price/photo or a field listed in SEARCH_DETAIL_FIELDS: 'gallery'
+    # (summary has a single preview image), 'description'. Set it empty to post
+    # summaries as they are (preview photo, no description).
+    MOBILE_INGEST_MODE = os.environ.get('MOBILE_INGEST_MODE', 'details')
+    SEARCH_DETAIL_FIELDS = [f.strip() for f in os.environ.get('SEARCH_DETAIL_FIELDS', 'gallery,description').split(',')
+                            if f.strip()]
+    # listing_source='hybrid': how long to wait for the details page before
+    # posting the e-mail card data instead
+    HYBRID_DETAIL_DEADLINE_SECONDS = float(os.environ.get('HYBRID_DETAIL_DEADLINE_SECONDS', '5'))
+    # Listing pages that failed to load (timeout, 403/429) are queued in
+    # scrape_retries and retried by a separate job with exponential backoff
+    # (base * 2^attempt, capped, with jitter) until SCRAPE_RETRY_MAX_ATTEMPTS.
+    SCRAPE_RETRY_ENABLED = os.environ.get('SCRAPE_RETRY_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    SCRAPE_RETRY_INTERVAL_MINUTES = int(os.environ.get('SCRAPE_RETRY_INTERVAL_MINUTES', '2'))
+    SCRAPE_RETRY_BASE_SECONDS = int(os.environ.get('SCRAPE_RETRY_BASE_SECONDS', '300'))
+    SCRAPE_RETRY_MAX_DELAY_SECONDS = int(os.environ.get('SCRAPE_RETRY_MAX_DELAY_SECONDS', str(6 * 3600)))
+    SCRAPE_RETRY_MAX_ATTEMPTS = int(os.environ.get('SCRAPE_RETRY_MAX_ATTEMPTS', '6'))
+    SCRAPE_RETRY_BATCH = int(os.environ.get('SCRAPE_RETRY_BATCH', '10'))
+    # Photos are downscaled and re-encoded as progressive JPEG before upload
+    # (needs Pillow); 1280 px is the largest size Telegram shows by default.
+    IMAGE_NORMALIZE_ENABLED = os.environ.get('IMAGE_NORMALIZE_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    IMAGE_MAX_SIDE = int(os.environ.get('IMAGE_MAX_SIDE', '1280'))
+    IMAGE_JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', '82'))
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '2'))
+    # Photo dedupe (needs Pillow): CDN thumbnails are dHashed first; near
+    # duplicates (Hamming distance <= threshold), the listed placeholder/logo
+    # hashes (hex) and hashes seen in PHOTO_AUTO_PLACEHOLDER_LISTINGS different
+    # ads are dropped before full images are downloaded.
+    PHOTO_DEDUPE_ENABLED = os.environ.get('PHOTO_DEDUPE_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    PHOTO_DEDUPE_THRESHOLD = int(os.environ.get('PHOTO_DEDUPE_THRESHOLD', '6'))
+    PHOTO_PLACEHOLDER_HASHES = [h.strip() for h in os.environ.get('PHOTO_PLACEHOLDER_HASHES', '').split(',') if h.strip()]
+    PHOTO_AUTO_PLACEHOLDER_LISTINGS = int(os.environ.get('PHOTO_AUTO_PLACEHOLDER_LISTINGS', '3'))
+    # Telegram Bot API endpoint (point it at a local stand-in for testing).
+    # With TELEGRAM_PHOTOS_BY_URL the album is sent as gallery URLs that
+    # Telegram downloads itself; only photos it rejects are uploaded as bytes.
+    TELEGRAM_API_BASE_URL = os.environ.get('TELEGRAM_API_BASE_URL', 'https://api.telegram.org').rstrip('/')
+    TELEGRAM_PHOTOS_BY_URL = os.environ.get('TELEGRAM_PHOTOS_BY_URL', '0').lower() in ('1', 'true', 'yes')
+    # Reuse Telegram file_ids (table telegram_file_ids) for photos a bot already sent
+    TELEGRAM_FILE_ID_CACHE = os.environ.get('TELEGRAM_FILE_ID_CACHE', '1').lower() in ('1', 'true', 'yes')
+    TELEGRAM_FILE_ID_TTL_DAYS = int(os.environ.get('TELEGRAM_FILE_ID_TTL_DAYS', '30'))
+    # Post text as the album caption (one API call instead of album + message);
+    # text over the 1024-character caption limit continues in a follow-up message
+    TELEGRAM_ALBUM_CAPTION = os.environ.get('TELEGRAM_ALBUM_CAPTION', '1').lower() in ('1', 'true', 'yes')
+    # Lock files shared by the app processes of this host (scheduler owner,
+    # per-user inbox runs)
+    PROCESS_LOCK_DIR = os.environ.get('PROCESS_LOCK_DIR', tempfile.gettempdir())
+    # Warm headless Chrome pool, used only after a 403 / bot-challenge page.
+    # Every gunicorn worker starts its own pool, so keep the size small.
+    BROWSER_FALLBACK_ENABLED = os.environ.get('BROWSER_FALLBACK_ENABLED', '0').lower() in ('1', 'true', 'yes')
+    BROWSER_POOL_SIZE = int(os.environ.get('BROWSER_POOL_SIZE', '1'))
+    BROWSER_MAX_PAGES = int(os.environ.get('BROWSER_MAX_PAGES', '50'))
+    BROWSER_PAGE_TIMEOUT_SECONDS = float(os.environ.get('BROWSER_PAGE_TIMEOUT_SECONDS', '30'))
+    # Gmail REST API backend (users choosing 'gmail_api' paste an OAuth
+    # refresh token issued for this client with the gmail.modify scope)
+    GMAIL_OAUTH_CLIENT_ID = os.environ.get('GMAIL_OAUTH_CLIENT_ID')
+    GMAIL_OAUTH_CLIENT_SECRET = os.environ.get('GMAIL_OAUTH_CLIENT_SECRET')
+    GMAIL_API_BASE_URL = os.environ.get('GMAIL_API_BASE_URL', 'https://gmail.googleapis.com')
+    GMAIL_OAUTH_TOKEN_URL = os.environ.get('GMAIL_OAUTH_TOKEN_URL', 'https://oauth2.googleapis.com/token')
     # Add other configs as needed
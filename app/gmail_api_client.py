@@ -0,0 +1,342 @@
+"""Gmail REST API mail backend (OAuth refresh token instead of an app password).
+
+Incremental sync follows ``users.history.list`` from the last stored
+``historyId`` rather than scanning the INBOX. With the server-side filter
+on, candidates are filtered on their From/Subject headers fetched with
+``format=metadata`` in one batch request, and only mobile.de mail is
+downloaded in full.
+"""
+import base64
+import json
+import logging
+import re
+import uuid
+from email import message_from_bytes
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+from .gmail_client import DEFAULT_GMAIL_RAW_QUERY, EmailAttachment, EmailMessageData, is_mobilede_sender
+from .imap_parsing import decode_text
+from .mail_backends import MailBackend
+
+logger = logging.getLogger(__name__)
+
+GMAIL_API_BASE_URL = 'https://gmail.googleapis.com'
+GOOGLE_OAUTH_TOKEN_URL = 'https://oauth2.googleapis.com/token'
+
+# Gmail accepts up to 100 calls per batch but throttles large ones
+_BATCH_SIZE = 50
+_CHARSET_RE = re.compile(r'charset="?([\w.:-]+)', re.IGNORECASE)
+
+
+class GmailApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f'Gmail API error {status}: {message}')
+        self.status = status
+
+
+def _b64url(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _headers(part: dict) -> Dict[str, str]:
+    return {h.get('name', '').lower(): h.get('value', '') for h in part.get('headers') or []}
+
+
+def _leaves(part: dict) -> List[dict]:
+    if part.get('parts'):
+        return [leaf for child in part['parts'] for leaf in _leaves(child)]
+    return [part]
+
+
+class GmailApiSession(MailBackend):
+    """Gmail REST API counterpart of ``ImapSession``.
+
+    ``gmail_history_id`` on the user settings plays the role of the IMAP UID
+    mark: each handled message moves it to the history record that added the
+    message, and a finished cycle moves it to the mailbox's latest history
+    id. On first use, or when Gmail has expired the stored id (HTTP 404),
+    unread inbox mail is resynced and the current history id becomes the new
+    baseline. A message that cannot be downloaded keeps the mark below it (or
+    forces another resync), so the next cycle tries it again.
+
+    ``mark_seen`` queues message ids; ``flush`` removes the UNREAD label from
+    all of them with one ``batchModify`` call. Attachments are downloaded
+    only when their content is accessed.
+    """
+
+    def __init__(self, user_settings, client_id: Optional[str], client_secret: Optional[str],
+                 server_filter: bool = False, gmail_raw_query: Optional[str] = DEFAULT_GMAIL_RAW_QUERY,
+                 flush_every: int = 25, spool_threshold: Optional[int] = None,
+                 base_url: Optional[str] = None, token_url: Optional[str] = None, timeout: float = 30):
+        super().__init__(user_settings)
+        self.refresh_token = getattr(user_settings, 'gmail_refresh_token_decrypted', None)
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.server_filter = server_filter
+        self.gmail_raw_query = gmail_raw_query or DEFAULT_GMAIL_RAW_QUERY
+        self.flush_every = flush_every
+        self.spool_threshold = spool_threshold
+        self.base_url = (base_url or GMAIL_API_BASE_URL).rstrip('/')
+        self.token_url = token_url or GOOGLE_OAUTH_TOKEN_URL
+        self.timeout = timeout
+        self.http = requests.Session()
+        self._access_token = None
+        # message id -> id of the history record that added it
+        self._history_ids = {}
+        self._latest_history_id = None
+        # history id of the oldest message this cycle could not download;
+        # the mark stays below it so the next cycle picks it up again
+        self._missing_history_id = None
+        self._resync_again = False
+        self._sync_complete = False
+        self._pending_seen = []
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.refresh_token and self.client_id and self.client_secret)
+
+    def _token(self) -> str:
+        if self._access_token is None:
+            resp = self.http.post(self.token_url, data={
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+                'refresh_token': self.refresh_token,
+                'grant_type': 'refresh_token',
+            }, timeout=self.timeout)
+            if resp.status_code != 200:
+                raise GmailApiError(resp.status_code, resp.text[:200])
+            self._access_token = resp.json()['access_token']
+        return self._access_token
+
+    def _request(self, method: str, path: str, retry: bool = True, **kwargs):
+        headers = kwargs.pop('headers', {})
+        headers['Authorization'] = f'Bearer {self._token()}'
+        resp = self.http.request(method, self.base_url + path, headers=headers, timeout=self.timeout, **kwargs)
+        if resp.status_code == 401 and retry:
+            # access tokens live for an hour; refresh once and retry
+            self._access_token = None
+            return self._request(method, path, retry=False, headers=headers, **kwargs)
+        if resp.status_code >= 400:
+            raise GmailApiError(resp.status_code, resp.text[:200])
+        return resp
+
+    def _get_json(self, path: str, **params) -> dict:
+        return self._request('GET', path, params=params).json()
+
+    def _history_delta(self, start_id: int) -> Tuple[List[Tuple[str, int]], int]:
+        """Messages added to INBOX after ``start_id`` as (id, history id), oldest first."""
+        entries, seen = [], set()
+        params = {'startHistoryId': start_id, 'historyTypes': 'messageAdded', 'labelId': 'INBOX'}
+        latest = start_id
+        while True:
+            data = self._get_json('/gmail/v1/users/me/history', **params)
+            for record in data.get('history') or []:
+                for added in record.get('messagesAdded') or []:
+                    message_id = added.get('message', {}).get('id')
+                    if message_id and message_id not in seen:
+                        seen.add(message_id)
+                        entries.append((message_id, int(record['id'])))
+            latest = int(data.get('historyId') or latest)
+            if not data.get('nextPageToken'):
+                return entries, latest
+            params['pageToken'] = data['nextPageToken']
+
+    def _list_ids(self, query: str) -> List[str]:
+        """Ids of messages matching a Gmail search query, oldest first."""
+        ids = []
+        params = {'q': query, 'maxResults': 500}
+        while True:
+            data = self._get_json('/gmail/v1/users/me/messages', **params)
+            ids.extend(m['id'] for m in data.get('messages') or [])
+            if not data.get('nextPageToken'):
+                break
+            params['pageToken'] = data['nextPageToken']
+        ids.reverse()
+        return ids
+
+    def _batch_get(self, ids: List[str], query: str) -> Dict[str, dict]:
+        """``messages.get`` for many ids through the batch endpoint."""
+        results = {}
+        for start in range(0, len(ids), _BATCH_SIZE):
+            chunk = ids[start:start + _BATCH_SIZE]
+            boundary = f'batch_{uuid.uuid4().hex}'
+            body = ''.join(
+                f'--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <item{i}>\r\n\r\n'
+                f'GET /gmail/v1/users/me/messages/{message_id}?{query}\r\n\r\n'
+                for i, message_id in enumerate(chunk)
+            ) + f'--{boundary}--\r\n'
+            resp = self._request('POST', '/batch/gmail/v1', data=body.encode(),
+                                 headers={'Content-Type': f'multipart/mixed; boundary={boundary}'})
+            for index, status, payload in self._parse_batch(resp):
+                if status == 200 and 0 <= index < len(chunk):
+                    results[chunk[index]] = payload
+                elif status != 200:
+                    logger.warning('Gmail batch item failed with HTTP %s', status)
+        return results
+
+    @staticmethod
+    def _parse_batch(resp) -> Iterator[Tuple[int, int, dict]]:
+        envelope = b'Content-Type: ' + resp.headers.get('Content-Type', '').encode() + b'\r\n\r\n' + resp.content
+        for part in message_from_bytes(envelope).get_payload() or []:
+            match = re.search(r'item(\d+)', part.get('Content-ID', ''))
+            inner = part.get_payload(decode=True) or b''
+            status_line, _, rest = inner.partition(b'\n')
+            try:
+                status = int(status_line.split()[1])
+            except (IndexError, ValueError):
+                continue
+            body = re.split(rb'\r?\n\r?\n', rest, maxsplit=1)[-1]
+            try:
+                payload = json.loads(body.decode('utf-8')) if status == 200 else {}
+            except ValueError:
+                continue
+            yield (int(match.group(1)) if match else -1), status, payload
+
+    def _load_attachment(self, message_id: str, attachment_id: str) -> bytes:
+        data = self._get_json(f'/gmail/v1/users/me/messages/{message_id}/attachments/{attachment_id}')
+        return _b64url(data.get('data', ''))
+
+    def _to_message(self, data: dict) -> EmailMessageData:
+        message_id = data['id']
+        payload = data.get('payload') or {}
+        top = _headers(payload)
+        text_body = html_body = None
+        attachments = []
+        for leaf in _leaves(payload):
+            mime = (leaf.get('mimeType') or '').lower()
+            body = leaf.get('body') or {}
+            filename = leaf.get('filename') or None
+            attachment_id = body.get('attachmentId')
+            if not filename and mime in ('text/plain', 'text/html'):
+                raw = _b64url(body['data']) if body.get('data') else (
+                    self._load_attachment(message_id, attachment_id) if attachment_id else b'')
+                match = _CHARSET_RE.search(_headers(leaf).get('content-type', ''))
+                text = decode_text(raw, match.group(1) if match else None)
+                if mime == 'text/plain' and text_body is None:
+                    text_body = text
+                elif mime == 'text/html' and html_body is None:
+                    html_body = text
+            elif filename:
+                if body.get('data'):
+                    attachments.append(EmailAttachment(filename, mime, content=_b64url(body['data']),
+                                                       spool_threshold=self.spool_threshold))
+                elif attachment_id:
+                    attachments.append(EmailAttachment(
+                        filename, mime, loader=partial(self._load_attachment, message_id, attachment_id),
+                        size=body.get('size', 0), spool_threshold=self.spool_threshold))
+        return EmailMessageData(message_id, top.get('subject'), top.get('from'), text_body, html_body, attachments)
+
+    def _iter_full(self, ids: List[str]) -> Iterator[EmailMessageData]:
+        for start in range(0, len(ids), _BATCH_SIZE):
+            chunk = ids[start:start + _BATCH_SIZE]
+            full = self._batch_get(chunk, 'format=full')
+            missing = [message_id for message_id in chunk if message_id not in full]
+            if missing:
+                # failed batch items are mostly rate limits: one more try
+                full.update(self._batch_get(missing, 'format=full'))
+            for message_id in chunk:
+                if message_id in full:
+                    yield self._to_message(full[message_id])
+                else:
+                    self._note_missing(message_id)
+
+    def _note_missing(self, message_id: str):
+        logger.warning('Gmail message %s could not be downloaded, keeping it for the next cycle', message_id)
+        history_id = self._history_ids.get(message_id)
+        if history_id is None:
+            # resync entries have no history record to stay below
+            self._resync_again = True
+        elif self._missing_history_id is None or history_id < self._missing_history_id:
+            self._missing_history_id = history_id
+
+    def iter_new_messages(self) -> Iterator[EmailMessageData]:
+        if not self.configured:
+            return
+        settings = self.user_settings
+        self._sync_complete = False
+        self._missing_history_id = None
+        self._resync_again = False
+        entries = None
+        if settings.gmail_history_id:
+            try:
+                entries, latest = self._history_delta(settings.gmail_history_id)
+            except GmailApiError as exc:
+                if exc.status != 404:
+                    raise
+                logger.info('Gmail history id %s expired, resyncing', settings.gmail_history_id)
+        if entries is None:
+            # take the baseline before listing so nothing falls in between
+            latest = int(self._get_json('/gmail/v1/users/me/profile')['historyId'])
+            query = 'in:inbox is:unread'
+            if self.server_filter:
+                query += ' ' + self.gmail_raw_query
+            entries = [(message_id, None) for message_id in self._list_ids(query)]
+            settings.gmail_history_id = latest
+        self._latest_history_id = latest
+        self._history_ids = {message_id: history_id for message_id, history_id in entries if history_id}
+        wanted = [message_id for message_id, _ in entries]
+        if self.server_filter:
+            metadata = self._batch_get(wanted, 'format=metadata&metadataHeaders=From&metadataHeaders=Subject')
+            # no metadata (failed batch item): let the full download decide
+            candidates, wanted = wanted, []
+            for message_id in candidates:
+                headers = _headers((metadata.get(message_id) or {}).get('payload') or {})
+                if message_id not in metadata or is_mobilede_sender(headers.get('from', ''), headers.get('subject', '')):
+                    wanted.append(message_id)
+        yield from self._iter_full(wanted)
+        self._sync_complete = True
+
+    def fetch_recent_mobilede_messages(self) -> List[EmailMessageData]:
+        if not self.configured:
+            return []
+        return list(self._iter_full(self._list_ids(self.gmail_raw_query + ' newer_than:2d')))
+
+    def message_done(self, msg) -> bool:
+        history_id = self._history_ids.get(msg.uid)
+        settings = self.user_settings
+        if not history_id or (settings.gmail_history_id and history_id <= settings.gmail_history_id):
+            return False
+        if self._missing_history_id is not None and history_id >= self._missing_history_id:
+            return False
+        settings.gmail_history_id = history_id
+        return True
+
+    def sync_done(self) -> bool:
+        settings = self.user_settings
+        if not self._sync_complete:
+            return False
+        if self._resync_again:
+            # resync from unread mail next cycle; messages handled now are read by then
+            settings.gmail_history_id = None
+            return True
+        if self._missing_history_id is not None:
+            return False
+        if not self._latest_history_id or (settings.gmail_history_id and self._latest_history_id <= settings.gmail_history_id):
+            return False
+        settings.gmail_history_id = self._latest_history_id
+        return True
+
+    def mark_seen(self, uid):
+        self._pending_seen.append(str(uid))
+        if len(self._pending_seen) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Remove UNREAD from all queued messages with one call."""
+        if not self._pending_seen or not self.configured:
+            return
+        ids, self._pending_seen = sorted(set(self._pending_seen)), []
+        try:
+            self._request('POST', '/gmail/v1/users/me/messages/batchModify',
+                          json={'ids': ids, 'removeLabelIds': ['UNREAD']})
+        except Exception:
+            pass
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.http.close()
@@ -1,9 +1,74 @@
 import imaplib
 import email
+import re
+import socket
+import tempfile
+import zlib
 from email import policy
-from typing import List
+from email.header import decode_header, make_header
+from functools import partial
+from typing import Callable, Iterator, List, Optional
 from datetime import datetime, timedelta
 
+from .imap_parsing import decode_part, decode_text, parse_fetch_response, walk_bodystructure
+from .mail_backends import MailBackend
+
+IMAP_HOST = 'imap.gmail.com'
+IMAP_PORT = 993
+
+_UNTAGGED_NEW_MAIL_RE = re.compile(rb'^\* \d+ (EXISTS|RECENT)\b', re.IGNORECASE)
+
+# RFC 4978; imaplib refuses commands it does not know
+imaplib.Commands.setdefault('COMPRESS', ('AUTH', 'SELECTED'))
+
+
+class EmailAttachment:
+    """Attachment of a fetched message.
+
+    ``content`` may be downloaded lazily through ``loader``. Payloads larger
+    than ``spool_threshold`` bytes are kept in a temporary file instead of
+    memory and read back on each access.
+    """
+
+    def __init__(self, filename: Optional[str], content_type: str = 'application/octet-stream',
+                 content: Optional[bytes] = None, loader: Optional[Callable[[], bytes]] = None, size: int = 0,
+                 spool_threshold: Optional[int] = None):
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size or (len(content) if content else 0)
+        self.spool_threshold = spool_threshold
+        self._content = None
+        self._file = None
+        self._loader = loader
+        if content is not None:
+            self._store(content)
+
+    def _store(self, data: bytes):
+        self.size = len(data)
+        if self.spool_threshold is not None and len(data) > self.spool_threshold:
+            self._file = tempfile.TemporaryFile()
+            self._file.write(data)
+        else:
+            self._content = data
+
+    @property
+    def content(self) -> Optional[bytes]:
+        if self._file is not None:
+            self._file.seek(0)
+            return self._file.read()
+        if self._content is None and self._loader is not None:
+            data = self._loader()
+            self._loader = None
+            self._store(data)
+            return data
+        return self._content
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._content = None
+
 
 class EmailMessageData:
     def __init__(self, uid, subject, from_addr, text_body, html_body, attachments):
@@ -14,155 +79,678 @@ class EmailMessageData:
         self.html_body = html_body
         self.attachments = attachments
 
+    def close(self):
+        """Release attachment payloads (temp files included)."""
+        for attachment in self.attachments or []:
+            attachment.close()
+
+
+class GmailIMAP(imaplib.IMAP4_SSL):
+    """IMAP4_SSL with a recv()-based read buffer.
+
+    The stock implementation reads through ``sock.makefile()``, which becomes
+    unusable after a socket timeout. Reading straight from the socket lets
+    ``idle()`` wait with a timeout and keep using the connection afterwards,
+    and gives one place to plug in COMPRESS=DEFLATE (``enable_compression``).
+    """
+
+    def open(self, host='', port=IMAP_PORT, timeout=None):
+        self._rbuf = bytearray()
+        self._compressor = None
+        self._decompressor = None
+        super().open(host, port, timeout)
 
-def _connect_imap(address: str, password: str):
-    mail = imaplib.IMAP4_SSL('imap.gmail.com', 993)
+    def _fill_buffer(self):
+        data = self.sock.recv(65536)
+        if not data:
+            raise self.abort('socket error: EOF')
+        if self._decompressor is not None:
+            data = self._decompressor.decompress(data)
+        self._rbuf += data
+
+    def send(self, data):
+        if self._compressor is not None:
+            data = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        super().send(data)
+
+    def enable_compression(self) -> bool:
+        """Negotiate RFC 4978 COMPRESS=DEFLATE if the server offers it.
+
+        Gmail only advertises the extension after login, so capabilities are
+        refreshed first. Returns True when the stream is now compressed.
+        """
+        if self._compressor is not None:
+            return True
+        typ, data = self.capability()
+        if typ == 'OK' and data and data[-1]:
+            self.capabilities = tuple(data[-1].decode('ascii', 'ignore').upper().split())
+        if 'COMPRESS=DEFLATE' not in self.capabilities:
+            return False
+        typ, data = self._simple_command('COMPRESS', 'DEFLATE')
+        if typ != 'OK':
+            return False
+        self._compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        self._decompressor = zlib.decompressobj(-15)
+        # anything read past the tagged OK is already compressed
+        pending, self._rbuf = bytes(self._rbuf), bytearray()
+        if pending:
+            self._rbuf += self._decompressor.decompress(pending)
+        return True
+
+    def read(self, size):
+        while len(self._rbuf) < size:
+            self._fill_buffer()
+        data = bytes(self._rbuf[:size])
+        del self._rbuf[:size]
+        return data
+
+    def readline(self):
+        while True:
+            idx = self._rbuf.find(b'\n')
+            if idx >= 0:
+                line = bytes(self._rbuf[:idx + 1])
+                del self._rbuf[:idx + 1]
+                return line
+            if len(self._rbuf) > imaplib._MAXLINE:
+                raise self.error('got more than %d bytes' % imaplib._MAXLINE)
+            self._fill_buffer()
+
+    def idle(self, timeout: float) -> bool:
+        """Run one RFC 2177 IDLE round.
+
+        Blocks for at most ``timeout`` seconds and returns True as soon as the
+        server reports new mail (untagged EXISTS/RECENT), False on timeout.
+        """
+        tag = self._new_tag()
+        self.tagged_commands.pop(tag, None)
+        self.send(tag + b' IDLE\r\n')
+        line = self.readline()
+        if not line.startswith(b'+'):
+            raise self.error('IDLE rejected: %r' % line)
+
+        has_new_mail = False
+        previous_timeout = self.sock.gettimeout()
+        self.sock.settimeout(timeout)
+        try:
+            while True:
+                line = self.readline()
+                if _UNTAGGED_NEW_MAIL_RE.match(line):
+                    has_new_mail = True
+                    break
+        except socket.timeout:
+            pass
+        finally:
+            self.sock.settimeout(previous_timeout)
+
+        self.send(b'DONE\r\n')
+        while True:
+            line = self.readline()
+            if line.startswith(tag):
+                if not line[len(tag):].strip().upper().startswith(b'OK'):
+                    raise self.error('IDLE failed: %r' % line)
+                break
+            if _UNTAGGED_NEW_MAIL_RE.match(line):
+                has_new_mail = True
+        return has_new_mail
+
+
+def _connect_imap(address: str, password: str, timeout: float = None, compress: bool = False):
+    mail = GmailIMAP(IMAP_HOST, IMAP_PORT, timeout=timeout)
     mail.login(address, password)
+    if compress:
+        try:
+            mail.enable_compression()
+        except mail.error:
+            pass
     return mail
 
 
-def fetch_new_messages(user_settings) -> List[EmailMessageData]:
-    address = user_settings.gmail_address
-    password = user_settings.gmail_app_password_decrypted if hasattr(user_settings, 'gmail_app_password_decrypted') else None
-    if not address or not password:
-        return []
+_UID_RE = re.compile(rb'\bUID (\d+)')
 
-    mail = _connect_imap(address, password)
-    mail.select('INBOX')
-    typ, data = mail.search(None, 'UNSEEN')
-    messages = []
-    for num in data[0].split():
-        typ, msg_data = mail.fetch(num, '(RFC822)')
-        raw = msg_data[0][1]
-        msg = email.message_from_bytes(raw, policy=policy.default)
-        from_header = str(msg.get('from', ''))
-        subject = str(msg.get('subject', ''))
-        text_body = ''
-        html_body = ''
-        attachments = []
-        for part in msg.walk():
-            ctype = part.get_content_type()
-            if part.is_multipart():
-                continue
-            content_disposition = part.get_content_disposition()
-            payload = part.get_payload(decode=True)
-            if content_disposition == 'attachment' or (part.get_filename()):
-                attachments.append({'filename': part.get_filename(), 'content': payload})
-            elif ctype == 'text/plain':
+
+def _response_int(mail, code: str):
+    """Read a numeric response code (e.g. UIDVALIDITY, UIDNEXT) left by SELECT."""
+    typ, data = mail.response(code)
+    try:
+        return int(data[-1])
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _fetched_uids(data) -> List[int]:
+    """Sorted UIDs from a ``UID FETCH ... (UID)`` response."""
+    uids = set()
+    for item in data or []:
+        line = item[0] if isinstance(item, tuple) else item
+        m = _UID_RE.search(line) if line else None
+        if m:
+            uids.add(int(m.group(1)))
+    return sorted(uids)
+
+
+def _uid_set(uids) -> str:
+    """Compact IMAP sequence set for sorted UIDs, e.g. [3, 4, 5, 9] -> '3:5,9'."""
+    ranges = []
+    for uid in uids:
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ','.join(str(a) if a == b else f'{a}:{b}' for a, b in ranges)
+
+
+def _iter_fetch_literals(data):
+    """Yield (uid, literal) pairs from a UID FETCH response."""
+    for item in data or []:
+        if not isinstance(item, tuple):
+            continue
+        m = _UID_RE.search(item[0])
+        if m:
+            yield int(m.group(1)), item[1]
+
+
+def _parse_message(uid, raw: bytes, spool_threshold: Optional[int] = None, lean: bool = False) -> EmailMessageData:
+    if lean:
+        return _parse_message_lean(uid, raw, spool_threshold)
+    msg = email.message_from_bytes(raw, policy=policy.default)
+    from_header = str(msg.get('from', ''))
+    subject = str(msg.get('subject', ''))
+    text_body = ''
+    html_body = ''
+    attachments = []
+    for part in msg.walk():
+        ctype = part.get_content_type()
+        if part.is_multipart():
+            continue
+        content_disposition = part.get_content_disposition()
+        payload = part.get_payload(decode=True)
+        if content_disposition == 'attachment' or (part.get_filename()):
+            attachments.append(EmailAttachment(part.get_filename(), ctype, content=payload, spool_threshold=spool_threshold))
+        elif ctype == 'text/plain':
+            if payload:
                 text_body += payload.decode(errors='ignore')
-            elif ctype == 'text/html':
+        elif ctype == 'text/html':
+            if payload:
                 html_body += payload.decode(errors='ignore')
+    return EmailMessageData(uid=str(uid), subject=subject, from_addr=from_header, text_body=text_body, html_body=html_body, attachments=attachments)
 
-        messages.append(EmailMessageData(uid=num.decode(), subject=subject, from_addr=from_header, text_body=text_body, html_body=html_body, attachments=attachments))
-
-    mail.close()
-    mail.logout()
-    return messages
 
+def _decode_header_value(value) -> str:
+    if not value:
+        return ''
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return str(value)
 
 
-def fetch_recent_mobilede_message(user_settings) -> List[EmailMessageData]:
-    """Fetch recent messages (last 2 days) that look like they are from mobile.de.
+def _parse_message_lean(uid, raw: bytes, spool_threshold: Optional[int] = None) -> EmailMessageData:
+    """Cheaper variant of ``_parse_message``.
 
-    Used only for manual testing from the settings UI. It considers both
-    read and unread messages and filters by:
-      - From header containing 'mobile.de', or
-      - message body containing 'mobile.de'.
+    Uses the compat32 policy (no header objects are built), decodes only the
+    text/plain and text/html parts and leaves attachment payloads encoded
+    until their ``content`` is first read.
     """
-    print("DEBUG: Starting fetch_recent_mobilede_message")
-    address = user_settings.gmail_address
-    password = user_settings.gmail_app_password_decrypted if hasattr(user_settings, 'gmail_app_password_decrypted') else None
-    if not address or not password:
-        print("DEBUG: No address or password")
-        return []
+    msg = email.message_from_bytes(raw, policy=policy.compat32)
+    text_body = ''
+    html_body = ''
+    attachments = []
+    for part in msg.walk():
+        if part.is_multipart():
+            continue
+        ctype = part.get_content_type()
+        filename = part.get_filename()
+        if filename or (part.get('content-disposition') or '').strip().lower().startswith('attachment'):
+            encoded = part.get_payload()
+            attachments.append(EmailAttachment(
+                _decode_header_value(filename) if filename else filename, ctype,
+                loader=partial(part.get_payload, decode=True),
+                size=len(encoded) if isinstance(encoded, str) else 0,
+                spool_threshold=spool_threshold,
+            ))
+        elif ctype in ('text/plain', 'text/html'):
+            payload = part.get_payload(decode=True)
+            if not payload:
+                continue
+            text = decode_text(payload, part.get_content_charset())
+            if ctype == 'text/plain':
+                text_body += text
+            else:
+                html_body += text
+    return EmailMessageData(uid=str(uid), subject=_decode_header_value(msg.get('subject')),
+                            from_addr=_decode_header_value(msg.get('from')),
+                            text_body=text_body, html_body=html_body, attachments=attachments)
 
-    print(f"DEBUG: Connecting to IMAP for {address}")
-    mail = _connect_imap(address, password)
-    mail.select('INBOX')
-    print("DEBUG: Selected INBOX")
-
-    # Compute date 2 days ago for IMAP SINCE filter (format: 19-Nov-2025)
-    since_date = (datetime.utcnow() - timedelta(days=2)).strftime('%d-%b-%Y')
-    print(f"DEBUG: SINCE date: {since_date}")
-
-    # Search messages since that date (both read and unread)
-    typ, data = mail.search(None, '(SINCE "' + since_date + '")')
-    print(f"DEBUG: Search result type: {typ}, data: {data}")
-    if typ != 'OK':
-        print("DEBUG: Search failed")
-        mail.close()
-        mail.logout()
-        return []
 
-    all_uids = data[0].split()
-    print(f"DEBUG: Found {len(all_uids)} UIDs")
-    if not all_uids:
-        mail.close()
-        mail.logout()
-        return []
+# Gmail search syntax used for server-side filtering via X-GM-RAW; no date
+# limit, the UID range of the sync already bounds the search
+DEFAULT_GMAIL_RAW_QUERY = 'from:mobile.de'
+
+# One round trip for the whole UID set: sender/subject plus the MIME tree,
+# without downloading any body.
+_PREFETCH_ITEMS = '(UID BODY.PEEK[HEADER.FIELDS (FROM SUBJECT)] BODYSTRUCTURE)'
+
+
+def is_mobilede_sender(from_addr: str, subject: str = '') -> bool:
+    return 'mobile.de' in (from_addr or '').lower() or 'mobile.de' in (subject or '').lower()
+
 
-    # Check all messages from the last 2 days, not just the last 20
-    sample_uids = all_uids  # Changed to check all, not just [-20:]
-    messages: List[EmailMessageData] = []
+def _fetch_part(mail, uid: int, part) -> bytes:
+    typ, data = mail.uid('FETCH', str(uid), f'(UID BODY.PEEK[{part.number}])')
+    for fetched in parse_fetch_response(data):
+        body = fetched.get(f'BODY[{part.number}]'.encode())
+        if body is not None:
+            return decode_part(bytes(body), part.encoding)
+    return b''
 
-    print(f"DEBUG: Searching for mobile.de messages since {since_date}, found {len(all_uids)} total messages, checking all {len(sample_uids)}")
 
-    for num in sample_uids:
+# header/BODYSTRUCTURE prefetch is done in chunks of this many UIDs
+_PREFETCH_CHUNK = 200
+
+
+def _prefetch_structure(mail, uids: List[int]) -> dict:
+    """{uid: (from, subject, [BodyPart])} for a UID chunk, in one FETCH."""
+    typ, data = mail.uid('FETCH', _uid_set(uids), _PREFETCH_ITEMS)
+    wanted = set(uids)
+    headers = {}
+    for fetched in parse_fetch_response(data):
         try:
-            typ, msg_data = mail.fetch(num, '(RFC822)')
-            if typ != 'OK':
-                print(f"DEBUG: Fetch failed for UID {num}")
+            uid = int(fetched.get(b'UID'))
+        except (TypeError, ValueError):
+            continue
+        if uid not in wanted:
+            continue
+        header_bytes = next((bytes(v) for k, v in fetched.items() if k.startswith(b'BODY[HEADER')), b'')
+        hdr = email.message_from_bytes(header_bytes, policy=policy.default)
+        headers[uid] = (str(hdr.get('from', '')), str(hdr.get('subject', '')), walk_bodystructure(fetched.get(b'BODYSTRUCTURE')))
+    return headers
+
+
+def _fill_text_parts(mail, batch) -> Iterator[EmailMessageData]:
+    """Download the text parts of a batch, one FETCH per MIME layout."""
+    layouts = {}
+    for msg, text_parts in batch:
+        if text_parts:
+            layouts.setdefault(tuple(p.number for p in text_parts), []).append((msg, text_parts))
+
+    for numbers, group in layouts.items():
+        items = ' '.join(f'BODY.PEEK[{n}]' for n in numbers)
+        typ, data = mail.uid('FETCH', _uid_set(sorted(int(msg.uid) for msg, _ in group)), f'(UID {items})')
+        bodies = {}
+        for fetched in parse_fetch_response(data):
+            try:
+                bodies[int(fetched.get(b'UID'))] = fetched
+            except (TypeError, ValueError):
                 continue
-            raw = msg_data[0][1]
-            msg = email.message_from_bytes(raw, policy=policy.default)
-            from_header = str(msg.get('from', '')).lower()
-            subject = str(msg.get('subject', ''))
-            print(f"DEBUG: Checking message UID {num}, From: {from_header}, Subject: {subject}")
-            text_body = ''
-            html_body = ''
-            attachments = []
-
-            for part in msg.walk():
-                ctype = part.get_content_type()
-                if part.is_multipart():
+        for msg, text_parts in group:
+            fetched = bodies.get(int(msg.uid), {})
+            for p in text_parts:
+                body = fetched.get(f'BODY[{p.number}]'.encode())
+                if body is None:
                     continue
-                content_disposition = part.get_content_disposition()
-                payload = part.get_payload(decode=True)
-                if content_disposition == 'attachment' or (part.get_filename()):
-                    attachments.append({'filename': part.get_filename(), 'content': payload})
-                elif ctype == 'text/plain':
-                    if payload:
-                        text_body += payload.decode(errors='ignore')
-                elif ctype == 'text/html':
-                    if payload:
-                        html_body += payload.decode(errors='ignore')
-
-            body_combined = (text_body or '') + '\n' + (html_body or '')
-            if 'mobile.de' in from_header or 'mobile.de' in body_combined.lower():
-                print(f"DEBUG: Found mobile.de message: UID={num.decode()}, From={from_header}, Subject={subject}")
-                messages.append(EmailMessageData(uid=num.decode(), subject=subject, from_addr=from_header, text_body=text_body, html_body=html_body, attachments=attachments))
+                text = decode_text(decode_part(bytes(body), p.encoding), p.charset)
+                if p.content_type == 'text/plain':
+                    msg.text_body += text
+                else:
+                    msg.html_body += text
+        del data, bodies
+
+    for msg, _ in batch:
+        yield msg
+
+
+def _iter_bulk_fetch(mail, uids: List[int], load_part: Callable[[int, object], bytes], match=is_mobilede_sender,
+                     budget: Optional[int] = None, spool_threshold: Optional[int] = None) -> Iterator[EmailMessageData]:
+    """Fetch messages in as few round trips as possible, yielding them in UID order.
+
+    1. one FETCH for headers + BODYSTRUCTURE per chunk of UIDs;
+    2. one FETCH per distinct MIME layout for the text parts of the messages
+       ``match`` accepts (saved-search mails all share the same layout),
+       batched so that a batch holds at most ``budget`` bytes of bodies
+       (by BODYSTRUCTURE sizes; a single larger message forms its own batch);
+    3. attachments are only listed; their bodies download on first access
+       through ``load_part(uid, part)``.
+
+    Messages ``match`` rejects are yielded with headers only; with
+    ``match=None`` the text parts of every message are downloaded.
+    """
+    for start in range(0, len(uids), _PREFETCH_CHUNK):
+        headers = _prefetch_structure(mail, uids[start:start + _PREFETCH_CHUNK])
+        batch, batch_bytes = [], 0
+        for uid in sorted(headers):
+            from_addr, subject, parts = headers.pop(uid)
+            msg = EmailMessageData(uid=str(uid), subject=subject, from_addr=from_addr, text_body='', html_body='', attachments=[])
+            text_parts = ()
+            if match is None or match(from_addr, subject):
+                text_parts = tuple(p for p in parts if not p.is_attachment and p.content_type in ('text/plain', 'text/html'))
+                for p in parts:
+                    if p.is_attachment:
+                        msg.attachments.append(EmailAttachment(p.filename, p.content_type, size=p.size, loader=partial(load_part, uid, p), spool_threshold=spool_threshold))
+            cost = sum(p.size for p in text_parts)
+            if batch and budget and batch_bytes + cost > budget:
+                yield from _fill_text_parts(mail, batch)
+                batch, batch_bytes = [], 0
+            batch.append((msg, text_parts))
+            batch_bytes += cost
+        if batch:
+            yield from _fill_text_parts(mail, batch)
+
+
+def _iter_full_fetch(mail, uids: List[int], budget: Optional[int] = None,
+                     spool_threshold: Optional[int] = None, lean: bool = False) -> Iterator[EmailMessageData]:
+    """Download whole messages in UID order, at most ``budget`` bytes per FETCH."""
+    if not uids:
+        return
+    batches = [uids]
+    if budget:
+        typ, data = mail.uid('FETCH', _uid_set(uids), '(UID RFC822.SIZE)')
+        sizes = {}
+        for fetched in parse_fetch_response(data):
+            try:
+                sizes[int(fetched.get(b'UID'))] = int(fetched.get(b'RFC822.SIZE') or 0)
+            except (TypeError, ValueError):
+                continue
+        batches, batch, batch_bytes = [], [], 0
+        for uid in uids:
+            size = sizes.get(uid, 0)
+            if batch and batch_bytes + size > budget:
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+            batch.append(uid)
+            batch_bytes += size
+        if batch:
+            batches.append(batch)
+
+    for batch in batches:
+        typ, data = mail.uid('FETCH', _uid_set(batch), '(UID BODY.PEEK[])')
+        wanted = set(batch)
+        raws = sorted((item for item in _iter_fetch_literals(data) if item[0] in wanted), key=lambda item: item[0])
+        del data
+        while raws:
+            uid, raw = raws.pop(0)
+            yield _parse_message(uid, raw, spool_threshold=spool_threshold, lean=lean)
+
+
+def _search_uids(mail, criteria: str) -> List[int]:
+    typ, data = mail.uid('SEARCH', None, criteria)
+    if typ != 'OK' or not data or not data[0]:
+        return []
+    return sorted(int(x) for x in data[0].split())
+
+
+def _pending_uids(mail, user_settings, criteria: Optional[str] = None):
+    """Return ``(uids, ceiling)`` for this sync and update the sync state.
+
+    ``uids`` are the UIDs to process, ascending. Normal case: everything
+    above ``imap_last_uid``. On the first sync, or when UIDVALIDITY changed
+    (mailbox rebuilt, stored UIDs meaningless), the mark is reset to just
+    below the oldest unread message so that exactly the unread set is
+    processed once, as the old UNSEEN poll did.
+
+    ``ceiling`` is the highest UID this sync covered: once all returned
+    messages are handled the mark may move up to it, skipping mail that was
+    never downloaded (read mail after a reset, or with a server-side search
+    ``criteria`` the non-matching mail). On an unfiltered incremental sync
+    every UID is returned and ``ceiling`` is None.
+    """
+    uidvalidity = _response_int(mail, 'UIDVALIDITY')
+    uidnext = _response_int(mail, 'UIDNEXT')
+    last_uid = user_settings.imap_last_uid
+    if last_uid is not None and uidvalidity == user_settings.imap_uidvalidity:
+        if criteria is None:
+            typ, data = mail.uid('FETCH', f'{last_uid + 1}:*', '(UID)')
+            # "n:*" always matches the newest message, even when its UID < n
+            return [uid for uid in _fetched_uids(data) if uid > last_uid], None
+        if uidnext and uidnext - 1 <= last_uid:
+            return [], None
+        # bound the range by UIDNEXT so mail arriving meanwhile is left for
+        # the next sync instead of being skipped by the ceiling
+        upper = str(uidnext - 1) if uidnext else '*'
+        uids = [u for u in _search_uids(mail, f'UID {last_uid + 1}:{upper} {criteria}') if u > last_uid]
+        return uids, (uidnext - 1 if uidnext else (uids[-1] if uids else None))
+
+    uids = _search_uids(mail, 'UNSEEN' + (f' {criteria}' if criteria else ''))
+    if uidnext:
+        top = uidnext - 1
+    else:
+        typ, data = mail.uid('FETCH', '*', '(UID)')
+        top = max(_fetched_uids(data), default=0)
+    user_settings.imap_uidvalidity = uidvalidity
+    user_settings.imap_last_uid = (uids[0] - 1) if uids else top
+    # read mail above the newest unread message is part of the baseline too
+    return uids, top
+
+
+class ImapSession(MailBackend):
+    """One IMAP connection shared by all steps of a user's inbox cycle.
+
+    Fetching, lazy attachment downloads and ``\\Seen`` flags reuse the same
+    login. ``mark_seen`` only queues a UID; queued UIDs are stored with a
+    single ``UID STORE`` on ``flush()``, automatically every
+    ``flush_every`` UIDs (partial commit, so a crash mid-cycle loses at most
+    one batch of flags) and when the session closes::
+
+        with ImapSession(settings) as session:
+            for msg in session.fetch_new_messages():
+                ...
+                session.mark_seen(msg.uid)
+
+    The connection is opened on first use, so a session that ends up doing
+    nothing costs no login.
+
+    With ``server_filter`` the mailbox is searched server-side for mobile.de
+    mail before anything is downloaded: Gmail's ``X-GM-RAW`` with
+    ``gmail_raw_query`` when the server advertises X-GM-EXT-1, a plain
+    ``FROM "mobile.de"`` SEARCH otherwise. Other mail never crosses the wire
+    and is not touched.
+
+    ``compress`` negotiates COMPRESS=DEFLATE for the session; mobile.de HTML
+    typically shrinks several times over.
+
+    ``iter_new_messages`` yields one message at a time. ``fetch_budget``
+    caps the bytes of message data downloaded per FETCH; attachment
+    payloads above ``spool_threshold`` are kept in temp files.
+
+    ``lean_mime`` parses fully downloaded messages with the cheaper
+    compat32 path (see ``_parse_message_lean``).
+    """
+
+    def __init__(self, user_settings, bulk: bool = True, flush_every: int = 25,
+                 server_filter: bool = False, gmail_raw_query: str = DEFAULT_GMAIL_RAW_QUERY,
+                 compress: bool = False, fetch_budget: Optional[int] = None,
+                 spool_threshold: Optional[int] = None, lean_mime: bool = False):
+        super().__init__(user_settings)
+        self.address = user_settings.gmail_address
+        self.password = getattr(user_settings, 'gmail_app_password_decrypted', None)
+        self.bulk = bulk
+        self.flush_every = flush_every
+        self.server_filter = server_filter
+        self.gmail_raw_query = gmail_raw_query
+        self.compress = compress
+        self.fetch_budget = fetch_budget
+        self.spool_threshold = spool_threshold
+        self.lean_mime = lean_mime
+        # highest UID covered by the last baseline or filtered sync, and
+        # whether every UID that sync returned was fetched and handed out
+        self.sync_ceiling = None
+        self._sync_complete = False
+        self._mail = None
+        self._pending_seen = []
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.address and self.password)
+
+    @property
+    def mail(self):
+        if self._mail is None:
+            self._mail = _connect_imap(self.address, self.password, compress=self.compress)
+            self._mail.select('INBOX')
+        return self._mail
+
+    def _search_criteria(self) -> Optional[str]:
+        if not self.server_filter:
+            return None
+        if 'X-GM-EXT-1' in self.mail.capabilities:
+            return 'X-GM-RAW "%s"' % self.gmail_raw_query.replace('"', '')
+        return 'FROM "mobile.de"'
+
+    def _load_part(self, uid: int, part) -> bytes:
+        if self._mail is not None:
+            return _fetch_part(self._mail, uid, part)
+        # session already closed: fetch over a short-lived connection
+        mail = _connect_imap(self.address, self.password)
+        try:
+            mail.select('INBOX', readonly=True)
+            return _fetch_part(mail, uid, part)
+        finally:
+            mail.logout()
+
+    def _iter_fetch(self, uids: List[int], match=is_mobilede_sender) -> Iterator[EmailMessageData]:
+        if not uids:
+            return iter(())
+        if self.bulk:
+            return _iter_bulk_fetch(self.mail, uids, self._load_part, match=match, budget=self.fetch_budget, spool_threshold=self.spool_threshold)
+        return _iter_full_fetch(self.mail, uids, budget=self.fetch_budget, spool_threshold=self.spool_threshold, lean=self.lean_mime)
+
+    def iter_new_messages(self) -> Iterator[EmailMessageData]:
+        """Yield messages that arrived after the stored UID high-water mark.
+
+        Messages come in UID order, one at a time, so memory stays bounded by
+        the fetch budget however large the backlog is. The caller advances
+        ``user_settings.imap_last_uid`` as each message is processed and
+        persists it, so the next sync only costs as much as the new mail.
+        The mark jumps to the filtered sync's ceiling only after the
+        generator has run to the end.
+
+        With ``bulk`` only text parts are downloaded (see
+        ``_iter_bulk_fetch``), for every message so that listings forwarded
+        from another address still match on their body; otherwise every
+        message is fetched in full.
+        """
+        if not self.configured:
+            return
+        self._sync_complete = False
+        uids, self.sync_ceiling = _pending_uids(self.mail, self.user_settings, self._search_criteria())
+        yield from self._iter_fetch(uids, match=None)
+        self._sync_complete = True
+
+    def fetch_recent_mobilede_messages(self) -> List[EmailMessageData]:
+        """Fetch recent messages (last 2 days) that look like they are from mobile.de.
+
+        Used only for manual testing from the settings UI. It considers both
+        read and unread messages and filters by:
+          - From header containing 'mobile.de', or
+          - message body containing 'mobile.de' (only without ``bulk``, which
+            decides on the From/Subject headers before downloading anything).
+        """
+        print("DEBUG: Starting fetch_recent_mobilede_message")
+        if not self.configured:
+            print("DEBUG: No address or password")
+            return []
+
+        print(f"DEBUG: Connecting to IMAP for {self.address}")
+        mail = self.mail
+        print("DEBUG: Selected INBOX")
+
+        # Compute date 2 days ago for IMAP SINCE filter (format: 19-Nov-2025)
+        since_date = (datetime.utcnow() - timedelta(days=2)).strftime('%d-%b-%Y')
+        print(f"DEBUG: SINCE date: {since_date}")
+
+        # Search messages since that date (both read and unread)
+        criteria = self._search_criteria()
+        typ, data = mail.uid('SEARCH', None, '(SINCE "' + since_date + '")' + (f' {criteria}' if criteria else ''))
+        print(f"DEBUG: Search result type: {typ}, data: {data}")
+        if typ != 'OK':
+            print("DEBUG: Search failed")
+            return []
+
+        all_uids = sorted(int(u) for u in data[0].split())
+        print(f"DEBUG: Found {len(all_uids)} UIDs")
+        messages: List[EmailMessageData] = []
+        for msg in self._iter_fetch(all_uids):
+            from_header = msg.from_addr.lower()
+            msg.from_addr = from_header
+            body_combined = (msg.text_body or '') + '\n' + (msg.html_body or '')
+            if is_mobilede_sender(from_header, msg.subject) or (not self.bulk and 'mobile.de' in body_combined.lower()):
+                print(f"DEBUG: Found mobile.de message: UID={msg.uid}, From={from_header}, Subject={msg.subject}")
+                messages.append(msg)
             else:
-                print(f"DEBUG: Message UID {num} does not match filter")
-        except Exception as e:
-            print(f"DEBUG: Error processing message {num}: {e}")
-            continue
+                print(f"DEBUG: Message UID {msg.uid} does not match filter")
 
-    print(f"DEBUG: Total mobile.de messages found: {len(messages)}")
-    mail.close()
-    mail.logout()
-    return messages
+        print(f"DEBUG: Total mobile.de messages found: {len(messages)}")
+        return messages
+
+    def message_done(self, msg) -> bool:
+        return self._advance_mark(msg.uid)
+
+    def sync_done(self) -> bool:
+        # skip past mail this sync left out (filtered out, or already read
+        # at the baseline), but only once every returned message is handled
+        if self.sync_ceiling is None or not self._sync_complete:
+            return False
+        return self._advance_mark(self.sync_ceiling)
+
+    def _advance_mark(self, uid) -> bool:
+        """Move the UID high-water mark past ``uid``."""
+        try:
+            uid = int(uid)
+        except (TypeError, ValueError):
+            return False
+        settings = self.user_settings
+        if settings.imap_last_uid is None or uid <= settings.imap_last_uid:
+            return False
+        settings.imap_last_uid = uid
+        return True
+
+    def mark_seen(self, uid):
+        self._pending_seen.append(int(uid))
+        if len(self._pending_seen) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Store ``\\Seen`` on all queued UIDs with one command."""
+        if not self._pending_seen or not self.configured:
+            return
+        uids, self._pending_seen = sorted(set(self._pending_seen)), []
+        try:
+            self.mail.uid('STORE', _uid_set(uids), '+FLAGS.SILENT', '(\\Seen)')
+        except Exception:
+            pass
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            mail, self._mail = self._mail, None
+            if mail is not None:
+                try:
+                    mail.close()
+                    mail.logout()
+                except Exception:
+                    pass
+
+
+def fetch_new_messages(user_settings, bulk: bool = True, server_filter: bool = False) -> List[EmailMessageData]:
+    """Single-shot wrapper around ``ImapSession.fetch_new_messages``.
+
+    With ``server_filter`` the caller cannot see the sync ceiling, so the
+    UID mark only moves as far as the returned messages; use ImapSession.
+    """
+    with ImapSession(user_settings, bulk=bulk, server_filter=server_filter) as session:
+        return session.fetch_new_messages()
+
+
+def fetch_recent_mobilede_message(user_settings, bulk: bool = True, server_filter: bool = False) -> List[EmailMessageData]:
+    """Single-shot wrapper around ``ImapSession.fetch_recent_mobilede_messages``."""
+    with ImapSession(user_settings, bulk=bulk, server_filter=server_filter) as session:
+        return session.fetch_recent_mobilede_messages()
 
 
 def mark_message_seen(user_settings, uid: str):
-    address = user_settings.gmail_address
-    password = user_settings.gmail_app_password_decrypted if hasattr(user_settings, 'gmail_app_password_decrypted') else None
-    if not address or not password:
-        return
-    mail = _connect_imap(address, password)
-    mail.select('INBOX')
-    try:
-        mail.store(uid, '+FLAGS', '\\Seen')
-    except Exception:
-        pass
-    mail.close()
-    mail.logout()
+    """Flag one message as seen over its own connection.
+
+    Prefer ``ImapSession.mark_seen`` inside an inbox cycle.
+    """
+    with ImapSession(user_settings) as session:
+        session.mark_seen(uid)
@@ -0,0 +1,161 @@
+import logging
+import threading
+from datetime import datetime
+
+from .gmail_client import _connect_imap
+from .models import User, UserSettings
+from .security import decrypt_secret
+
+logger = logging.getLogger(__name__)
+
+
+class MailboxWatcher(threading.Thread):
+    """Keeps one authenticated IMAP connection per mailbox in IDLE.
+
+    As soon as the server reports new mail ``on_new_mail(user_id)`` is
+    called from this thread. Dropped connections are re-established with
+    exponential backoff; the scheduler's interval poll stays in place as a
+    fallback for anything missed while reconnecting.
+    """
+
+    def __init__(self, user_id: int, address: str, password: str, on_new_mail,
+                 idle_timeout: float = 600, max_backoff: float = 300):
+        super().__init__(name=f'imap-idle-{user_id}', daemon=True)
+        self.user_id = user_id
+        self.address = address
+        self.password = password
+        self.on_new_mail = on_new_mail
+        self.idle_timeout = idle_timeout
+        self.max_backoff = max_backoff
+        self._stop_event = threading.Event()
+        self._mail = None
+
+    def stop(self):
+        self._stop_event.set()
+        mail = self._mail
+        if mail is not None:
+            # unblocks a pending recv() inside idle()
+            try:
+                mail.shutdown()
+            except Exception:
+                pass
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop_event.is_set()
+
+    def run(self):
+        backoff = 5
+        while not self.stopped:
+            try:
+                self._watch()
+                backoff = 5
+            except Exception as exc:
+                if self.stopped:
+                    break
+                logger.warning('IMAP IDLE for user %s dropped: %s; reconnecting in %ss', self.user_id, exc, backoff)
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+            finally:
+                self._close()
+
+    def _watch(self):
+        # Gmail drops idle connections after ~30 minutes, so use a generous
+        # socket timeout for normal commands and renew IDLE regularly.
+        self._mail = _connect_imap(self.address, self.password, timeout=60)
+        self._mail.select('INBOX', readonly=True)
+        logger.info('IMAP IDLE watching mailbox of user %s', self.user_id)
+        # Catch up on anything that arrived while we were disconnected.
+        self._notify()
+        while not self.stopped:
+            if not self._mail.idle(self.idle_timeout):
+                continue
+            self._notify()
+            # Mail delivered while we were processing is reported as an
+            # untagged EXISTS on the next command rather than inside IDLE.
+            self._mail.untagged_responses.pop('EXISTS', None)
+            self._mail.noop()
+            while self._mail.untagged_responses.pop('EXISTS', None) and not self.stopped:
+                self._notify()
+                self._mail.noop()
+
+    def _notify(self):
+        if self.stopped:
+            return
+        try:
+            self.on_new_mail(self.user_id)
+        except Exception:
+            logger.exception('Inbox processing triggered by IDLE failed for user %s', self.user_id)
+
+    def _close(self):
+        mail, self._mail = self._mail, None
+        if mail is None:
+            return
+        try:
+            mail.logout()
+        except Exception:
+            pass
+
+
+class IdleWatcherManager:
+    """Starts, restarts and stops one MailboxWatcher per auto-posting user."""
+
+    def __init__(self, app):
+        self.app = app
+        self.watchers = {}
+        self._lock = threading.Lock()
+
+    def _on_new_mail(self, user_id: int):
+        from .tasks import process_inbox_for_user_id
+        process_inbox_for_user_id(user_id, app=self.app)
+
+    def _wanted_mailboxes(self):
+        master_key = self.app.config.get('MASTER_SECRET_KEY')
+        wanted = {}
+        with self.app.app_context():
+            rows = UserSettings.query.join(User).filter(UserSettings.auto_post_enabled.is_(True)).all()
+            for s in rows:
+                if (s.mail_backend or 'imap') != 'imap':
+                    continue
+                if not (s.gmail_address and s.gmail_app_password_encrypted):
+                    continue
+                try:
+                    pwd = decrypt_secret(s.gmail_app_password_encrypted, master_key)
+                except Exception:
+                    pwd = None
+                if pwd:
+                    wanted[s.user_id] = (s.gmail_address, pwd)
+        return wanted
+
+    def sync(self):
+        """Reconcile running watchers with the current user settings."""
+        wanted = self._wanted_mailboxes()
+        idle_timeout = self.app.config.get('IMAP_IDLE_RENEW_SECONDS', 600)
+        with self._lock:
+            for user_id, watcher in list(self.watchers.items()):
+                creds = wanted.get(user_id)
+                if creds != (watcher.address, watcher.password) or not watcher.is_alive():
+                    watcher.stop()
+                    del self.watchers[user_id]
+            for user_id, (address, pwd) in wanted.items():
+                if user_id in self.watchers:
+                    continue
+                watcher = MailboxWatcher(user_id, address, pwd, self._on_new_mail, idle_timeout=idle_timeout)
+                self.watchers[user_id] = watcher
+                watcher.start()
+
+    def stop_all(self):
+        with self._lock:
+            for watcher in self.watchers.values():
+                watcher.stop()
+            self.watchers.clear()
+
+
+def start_idle_watchers(app, scheduler):
+    """Create the watcher manager and keep it in sync via the scheduler."""
+    manager = IdleWatcherManager(app)
+    minutes = app.config.get('IMAP_IDLE_SYNC_MINUTES', 5)
+    scheduler.add_job(func=manager.sync, trigger='interval', minutes=minutes, id='sync_idle_watchers',
+                      replace_existing=True, next_run_time=datetime.now())
+    app.extensions['imap_idle'] = manager
+    return manager
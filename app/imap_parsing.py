@@ -0,0 +1,180 @@
+"""Parsing helpers for raw IMAP FETCH responses (BODYSTRUCTURE, literals)."""
+import binascii
+import quopri
+import re
+from itertools import takewhile
+from email.header import decode_header, make_header
+from typing import Dict, List, Optional
+
+_TOKEN_RE = re.compile(
+    rb'\s*(?:(?P<open>\()|(?P<close>\))|"(?P<quoted>(?:[^"\\]|\\.)*)"'
+    rb'|(?P<atom>[^\s()"\[]+(?:\[[^\]]*\])?(?:<\d+>)?))'
+)
+_LITERAL_SUFFIX_RE = re.compile(rb'\{(\d+)\}\s*$')
+
+
+class _Literal(bytes):
+    """Marker type for literal data, so it is never mistaken for an atom."""
+
+
+def _tokens(data):
+    """Tokenise an imaplib FETCH response list, literals included."""
+    for item in data or []:
+        if item is None:
+            continue
+        if isinstance(item, tuple):
+            head, literal = item
+            yield from _text_tokens(_LITERAL_SUFFIX_RE.sub(b'', head))
+            yield _Literal(literal)
+        else:
+            yield from _text_tokens(item)
+
+
+def _text_tokens(text: bytes):
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _TOKEN_RE.match(text, pos)
+        if not m or m.end() == pos:
+            break
+        pos = m.end()
+        if m.group('open'):
+            yield '('
+        elif m.group('close'):
+            yield ')'
+        elif m.group('quoted') is not None:
+            yield _Literal(re.sub(rb'\\(.)', rb'\1', m.group('quoted')))
+        else:
+            atom = m.group('atom')
+            yield None if atom.upper() == b'NIL' else atom
+
+
+def _parse_list(tokens):
+    out = []
+    for tok in tokens:
+        if tok == '(':
+            out.append(_parse_list(tokens))
+        elif tok == ')':
+            return out
+        else:
+            out.append(tok)
+    return out
+
+
+def parse_fetch_response(data) -> List[Dict[bytes, object]]:
+    """Turn the data of an imaplib ``uid('FETCH', ...)`` call into dicts.
+
+    Keys are upper-cased item names (``b'UID'``, ``b'BODYSTRUCTURE'``,
+    ``b'BODY[1.2]'``); values are bytes, nested lists or None (NIL).
+    """
+    results = []
+    tokens = iter(_tokens(data))
+    for tok in tokens:
+        if tok != '(':
+            continue
+        items = _parse_list(tokens)
+        fetched = {}
+        for i in range(0, len(items) - 1, 2):
+            key = items[i]
+            if isinstance(key, bytes):
+                fetched[bytes(key).upper()] = items[i + 1]
+        results.append(fetched)
+    return results
+
+
+class BodyPart:
+    """One leaf of a BODYSTRUCTURE tree, addressable as ``BODY[<number>]``."""
+
+    def __init__(self, number: str, content_type: str, params: dict, encoding: str,
+                 size: int, disposition: Optional[str], filename: Optional[str]):
+        self.number = number
+        self.content_type = content_type
+        self.params = params
+        self.encoding = encoding
+        self.size = size
+        self.disposition = disposition
+        self.filename = filename
+
+    @property
+    def charset(self) -> Optional[str]:
+        return self.params.get('charset')
+
+    @property
+    def is_attachment(self) -> bool:
+        return self.disposition == 'attachment' or bool(self.filename)
+
+
+def _text(value) -> str:
+    return bytes(value).decode('utf-8', errors='ignore') if value is not None else ''
+
+
+def _param_dict(value) -> dict:
+    if not isinstance(value, list):
+        return {}
+    return {_text(value[i]).lower(): _text(value[i + 1]) for i in range(0, len(value) - 1, 2)}
+
+
+def _decode_filename(value: str) -> str:
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+
+def _leaf(number: str, node: list) -> BodyPart:
+    maintype, subtype = _text(node[0]).lower(), _text(node[1]).lower()
+    params = _param_dict(node[2])
+    encoding = _text(node[5]).lower() or '7bit'
+    try:
+        size = int(node[6])
+    except (TypeError, ValueError, IndexError):
+        size = 0
+    # extension data starts after the type-specific fields
+    if maintype == 'text':
+        ext = 8
+    elif (maintype, subtype) == ('message', 'rfc822'):
+        ext = 10
+    else:
+        ext = 7
+    disposition = None
+    filename = params.get('name')
+    dispo = node[ext + 1] if len(node) > ext + 1 else None
+    if isinstance(dispo, list) and dispo:
+        disposition = _text(dispo[0]).lower()
+        filename = _param_dict(dispo[1] if len(dispo) > 1 else None).get('filename') or filename
+    if filename:
+        filename = _decode_filename(filename)
+    return BodyPart(number, f'{maintype}/{subtype}', params, encoding, size, disposition, filename)
+
+
+def walk_bodystructure(node, prefix: str = '') -> List[BodyPart]:
+    """Flatten a parsed BODYSTRUCTURE into its leaf parts with part numbers."""
+    if not isinstance(node, list) or not node:
+        return []
+    if isinstance(node[0], list):
+        parts = []
+        # child parts come first, followed by the multipart subtype
+        for i, child in enumerate(takewhile(lambda n: isinstance(n, list), node)):
+            parts.extend(walk_bodystructure(child, f'{prefix}{i + 1}.'))
+        return parts
+    return [_leaf(prefix.rstrip('.') or '1', node)]
+
+
+def decode_part(data: bytes, encoding: str) -> bytes:
+    """Undo the Content-Transfer-Encoding of a fetched body part."""
+    encoding = (encoding or '').lower()
+    if encoding == 'base64':
+        try:
+            return binascii.a2b_base64(data)
+        except binascii.Error:
+            return b''
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(data)
+    return data
+
+
+def decode_text(data: bytes, charset: Optional[str]) -> str:
+    try:
+        return data.decode(charset or 'utf-8', errors='ignore')
+    except LookupError:
+        return data.decode('utf-8', errors='ignore')
@@ -0,0 +1,95 @@
+"""Mail backends feeding the inbox pipeline.
+
+A backend is a per-cycle session object; ``process_user_inbox`` only talks
+to the ``MailBackend`` interface, so ingestion can use IMAP with an app
+password (``gmail_client.ImapSession``) or the Gmail REST API with an OAuth
+refresh token (``gmail_api_client.GmailApiSession``).
+"""
+from abc import ABC, abstractmethod
+from typing import Iterator, List
+
+MAIL_BACKENDS = ('imap', 'gmail_api')
+
+
+class MailBackend(ABC):
+    """Interface of a mailbox session used for one inbox cycle.
+
+    Sync state lives on ``user_settings``; the backend updates it and the
+    caller persists it whenever ``message_done``/``sync_done`` return True.
+    """
+
+    def __init__(self, user_settings):
+        self.user_settings = user_settings
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # flags queued so far belong to messages that were fully processed
+        self.close()
+        return False
+
+    @property
+    @abstractmethod
+    def configured(self) -> bool:
+        """True if the user has the credentials this backend needs."""
+
+    @abstractmethod
+    def iter_new_messages(self) -> Iterator:
+        """Yield new messages (``EmailMessageData``) in arrival order."""
+
+    def fetch_new_messages(self) -> List:
+        """List variant of ``iter_new_messages``."""
+        return list(self.iter_new_messages())
+
+    @abstractmethod
+    def fetch_recent_mobilede_messages(self) -> List:
+        """Recent mobile.de messages, read or not (manual testing)."""
+
+    def message_done(self, msg) -> bool:
+        """Record that ``msg`` was handled; True if the sync state changed."""
+        return False
+
+    def sync_done(self) -> bool:
+        """Record that the whole cycle was handled; True if the sync state changed."""
+        return False
+
+    @abstractmethod
+    def mark_seen(self, uid):
+        """Queue the \\Seen flag (or UNREAD label removal) for ``uid``."""
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+def open_mail_session(user_settings, config) -> MailBackend:
+    """Build the session for the user's configured backend from app config."""
+    backend = getattr(user_settings, 'mail_backend', None) or 'imap'
+    if backend == 'gmail_api':
+        from .gmail_api_client import GmailApiSession
+        return GmailApiSession(
+            user_settings,
+            client_id=config.get('GMAIL_OAUTH_CLIENT_ID'),
+            client_secret=config.get('GMAIL_OAUTH_CLIENT_SECRET'),
+            server_filter=config.get('IMAP_SERVER_FILTER', False),
+            gmail_raw_query=config.get('IMAP_GMAIL_RAW_QUERY'),
+            flush_every=config.get('IMAP_SEEN_FLUSH_EVERY', 25),
+            spool_threshold=config.get('IMAP_SPOOL_THRESHOLD_BYTES'),
+            base_url=config.get('GMAIL_API_BASE_URL'),
+            token_url=config.get('GMAIL_OAUTH_TOKEN_URL'),
+        )
+    from .gmail_client import ImapSession
+    return ImapSession(
+        user_settings,
+        bulk=config.get('IMAP_BULK_FETCH', True),
+        flush_every=config.get('IMAP_SEEN_FLUSH_EVERY', 25),
+        server_filter=config.get('IMAP_SERVER_FILTER', False),
+        gmail_raw_query=config.get('IMAP_GMAIL_RAW_QUERY'),
+        compress=config.get('IMAP_COMPRESS', True),
+        fetch_budget=config.get('IMAP_FETCH_BUDGET_BYTES'),
+        spool_threshold=config.get('IMAP_SPOOL_THRESHOLD_BYTES'),
+        lean_mime=config.get('IMAP_LEAN_MIME', True),
+    )
@@ -31,6 +31,16 @@ class UserSettings(db.Model):
     language = db.Column(db.String(8), default='uk')
     price_markup_eur = db.Column(db.Integer, default=0)
     auto_post_enabled = db.Column(db.Boolean, default=False)
+    # IMAP incremental sync: highest processed UID, valid only for this UIDVALIDITY
+    imap_uidvalidity = db.Column(db.BigInteger, nullable=True)
+    imap_last_uid = db.Column(db.BigInteger, nullable=True)
+    # mail backend: 'imap' (app password) or 'gmail_api' (OAuth refresh token)
+    mail_backend = db.Column(db.String(16), default='imap')
+    gmail_refresh_token_encrypted = db.Column(db.Text)
+    # Gmail API incremental sync: last handled users.history id
+    gmail_history_id = db.Column(db.BigInteger, nullable=True)
+    # where listing data comes from: 'website', 'email' or 'hybrid'
+    listing_source = db.Column(db.String(16), default='website')
 
     user = db.relationship('User', back_populates='settings')
 
@@ -52,3 +62,41 @@ class PostingLog(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     user = db.relationship('User', back_populates='logs')
+
+
+class ScrapeRetry(db.Model):
+    """Listing URL whose page could not be fetched; retried later with backoff."""
+    __tablename__ = 'scrape_retries'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'url'),
+        {'schema': DB_SCHEMA},
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey(f'{DB_SCHEMA}.users.id'), nullable=False)
+    url = db.Column(db.Text, nullable=False)
+    gmail_message_id = db.Column(db.String(255))
+    subject = db.Column(db.String(1024))
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class TelegramFileId(db.Model):
+    """file_id Telegram returned for a photo sent by a bot; content_hash = sha256 of bytes (or of 'url:' + URL)."""
+    __tablename__ = 'telegram_file_ids'
+    __table_args__ = {'schema': DB_SCHEMA}
+    bot_id = db.Column(db.BigInteger, primary_key=True)
+    content_hash = db.Column(db.String(64), primary_key=True)
+    file_id = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ResolvedUrl(db.Model):
+    """Cached redirect target of a tracking link; final_url NULL = not a listing page."""
+    __tablename__ = 'resolved_urls'
+    __table_args__ = {'schema': DB_SCHEMA}
+    url_hash = db.Column(db.String(64), primary_key=True)
+    url = db.Column(db.Text, nullable=False)
+    final_url = db.Column(db.Text, nullable=True)
+    resolved_at = db.Column(db.DateTime, default=datetime.utcnow)
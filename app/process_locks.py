@@ -0,0 +1,98 @@
+"""Locks shared by every app process on the host.
+
+gunicorn runs several workers, each importing the app. Background jobs
+(scheduler, IMAP IDLE watchers) must run in exactly one of them, and an
+inbox run for a user must never overlap another run for the same user,
+whichever process or thread started it. Both use ``flock`` on files in
+``PROCESS_LOCK_DIR``; the OS drops the locks when a process dies. Without
+``fcntl`` (Windows dev server, a single process) only thread locks apply.
+"""
+import os
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from .config import Config
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_thread_locks = defaultdict(threading.Lock)
+_thread_locks_guard = threading.Lock()
+
+
+def _lock_path(name: str) -> str:
+    return os.path.join(Config.PROCESS_LOCK_DIR, f'avto-bot-{name}.lock')
+
+
+class ProcessLock:
+    """An flock held for the rest of the process's life once acquired."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._file = None
+        self._guard = threading.Lock()
+
+    @property
+    def held(self) -> bool:
+        return fcntl is None or self._file is not None
+
+    def acquire(self, block: bool = False) -> bool:
+        """True if this process holds the lock (now or already)."""
+        if self.held:
+            return True
+        lock_file = open(_lock_path(self.name), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if block else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        with self._guard:
+            if self._file is not None:
+                lock_file.close()
+            else:
+                self._file = lock_file
+        return True
+
+    def when_acquired(self, start) -> bool:
+        """Run ``start()`` once this process holds the lock.
+
+        If another process has it, a daemon thread blocks on the flock and
+        calls ``start()`` as soon as the holder exits: the OS releases the
+        lock when a worker is recycled (gunicorn max_requests) or killed
+        (OOM), so one of the waiting workers takes over at once.
+        Returns True if ``start()`` ran right away.
+        """
+        if self.acquire():
+            start()
+            return True
+
+        def wait():
+            self.acquire(block=True)
+            start()
+
+        threading.Thread(target=wait, name=f'{self.name}-lock-wait', daemon=True).start()
+        return False
+
+
+# the one process that runs the scheduler and IMAP IDLE watchers
+scheduler_lock = ProcessLock('scheduler')
+
+
+@contextmanager
+def inbox_lock(user_id: int):
+    """Serialises inbox runs of one user: interval poll, IDLE push and manual checks."""
+    with _thread_locks_guard:
+        thread_lock = _thread_locks[user_id]
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(_lock_path(f'inbox-{user_id}'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -4,7 +4,9 @@ from ..extensions import db
 from ..models import UserSettings, PostingLog
 from ..security import encrypt_secret, decrypt_secret
 from ..telegram_client import ensure_channel_id
-from ..gmail_client import _connect_imap, fetch_recent_mobilede_message
+from ..gmail_client import _connect_imap
+from ..mail_backends import MAIL_BACKENDS, open_mail_session
+from ..utils.email_listing import LISTING_SOURCES
 from ..extensions import scheduler
 import openai
 import json
@@ -33,6 +35,8 @@ def gmail():
         if request.form.get('clear') == 'gmail':
             s.gmail_address = None
             s.gmail_app_password_encrypted = None
+            s.gmail_refresh_token_encrypted = None
+            s.gmail_history_id = None
             PostingLog.query.filter_by(user_id=current_user.id).delete()
             db.session.add(s)
             db.session.commit()
@@ -42,8 +46,18 @@ def gmail():
         pwd = request.form.get('gmail_app_password')
         if pwd:
             s.gmail_app_password_encrypted = encrypt_secret(pwd, current_app.config.get('MASTER_SECRET_KEY'))
+        backend = request.form.get('mail_backend')
+        if backend in MAIL_BACKENDS:
+            s.mail_backend = backend
+        refresh_token = request.form.get('gmail_refresh_token')
+        if refresh_token:
+            s.gmail_refresh_token_encrypted = encrypt_secret(refresh_token, current_app.config.get('MASTER_SECRET_KEY'))
+            s.gmail_history_id = None
         db.session.add(s)
         db.session.commit()
+        if s.mail_backend == 'gmail_api':
+            flash('Gmail API settings saved')
+            return redirect(url_for('settings.gmail'))
         # test IMAP
         try:
             pwd_dec = decrypt_secret(s.gmail_app_password_encrypted, current_app.config.get('MASTER_SECRET_KEY'))
@@ -64,6 +78,7 @@ def gmail_check():
     from datetime import datetime
     from ..tasks import check_inbox_for_user_id, process_user_inbox_once
     from ..models import PostingLog
+    from ..process_locks import inbox_lock
 
     user_id = current_user.id
     try:
@@ -71,8 +86,9 @@ def gmail_check():
         from flask import current_app as _current_app
         with _current_app.app_context():
             before = PostingLog.query.filter_by(user_id=user_id).count()
-            # run processing once for the user
-            process_user_inbox_once(current_user)
+            # run processing once for the user (waits for a running poll / IDLE pass)
+            with inbox_lock(user_id):
+                process_user_inbox_once(current_user)
             after = PostingLog.query.filter_by(user_id=user_id).count()
             added = after - before
         flash(f'Mailbox check completed — {added} new posting(s) created')
@@ -92,10 +108,11 @@ def gmail_test_old():
     manual testing and can be removed later.
     """
     from ..tasks import process_user_inbox_once
+    from ..process_locks import inbox_lock
 
     user_id = current_user.id
     try:
-        # Ensure Gmail password is decrypted for client use, similar to task code
+        # Ensure Gmail credentials are decrypted for client use, similar to task code
         s = current_user.settings
         if not s:
             flash('No settings found for current user')
@@ -108,6 +125,10 @@ def gmail_test_old():
             s.gmail_app_password_decrypted = decrypt_secret(s.gmail_app_password_encrypted, master_key)
         else:
             s.gmail_app_password_decrypted = None
+        if s.gmail_refresh_token_encrypted:
+            s.gmail_refresh_token_decrypted = decrypt_secret(s.gmail_refresh_token_encrypted, master_key)
+        else:
+            s.gmail_refresh_token_decrypted = None
 
         if s.openai_api_key_encrypted:
             s.openai_api_key_decrypted = decrypt_secret(s.openai_api_key_encrypted, master_key)
@@ -120,13 +141,15 @@ def gmail_test_old():
             s.telegram_bot_token_decrypted = None
 
         # Try to fetch at least one mobile.de-like message to confirm there is something to test
-        msgs = fetch_recent_mobilede_message(s)
+        with open_mail_session(s, current_app.config) as session:
+            msgs = session.fetch_recent_mobilede_messages()
         if not msgs:
             flash('No recent mobile.de-like messages found in your inbox')
             return redirect(url_for('settings.gmail'))
 
         # Reuse existing one-off processing which already uses parse_listing_from_url
-        process_user_inbox_once(current_user, messages=msgs)
+        with inbox_lock(user_id):
+            process_user_inbox_once(current_user, messages=msgs)
         flash('Tested processing of existing mobile.de messages. Check your Telegram channel and posting log.')
     except Exception as e:
         flash('Test of old mobile.de messages failed: ' + str(e))
@@ -248,6 +271,9 @@ def posting():
         s.language = request.form.get('language')
         s.price_markup_eur = int(request.form.get('price_markup_eur') or 0)
         s.auto_post_enabled = bool(request.form.get('auto_post_enabled'))
+        source = request.form.get('listing_source')
+        if source in LISTING_SOURCES:
+            s.listing_source = source
         db.session.add(s)
         db.session.commit()
         flash('Posting settings saved')
@@ -0,0 +1,190 @@
+# file: app/scrapers/browser_pool.py
+
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _BrowserSession:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.created = time.monotonic()
+
+
+class BrowserPool:
+    """
+    Невеликий пул заздалегідь запущених headless Chrome для сторінок, які
+    не віддаються звичайним requests (403 / bot-challenge).
+
+    - не більше ``size`` браузерів одночасно; зайві запити чекають у черзі;
+    - браузер перезапускається після ``max_pages`` сторінок або помилки,
+      заміна стартує у фоні, тож пул лишається "теплим";
+    - ``stats()``: латентність сторінок і JS heap (performance.memory).
+
+    selenium імпортується лише при першому запуску браузера.
+    """
+
+    def __init__(self, size: int = 1, max_pages: int = 50, page_timeout: float = 30,
+                 checkout_timeout: float = 60, user_agent: Optional[str] = None, prewarm: bool = True,
+                 driver_factory=None):
+        self.size = size
+        self.max_pages = max_pages
+        self.page_timeout = page_timeout
+        self.checkout_timeout = checkout_timeout
+        self.user_agent = user_agent
+        self.driver_factory = driver_factory or self._chrome
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self.pages = 0
+        self.failures = 0
+        self.recycled = 0
+        self._latencies = deque(maxlen=200)
+        self._heap_mb = deque(maxlen=200)
+        if prewarm:
+            for _ in range(size):
+                self._spawn_async()
+
+    def _chrome(self):
+        from selenium import webdriver
+
+        options = webdriver.ChromeOptions()
+        options.add_argument("--headless=new")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--window-size=1366,900")
+        # картинки качає PhotoFetcher, браузеру вони не потрібні
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        if self.user_agent:
+            options.add_argument(f"--user-agent={self.user_agent}")
+        driver = webdriver.Chrome(options=options)
+        driver.set_page_load_timeout(self.page_timeout)
+        return driver
+
+    def _new_session(self) -> _BrowserSession:
+        started = time.monotonic()
+        session = _BrowserSession(self.driver_factory())
+        logger.info("Headless browser started in %.1fs", time.monotonic() - started)
+        return session
+
+    def _spawn_async(self):
+        """Запускає браузер у фоні й кладе його в пул."""
+        with self._lock:
+            if self._closed or self._created >= self.size:
+                return
+            self._created += 1
+
+        def spawn():
+            try:
+                session = self._new_session()
+            except Exception as exc:
+                logger.warning("Headless browser failed to start: %s", exc)
+                with self._lock:
+                    self._created -= 1
+                return
+            self._idle.put(session)
+
+        threading.Thread(target=spawn, name="browser-pool-spawn", daemon=True).start()
+
+    def _checkout(self) -> _BrowserSession:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                return self._new_session()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get(timeout=self.checkout_timeout)
+
+    def _retire(self, session: _BrowserSession):
+        with self._lock:
+            self._created -= 1
+            self.recycled += 1
+        try:
+            session.driver.quit()
+        except Exception:
+            pass
+        self._spawn_async()
+
+    def fetch(self, url: str) -> Optional[str]:
+        """HTML сторінки після виконання JS або None."""
+        if self._closed:
+            return None
+        try:
+            session = self._checkout()
+        except queue.Empty:
+            logger.warning("No pooled browser became free for %s", url)
+            return None
+        except Exception as exc:
+            logger.warning("Headless browser unavailable: %s", exc)
+            self.failures += 1
+            return None
+        broken = False
+        started = time.monotonic()
+        try:
+            session.driver.get(url)
+            html = session.driver.page_source
+            heap = session.driver.execute_script(
+                "return window.performance && performance.memory ? performance.memory.usedJSHeapSize : null")
+        except Exception as exc:
+            logger.warning("Headless browser failed on %s: %s", url, exc)
+            self.failures += 1
+            broken = True
+            return None
+        finally:
+            session.pages += 1
+            if broken or session.pages >= self.max_pages or self._closed:
+                self._retire(session)
+            else:
+                self._idle.put(session)
+        latency = time.monotonic() - started
+        with self._lock:
+            self.pages += 1
+            self._latencies.append(latency)
+            if heap:
+                self._heap_mb.append(heap / 1024 / 1024)
+        logger.info("Browser fetched %s in %.2fs", url, latency)
+        return html
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            heap = list(self._heap_mb)
+            return {
+                "browsers": self._created,
+                "idle": self._idle.qsize(),
+                "pages": self.pages,
+                "failures": self.failures,
+                "recycled": self.recycled,
+                "avg_latency_s": round(sum(latencies) / len(latencies), 2) if latencies else None,
+                "p95_latency_s": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2) if latencies else None,
+                "avg_js_heap_mb": round(sum(heap) / len(heap), 1) if heap else None,
+            }
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                session.driver.quit()
+            except Exception:
+                pass
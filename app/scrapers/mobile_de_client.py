@@ -2,26 +2,47 @@
 
 import logging
 from typing import Optional
-import time
 
 import requests
 
+from app.scrapers.rate_limiter import THROTTLE_STATUSES, HostRateLimiter, default_limiter
+
 logger = logging.getLogger(__name__)
 
+# ознаки сторінки-перевірки "ви не робот" замість оголошення
+# (звичайне "captcha" не підходить — воно є у формі контакту продавця)
+_CHALLENGE_MARKERS = (
+    "challenge-platform", "cf-chl", "px-captcha", "captcha-delivery.com", "_incapsula_resource",
+    "zugriff verweigert", "ihre anfrage wurde blockiert",
+)
+
+
+def looks_like_challenge(html: Optional[str]) -> bool:
+    head = (html or "")[:20000].lower()
+    return any(marker in head for marker in _CHALLENGE_MARKERS)
+
 
 class MobileDeClient:
     """
     Простий клієнт для mobile.de, який:
     - маскується під браузер (User-Agent, Accept-Language, Referer);
     - використовує сесію з cookies;
-    - акуратно обробляє 403/429.
+    - акуратно обробляє 403/429: усі запити йдуть через спільний per-host
+      rate limiter, 429/503 повторюються після Retry-After (до
+      ``max_retries`` разів), 403 лише сповільнює подальші запити;
+    - після 403 або сторінки-перевірки пробує ``browser_pool`` (якщо заданий).
     """
 
     BASE_REFERER = "https://www.mobile.de/"
 
-    def __init__(self, timeout: int = 15):
+    def __init__(self, timeout: int = 15, rate_limiter: Optional[HostRateLimiter] = None,
+                 max_retries: int = 2, max_wait: float = 60, browser_pool=None):
         self.session = requests.Session()
         self.timeout = timeout
+        self.rate_limiter = rate_limiter or default_limiter
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.browser_pool = browser_pool
 
         # Мінімально правдоподібні заголовки браузера
         self.session.headers.update(
@@ -54,28 +75,36 @@ class MobileDeClient:
         else:
             headers["Referer"] = self.BASE_REFERER
 
-        try:
-            resp = self.session.get(
-                url,
-                timeout=self.timeout,
-                allow_redirects=True,
-                headers=headers,
-            )
-        except requests.RequestException as exc:
-            logger.warning("Mobile.de request failed for %s: %s", url, exc)
-            return None
+        for attempt in range(self.max_retries + 1):
+            # чекаємо на токен хоста (і на Retry-After після 429)
+            if not self.rate_limiter.acquire(url, timeout=self.max_wait):
+                logger.warning("Mobile.de rate limiter gave up waiting for %s", url)
+                return None
+            try:
+                resp = self.session.get(
+                    url,
+                    timeout=self.timeout,
+                    allow_redirects=True,
+                    headers=headers,
+                )
+            except requests.RequestException as exc:
+                logger.warning("Mobile.de request failed for %s: %s", url, exc)
+                return None
+            self.rate_limiter.on_response(url, resp.status_code, resp.headers.get("Retry-After"))
+
+            # Якщо сайт просить "повільніше" — повторюємо після паузи limiter'а
+            if resp.status_code in THROTTLE_STATUSES and resp.status_code != 403 and attempt < self.max_retries:
+                logger.warning("Mobile.de rate-limited (%s) for %s, retry %s", resp.status_code, url, attempt + 1)
+                continue
+            break
 
-        # Якщо сайт просить "повільніше"
         if resp.status_code == 429:
             logger.warning("Mobile.de rate-limited (429) for %s", url)
-            # Можна додати backoff, якщо потрібно
-            time.sleep(5)
             return None
 
         if resp.status_code == 403:
             logger.error("Mobile.de returned 403 Forbidden for %s", url)
-            # тут можна додати логіку сповіщення/фолбек
-            return None
+            return self._browser_fetch(url)
 
         if resp.status_code != 200:
             logger.warning(
@@ -85,4 +114,21 @@ class MobileDeClient:
             )
             return None
 
-        return resp.text
\ No newline at end of file
+        if self.browser_pool is not None and looks_like_challenge(resp.text):
+            logger.warning("Mobile.de served a bot challenge for %s", url)
+            return self._browser_fetch(url)
+
+        return resp.text
+
+    def _browser_fetch(self, url: str) -> Optional[str]:
+        """Фолбек через пул headless-браузерів; None, якщо його немає або не допоміг."""
+        if self.browser_pool is None:
+            return None
+        if not self.rate_limiter.acquire(url, timeout=self.max_wait):
+            return None
+        html = self.browser_pool.fetch(url)
+        if html is None or looks_like_challenge(html):
+            logger.warning("Browser fallback did not get past the block for %s", url)
+            return None
+        logger.info("Browser fallback stats: %s", self.browser_pool.stats())
+        return html
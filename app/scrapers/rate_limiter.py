@@ -0,0 +1,220 @@
+# file: app/scrapers/rate_limiter.py
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from app.config import Config
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# статуси, якими сайт просить "повільніше"
+THROTTLE_STATUSES = {403, 429, 503}
+
+# стан відра, спільний для процесів (лічильники лишаються свої в кожному)
+_SHARED_FIELDS = ("rate", "tokens", "updated", "blocked_until")
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """Retry-After у секундах (число або HTTP-дата)."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def _host(url_or_host: str) -> str:
+    if "://" in url_or_host:
+        return (urlsplit(url_or_host).hostname or "").lower()
+    return url_or_host.lower()
+
+
+class _Bucket:
+    def __init__(self, rate: float, burst: float, max_rate: float):
+        self.rate = rate
+        self.burst = burst
+        self.max_rate = max_rate
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.waited = 0.0
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class HostRateLimiter:
+    """
+    Token bucket на кожен хост з адаптивною (AIMD) швидкістю.
+
+    - ``acquire(url)`` блокує, доки для хоста є токен (або минув Retry-After);
+    - ``on_response(url, status, retry_after)``: кожна успішна відповідь
+      додає ``increase`` запитів/с до швидкості хоста (до ``max_rate``),
+      кожна 429/403/503 множить її на ``decrease`` і, якщо сайт надіслав
+      Retry-After, блокує хост на цей час;
+    - ``stats()`` — поточна швидкість і лічильники по хостах.
+
+    ``host_limits`` задає (rate, burst, max_rate) для хостів за суфіксом,
+    наприклад CDN картинок, який витримує значно більше, ніж сам сайт.
+
+    Без ``shared_dir`` відра живуть у пам'яті процесу, і кожен воркер
+    gunicorn мав би власний ліміт. З ``shared_dir`` стан відра хоста
+    (токени, швидкість, пауза за Retry-After) лежить у файлі під ``flock``,
+    тож ліміт діє на всі процеси машини разом, а 429 в одному воркері
+    пригальмовує й інші. Час — ``time.monotonic()``, на Linux він спільний
+    для всіх процесів. Без ``fcntl`` лишається ліміт на процес.
+    """
+
+    def __init__(self, rate: float = 1.0, burst: float = 3, max_rate: float = 4.0, min_rate: float = 0.05,
+                 increase: float = 0.05, decrease: float = 0.5,
+                 host_limits: Optional[Dict[str, Tuple[float, float, float]]] = None,
+                 shared_dir: Optional[str] = None):
+        self.rate = rate
+        self.burst = burst
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.host_limits = dict(host_limits or {})
+        self.shared_dir = shared_dir if fcntl is not None else None
+        self._buckets: Dict[str, _Bucket] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host: str) -> _Bucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            rate, burst, max_rate = self.rate, self.burst, self.max_rate
+            for suffix, limits in self.host_limits.items():
+                if host == suffix or host.endswith("." + suffix):
+                    rate, burst, max_rate = limits
+                    break
+            bucket = self._buckets[host] = _Bucket(rate, burst, max_rate)
+        return bucket
+
+    @contextmanager
+    def _synced(self, host: str, bucket: _Bucket):
+        """Під ``flock`` підтягує спільний стан відра і записує його назад."""
+        if self.shared_dir is None:
+            yield
+            return
+        path = os.path.join(self.shared_dir, f"avto-bot-rate-{host}.json")
+        try:
+            state_file = open(path, "a+")
+        except OSError as exc:
+            logger.warning("Shared rate state %s unavailable, limiting per process: %s", path, exc)
+            yield
+            return
+        with state_file:
+            fcntl.flock(state_file, fcntl.LOCK_EX)
+            state_file.seek(0)
+            try:
+                state = json.loads(state_file.read() or "{}")
+            except ValueError:
+                state = {}
+            # стан з-до перезавантаження машини (інший відлік monotonic) не чіпаємо
+            if state.get("updated", 0) <= time.monotonic():
+                for field in _SHARED_FIELDS:
+                    if field in state:
+                        setattr(bucket, field, state[field])
+                bucket.rate = min(bucket.max_rate, max(self.min_rate, bucket.rate))
+            yield
+            state_file.seek(0)
+            state_file.truncate()
+            state_file.write(json.dumps({field: getattr(bucket, field) for field in _SHARED_FIELDS}))
+            state_file.flush()
+
+    def acquire(self, url: str, timeout: Optional[float] = None) -> bool:
+        """Чекає на токен; False, якщо за ``timeout`` секунд він не з'явиться."""
+        host = _host(url)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                bucket = self._bucket(host)
+                with self._synced(host, bucket):
+                    now = time.monotonic()
+                    bucket.refill(now)
+                    if bucket.blocked_until > now:
+                        wait = bucket.blocked_until - now
+                    elif bucket.tokens >= 1:
+                        bucket.tokens -= 1
+                        bucket.requests += 1
+                        return True
+                    else:
+                        wait = (1 - bucket.tokens) / bucket.rate
+                if deadline is not None and now + wait > deadline:
+                    bucket.rejected += 1
+                    return False
+                bucket.waited += wait
+            time.sleep(wait)
+
+    def on_response(self, url: str, status: int, retry_after=None):
+        host = _host(url)
+        with self._lock:
+            bucket = self._bucket(host)
+            if status in THROTTLE_STATUSES:
+                with self._synced(host, bucket):
+                    now = time.monotonic()
+                    bucket.throttled += 1
+                    bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+                    bucket.tokens = 0
+                    delay = parse_retry_after(retry_after)
+                    if delay is None:
+                        delay = 1 / bucket.rate
+                    bucket.blocked_until = max(bucket.blocked_until, now + delay)
+                logger.warning("%s throttled us (HTTP %s): rate now %.2f req/s, paused %.0fs",
+                               host, status, bucket.rate, delay)
+            elif status < 400:
+                with self._synced(host, bucket):
+                    bucket.rate = min(bucket.max_rate, bucket.rate + self.increase)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                host: {
+                    "rate": round(b.rate, 3),
+                    "requests": b.requests,
+                    "throttled": b.throttled,
+                    "rejected": b.rejected,
+                    "waited_seconds": round(b.waited, 1),
+                    "blocked_for": round(max(0.0, b.blocked_until - now), 1),
+                }
+                for host, b in self._buckets.items()
+            }
+
+
+# спільний для всіх шляхів скрапінгу (клієнт, редиректи, фото)
+default_limiter = HostRateLimiter(
+    rate=Config.SCRAPE_RATE_PER_SECOND,
+    burst=Config.SCRAPE_BURST,
+    max_rate=Config.SCRAPE_MAX_RATE_PER_SECOND,
+    # mobile.de віддає фото з img.classistatic.de
+    host_limits={"classistatic.de": (Config.PHOTO_CDN_RATE_PER_SECOND, Config.PHOTO_CDN_RATE_PER_SECOND,
+                                     Config.PHOTO_CDN_RATE_PER_SECOND * 2)},
+    # один ліміт на всі воркери gunicorn і їхні пули потоків
+    shared_dir=Config.PROCESS_LOCK_DIR if Config.SCRAPE_RATE_SHARED else None,
+)
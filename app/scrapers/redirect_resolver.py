@@ -0,0 +1,153 @@
+# file: app/scrapers/redirect_resolver.py
+
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from urllib.parse import urljoin
+
+import requests
+
+from app.scrapers.rate_limiter import HostRateLimiter, default_limiter
+from app.utils.ttl_cache import MISSING, TTLCache
+
+logger = logging.getLogger(__name__)
+
+DETAILS_PATH = "/fahrzeuge/details.html"
+_REDIRECT_CODES = {301, 302, 303, 307, 308}
+
+
+def is_details_url(url: Optional[str]) -> bool:
+    return DETAILS_PATH in (url or "")
+
+
+class RedirectResolver:
+    """
+    Розгортає трекінгові посилання з email у фінальний URL оголошення.
+
+    - йде по заголовках Location з allow_redirects=False і stream=True,
+      тіло відповіді ніколи не читається;
+    - зупиняється, щойно Location вказує на details-сторінку (саму сторінку
+      потім завантажує MobileDeClient);
+    - кешує і позитивні, і негативні ("не details-сторінка") результати в
+      TTL LRU, опційно також у Postgres (``store``);
+    - мережеві помилки, 5xx і 403/429 не кешуються.
+    """
+
+    def __init__(self, session: Optional[requests.Session] = None, cache: Optional[TTLCache] = None,
+                 negative_ttl: float = 3600, max_hops: int = 10, timeout: float = 10, store=None,
+                 rate_limiter: Optional[HostRateLimiter] = None):
+        self.session = session or requests.Session()
+        self.rate_limiter = rate_limiter or default_limiter
+        self.cache = cache or TTLCache(maxsize=5000, ttl=24 * 3600)
+        self.negative_ttl = negative_ttl
+        self.max_hops = max_hops
+        self.timeout = timeout
+        self.store = store
+        self.requests_made = 0
+        self.store_hits = 0
+
+    def resolve(self, url: str) -> Optional[str]:
+        """Фінальний details URL або None, якщо посилання веде кудись інде."""
+        if is_details_url(url):
+            return url
+        cached = self.cache.get(url)
+        if cached is not MISSING:
+            return cached
+        if self.store is not None:
+            found, final = self.store.get(url)
+            if found:
+                self.store_hits += 1
+                self._remember(url, final, persist=False)
+                return final
+        try:
+            final, cacheable = self._follow(url)
+        except requests.RequestException as exc:
+            logger.warning("Redirect resolution failed for %s: %s", url, exc)
+            return None
+        if cacheable:
+            self._remember(url, final)
+        return final
+
+    def _follow(self, url: str) -> Tuple[Optional[str], bool]:
+        current = url
+        for _ in range(self.max_hops):
+            if not self.rate_limiter.acquire(current, timeout=self.timeout * 3):
+                return None, False
+            resp = self.session.get(current, allow_redirects=False, stream=True, timeout=self.timeout)
+            self.requests_made += 1
+            # відпускаємо з'єднання назад у пул, не читаючи тіла
+            resp.close()
+            self.rate_limiter.on_response(current, resp.status_code, resp.headers.get("Retry-After"))
+            location = resp.headers.get("Location")
+            if resp.status_code in _REDIRECT_CODES and location:
+                current = urljoin(current, location)
+                if is_details_url(current):
+                    return current, True
+                continue
+            if resp.status_code >= 500 or resp.status_code in (403, 429):
+                return None, False
+            return None, True
+        logger.warning("Too many redirects for %s", url)
+        return None, True
+
+    def _remember(self, url: str, final: Optional[str], persist: bool = True):
+        self.cache.set(url, final, ttl=None if final else self.negative_ttl)
+        if persist and self.store is not None:
+            self.store.put(url, final)
+
+    def stats(self) -> dict:
+        stats = self.cache.stats()
+        stats.update(requests=self.requests_made, store_hits=self.store_hits)
+        return stats
+
+
+class DbRedirectStore:
+    """
+    Postgres-шар для RedirectResolver (таблиця resolved_urls).
+
+    Працює лише всередині Flask app context і коли REDIRECT_CACHE_PERSIST
+    увімкнено; будь-яка помилка БД просто вимикає цей шар для виклику.
+    """
+
+    def __init__(self, ttl: float = 7 * 24 * 3600, negative_ttl: float = 3600):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    @staticmethod
+    def _enabled() -> bool:
+        from flask import current_app, has_app_context
+        return has_app_context() and bool(current_app.config.get("REDIRECT_CACHE_PERSIST"))
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def get(self, url: str) -> Tuple[bool, Optional[str]]:
+        if not self._enabled():
+            return False, None
+        from app.models import ResolvedUrl
+        try:
+            row = ResolvedUrl.query.get(self._key(url))
+        except Exception as exc:
+            logger.warning("resolved_urls lookup failed: %s", exc)
+            return False, None
+        if row is None or row.resolved_at is None:
+            return False, None
+        ttl = self.ttl if row.final_url else self.negative_ttl
+        if row.resolved_at < datetime.utcnow() - timedelta(seconds=ttl):
+            return False, None
+        return True, row.final_url
+
+    def put(self, url: str, final: Optional[str]):
+        if not self._enabled():
+            return
+        from app.extensions import db
+        from app.models import ResolvedUrl
+        try:
+            db.session.merge(ResolvedUrl(url_hash=self._key(url), url=url, final_url=final,
+                                         resolved_at=datetime.utcnow()))
+            db.session.commit()
+        except Exception as exc:
+            db.session.rollback()
+            logger.warning("resolved_urls write failed: %s", exc)
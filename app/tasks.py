@@ -1,39 +1,396 @@
 import traceback
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from .extensions import scheduler, db
-from .models import User, PostingLog
+from .models import User, PostingLog, ScrapeRetry
 from .security import decrypt_secret
-from .gmail_client import fetch_new_messages, mark_message_seen
+from .mail_backends import MailBackend, open_mail_session
+from .process_locks import inbox_lock
 from .openai_client import generate_listing_text
 from .telegram_client import ensure_channel_id, send_car_post
-from .utils.mobile_parser import parse_mobile_de
+from .utils.email_listing import extract_email_listings, listing_key, unique_listing_urls
+from .utils.image_pipeline import default_normalizer
+from .utils.mobile_parser import dedupe_by_ad_id, last_failure, parse_mobile_de, photo_fetcher
+from .utils.mobile_search import parse_search_listings
+from .utils.photo_dedupe import full_size_image
+from .utils.mobile_urls import ad_id_from_url, extract_urls, listing_urls, search_urls
+from .scrapers.rate_limiter import default_limiter
 from flask import current_app
-from datetime import datetime
+from datetime import datetime, timedelta
+import random
 import re
 import requests
-from bs4 import BeautifulSoup
 import time
 import json
 import codecs
+from types import SimpleNamespace
 
+# Hybrid listing source: details pages that miss the publish deadline finish
+# here; the gallery then follows the e-mail card post in the channel.
+_detail_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='detail-fetch')
 
-def extract_urls(text):
-    """Extract URLs from text and HTML."""
-    urls = set()
-    # Regex for plain text URLs
-    url_pattern = r'https?://[^\s<>"\']+'
-    urls.update(re.findall(url_pattern, text))
 
-    # Parse HTML for href attributes
+def _email_listing_with_photo(listing: dict) -> dict:
+    """Listing built from the e-mail card, with its teaser image downloaded."""
+    listing = dict(listing)
+    photo_urls = listing.pop('photo_urls', [])
+    listing['photos'] = photo_fetcher.fetch_all([full_size_image(u) for u in photo_urls])
+    return listing
+
+
+def _website_listing(url: str, listing):
+    """A listing from mobile.de, or None if it has no title or no photos.
+
+    A details page can answer 200 with a bot challenge, a consent wall or an
+    empty extract; such listings must not reach OpenAI and the channel.
+    """
+    if listing and listing.get('title') and (listing.get('photos') or listing.get('photo_urls')):
+        return listing
+    if listing:
+        print(f"DEBUG: No title or photos in the listing for {url}")
+    return None
+
+
+def _fetch_details(app, url: str):
+    """parse_mobile_de for a worker thread: ``(listing, failure)``.
+
+    The worker gets its own app context (redirect store, config), and the
+    failure travels back with the result because last_failure() is per thread.
+    """
+    with app.app_context():
+        listing = parse_mobile_de(url)
+        return listing, (last_failure() if listing is None else None)
+
+
+def _follow_up_details(app, chat, bot_token: str, url: str, future):
+    """Done-callback of a hybrid fetch that missed the deadline.
+
+    The e-mail card is already in the channel with its teaser photo; once
+    the details page is in, its gallery follows as a second post, captioned
+    with the seller's description. ``chat`` holds only the channel fields,
+    so no ORM object crosses into the worker thread.
+    """
     try:
-        soup = BeautifulSoup(text, 'html.parser')
-        for a in soup.find_all('a', href=True):
-            href = a['href']
-            if href.startswith('http'):
-                urls.add(href)
-    except:
-        pass
+        listing, failure = future.result()
+    except Exception as e:
+        print(f"DEBUG: background details fetch for {url} failed: {e}")
+        return
+    with app.app_context():
+        listing = _website_listing(url, listing)
+        if listing is None:
+            print(f"DEBUG: background details fetch for {url} gave no gallery to follow up with: {failure}")
+            return
+        text = (listing.get('description') or '').strip() or listing['title']
+        ok, err = _send_post(chat, bot_token, text, listing.get('photos') or [], photo_urls=listing.get('photo_urls'))
+        print(f"DEBUG: follow-up gallery for {url}, success: {ok}, error: {err}")
+
+
+def _follow_up_when_ready(settings, bot_token: str, url: str, future):
+    """Called once the e-mail card is posted, so the gallery always comes second."""
+    app = current_app._get_current_object()
+    chat = SimpleNamespace(telegram_channel_id=settings.telegram_channel_id,
+                           telegram_channel_username=settings.telegram_channel_username)
+    future.add_done_callback(lambda f: _follow_up_details(app, chat, bot_token, url, f))
+
+
+def _listing_for(url: str, source: str, email_listing, search_listings: dict, pending: list = None):
+    """Pick the listing data for one ad according to the user's listing source.
+
+    'email' posts the e-mail card as is; 'hybrid' waits up to
+    HYBRID_DETAIL_DEADLINE_SECONDS for the details page and otherwise posts
+    the e-mail card while the fetch completes in the background; that
+    fetch is appended to ``pending`` so the caller can follow the card post
+    up with the gallery (_follow_up_when_ready). 'website' (and any ad
+    without an e-mail card) goes to mobile.de. Only e-mail cards may be
+    posted without photos. Returns ``(listing, failure)``, failure as in
+    last_failure().
+    """
+    if email_listing and source == 'email':
+        return _email_listing_with_photo(email_listing), None
+    if email_listing and source == 'hybrid':
+        future = _detail_executor.submit(_fetch_details, current_app._get_current_object(), url)
+        try:
+            listing, _ = future.result(timeout=current_app.config.get('HYBRID_DETAIL_DEADLINE_SECONDS', 5))
+        except FutureTimeout:
+            print(f"DEBUG: details page for {url} not ready, posting e-mail data; gallery follows when it is in")
+            if pending is not None:
+                pending.append(future)
+            listing = None
+        except Exception as e:
+            print(f"DEBUG: details fetch failed for {url}: {e}")
+            listing = None
+        return _website_listing(url, listing) or _email_listing_with_photo(email_listing), None
+    listing = _website_listing(url, search_listings.get(ad_id_from_url(url))) or _website_listing(url, parse_mobile_de(url))
+    return listing, (last_failure() if listing is None else None)
+
+
+def _normalised(photos: list) -> list:
+    if current_app.config.get('IMAGE_NORMALIZE_ENABLED') and default_normalizer.available:
+        return [default_normalizer.normalize(p) if p else p for p in photos]
+    return photos
+
+
+def _send_post(settings, bot_token: str, text: str, photos: list, photo_urls: list = None):
+    """send_car_post with the photos normalised first; logs bytes and time saved.
+
+    Listings that carry only ``photo_urls`` are sent by URL when
+    TELEGRAM_PHOTOS_BY_URL is on (photos Telegram rejects are downloaded
+    and uploaded), otherwise the URLs are downloaded here first.
+    """
+    if photo_urls and not photos:
+        if current_app.config.get('TELEGRAM_PHOTOS_BY_URL'):
+            started = time.monotonic()
+            ok, err = send_car_post(settings, bot_token, text, [], photo_urls=photo_urls,
+                                    fetch_photos=lambda urls: _normalised(photo_fetcher.fetch_all(urls, keep_missing=True)))
+            print(f"DEBUG: sent {len(photo_urls)} photos by URL in {time.monotonic() - started:.1f}s")
+            return ok, err
+        photos = photo_fetcher.fetch_all(photo_urls)
+    stats = None
+    if photos and current_app.config.get('IMAGE_NORMALIZE_ENABLED') and default_normalizer.available:
+        photos, stats = default_normalizer.normalize_all(photos)
+    started = time.monotonic()
+    ok, err = send_car_post(settings, bot_token, text, photos)
+    upload_seconds = time.monotonic() - started
+    if stats and stats['bytes_out']:
+        saved = stats['bytes_in'] - stats['bytes_out']
+        # upload time the original bytes would have needed at the observed throughput
+        saved_seconds = upload_seconds * saved / stats['bytes_out']
+        print(f"DEBUG: photos {stats['bytes_in'] / 1024:.0f} KiB -> {stats['bytes_out'] / 1024:.0f} KiB "
+              f"(saved {saved / 1024:.0f} KiB, normalised in {stats['seconds']}s); "
+              f"upload {upload_seconds:.1f}s, ~{saved_seconds:.1f}s faster than the originals")
+    return ok, err
+
+
+def _post_listing(user: User, settings, url: str, listing: dict, message_id, subject, openai_key: str, bot_token: str) -> bool:
+    """Generate the post text, send it with the listing photos and log the result."""
+    if not listing.get('photos') and not listing.get('photo_urls'):
+        print(f"DEBUG: No photos in the e-mail card for {url}, posting text only")
+    print(f"DEBUG: Parsed listing: {listing['title']}")
+    raw = {
+        'title': listing['title'],
+        'price': listing.get('price'),
+        'mileage': listing.get('mileage'),
+        'year': listing.get('year'),
+        'fuel': listing.get('fuel'),
+        'gearbox': listing.get('gearbox'),
+        'description': listing['description'],
+        'url': url,
+        'specs': listing.get('specs') or {}
+    }
+    photos = listing.get('photos') or []
+    text = generate_listing_text(raw, settings.language or 'uk', settings.price_markup_eur or 0, openai_key)
+    ok, err = _send_post(settings, bot_token, text, photos, photo_urls=listing.get('photo_urls'))
+    print(f"DEBUG: Sent post for {url}, success: {ok}, error: {err}")
+    log = PostingLog(user_id=user.id, gmail_message_id=message_id, subject=subject, car_title=raw['title'], raw_price=str(raw.get('price')), final_price=str(settings.price_markup_eur or ''), sent_to_channel=bool(ok), sent_at=(datetime.utcnow() if ok else None), error=(err if not ok else None))
+    db.session.add(log)
+    db.session.commit()
+    return bool(ok)
+
+
+def _retry_delay(attempts: int) -> float:
+    """Exponential backoff with equal jitter: half fixed, half random."""
+    cfg = current_app.config
+    delay = min(cfg.get('SCRAPE_RETRY_MAX_DELAY_SECONDS', 6 * 3600),
+                cfg.get('SCRAPE_RETRY_BASE_SECONDS', 300) * 2 ** attempts)
+    return delay / 2 + random.uniform(0, delay / 2)
 
-    return list(urls)
+
+def _enqueue_retry(user_id: int, url: str, message_id, subject, error: str):
+    if ScrapeRetry.query.filter_by(user_id=user_id, url=url).first() is not None:
+        return
+    db.session.add(ScrapeRetry(user_id=user_id, url=url, gmail_message_id=message_id, subject=subject,
+                               attempts=0, last_error=error,
+                               next_attempt_at=datetime.utcnow() + timedelta(seconds=_retry_delay(0))))
+    db.session.commit()
+
+
+def _retry_one(item: ScrapeRetry):
+    """One attempt for a queued URL; reschedules, gives up or posts the listing."""
+    user = User.query.get(item.user_id)
+    settings = user.settings if user else None
+    master_key = current_app.config.get('MASTER_SECRET_KEY')
+    openai_key = decrypt_secret(settings.openai_api_key_encrypted, master_key) if settings and settings.openai_api_key_encrypted else None
+    bot_token = decrypt_secret(settings.telegram_bot_token_encrypted, master_key) if settings and settings.telegram_bot_token_encrypted else None
+    if not (settings and settings.auto_post_enabled and openai_key and bot_token):
+        db.session.delete(item)
+        db.session.commit()
+        return
+
+    item.attempts += 1
+    listing = _website_listing(item.url, parse_mobile_de(item.url))
+    if listing:
+        print(f"DEBUG: Retry {item.attempts} succeeded for {item.url}")
+        db.session.delete(item)
+        db.session.commit()
+        _post_listing(user, settings, item.url, listing, item.gmail_message_id, item.subject, openai_key, bot_token)
+        return
+
+    failure = last_failure() or {'error': 'no title or photos on the details page', 'retryable': False}
+    item.last_error = failure['error']
+    if not failure['retryable'] or item.attempts >= current_app.config.get('SCRAPE_RETRY_MAX_ATTEMPTS', 6):
+        print(f"DEBUG: Giving up on {item.url} after {item.attempts} retries: {item.last_error}")
+        db.session.delete(item)
+        db.session.add(PostingLog(user_id=item.user_id, gmail_message_id=item.gmail_message_id, subject=item.subject, sent_to_channel=False, error=f"scrape failed after {item.attempts} retries: {item.last_error}"))
+    else:
+        item.next_attempt_at = datetime.utcnow() + timedelta(seconds=_retry_delay(item.attempts))
+        print(f"DEBUG: Retry {item.attempts} failed for {item.url}, next at {item.next_attempt_at}")
+    db.session.commit()
+
+
+def retry_failed_scrapes(app):
+    """Scheduler job: retry due URLs from the scrape_retries queue.
+
+    Runs apart from check_all_inboxes and takes no per-user inbox lock, so a
+    slow retry never delays fresh mail (queued URLs are not in any inbox run).
+    """
+    with app.app_context():
+        try:
+            due = ScrapeRetry.query.filter(ScrapeRetry.next_attempt_at <= datetime.utcnow()) \
+                .order_by(ScrapeRetry.next_attempt_at).limit(app.config.get('SCRAPE_RETRY_BATCH', 10)).all()
+            for item in due:
+                try:
+                    _retry_one(item)
+                except Exception:
+                    traceback.print_exc()
+                    db.session.rollback()
+        finally:
+            db.session.remove()
+
+
+def _save_sync_state(settings):
+    db.session.add(settings)
+    db.session.commit()
+
+
+def _iter_synced(settings, session: MailBackend):
+    """Stream new messages, persisting the backend's (re)sync baseline first."""
+    messages = session.iter_new_messages()
+    first = next(messages, None)
+    _save_sync_state(settings)
+    if first is None:
+        return
+    yield first
+    yield from messages
+
+
+def _decrypt_mail_credentials(settings, master_key, keep_existing: bool = False):
+    """Attach the decrypted mailbox credentials the mail backends read."""
+    if not (keep_existing and getattr(settings, 'gmail_app_password_decrypted', None)):
+        settings.gmail_app_password_decrypted = decrypt_secret(settings.gmail_app_password_encrypted, master_key) if settings.gmail_app_password_encrypted else None
+    if not (keep_existing and getattr(settings, 'gmail_refresh_token_decrypted', None)):
+        settings.gmail_refresh_token_decrypted = decrypt_secret(settings.gmail_refresh_token_encrypted, master_key) if settings.gmail_refresh_token_encrypted else None
+
+
+def _process_message(user: User, settings, session: MailBackend, msg, openai_key: str, bot_token: str, pause: float = 0):
+    """Publish the listings found in one e-mail and queue it to be marked seen."""
+    print(f"DEBUG: Processing message UID {msg.uid}, Subject: {msg.subject}")
+    body = (msg.text_body or '') + '\n' + (msg.html_body or '')
+
+    # Filter only mobile.de-related messages
+    if 'mobile.de' not in (msg.from_addr or '').lower() and 'mobile.de' not in body.lower():
+        # Skip non-mobile.de messages
+        print(f"DEBUG: Skipping non-mobile.de message {msg.uid}")
+        session.mark_seen(msg.uid)
+        return
+
+    # Keep listing links only (direct links as one canonical URL per ad id,
+    # then tracking links); unsubscribe, app-store, pixel and other
+    # irrelevant links are dropped without any I/O
+    urls = extract_urls(body)
+    mobile_urls = listing_urls(urls)
+    print(f"DEBUG: Found {len(mobile_urls)} mobile.de URLs in message {msg.uid}")
+
+    if not mobile_urls:
+        # Fallback to old parsing if no URLs
+        print(f"DEBUG: No URLs found, using fallback parsing for {msg.uid}")
+        raw = {
+            'title': msg.subject or 'Car listing',
+            'price': None,
+            'mileage': None,
+            'year': None,
+            'fuel': None,
+            'gearbox': None,
+            'description': body,
+            'url': ''
+        }
+        # attachment bodies may be fetched lazily, so pick by name first
+        photo_attachments = [a for a in msg.attachments if a.filename and a.filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif'))][:10] if msg.attachments else []
+        photos = [a.content for a in photo_attachments if a.content]
+        text = generate_listing_text(raw, settings.language or 'uk', settings.price_markup_eur or 0, openai_key)
+        ok, err = _send_post(settings, bot_token, text, photos)
+        print(f"DEBUG: Sent fallback post for {msg.uid}, success: {ok}, error: {err}")
+        log = PostingLog(user_id=user.id, gmail_message_id=msg.uid, subject=msg.subject, car_title=raw['title'], raw_price=str(raw.get('price')), final_price=str(settings.price_markup_eur or ''), sent_to_channel=bool(ok), sent_at=(datetime.utcnow() if ok else None), error=(err if not ok else None))
+        db.session.add(log)
+        db.session.commit()
+        if pause:
+            time.sleep(pause)  # Rate limit prevention
+    else:
+        source = settings.listing_source or 'website'
+        # Saved-search e-mails already carry title, price, key specs and a
+        # teaser image per ad; those cards need no request to mobile.de
+        email_listings = extract_email_listings(msg.html_body) if source != 'website' and msg.html_body else {}
+        if email_listings:
+            # every card counts, including ads linked only through tracking URLs
+            card_urls = [u for u in urls if listing_key(u) in email_listings]
+            mobile_urls = unique_listing_urls(mobile_urls + card_urls, email_listings)
+            print(f"DEBUG: {len(email_listings)} listing cards in the e-mail body")
+        # tracking links may lead to ads that are linked directly too; cards
+        # are already one URL each and need no request
+        mobile_urls = dedupe_by_ad_id(mobile_urls, resolve=lambda u: listing_key(u) not in email_listings)
+        print(f"DEBUG: {len(mobile_urls)} distinct listings in message {msg.uid}")
+        # Search mode: one request for the saved-search results page covers
+        # every ad it lists; ads missing from it go through parse_mobile_de
+        search_listings = {}
+        found_searches = search_urls(urls)
+        if source == 'website' and current_app.config.get('MOBILE_INGEST_MODE') == 'search' and found_searches:
+            ad_ids = [a for a in (ad_id_from_url(u) for u in mobile_urls) if a]
+            # nothing to match against: don't spend a request on the search page
+            if ad_ids:
+                search_listings = parse_search_listings(found_searches[0], ad_ids)
+        # Process each mobile.de URL separately
+        for url in mobile_urls:
+            print(f"DEBUG: Parsing URL {url} from message {msg.uid}")
+            pending = []
+            listing, failure = _listing_for(url, source, email_listings.get(listing_key(url)), search_listings,
+                                            pending=pending)
+            if not listing:
+                if failure and failure['retryable'] and current_app.config.get('SCRAPE_RETRY_ENABLED'):
+                    # the message is still marked seen: the retry queue owns this URL now
+                    _enqueue_retry(user.id, url, msg.uid, msg.subject, failure['error'])
+                    print(f"DEBUG: Queued {url} for retry: {failure['error']}")
+                else:
+                    print(f"DEBUG: Skipping URL {url}, failed parsing")
+                continue
+            posted = _post_listing(user, settings, url, listing, msg.uid, msg.subject, openai_key, bot_token)
+            for future in pending if posted else []:
+                _follow_up_when_ready(settings, bot_token, url, future)
+            if pause:
+                time.sleep(pause)  # Rate limit prevention
+    # mark seen
+    session.mark_seen(msg.uid)
+
+
+def _process_messages(user: User, settings, session: MailBackend, messages, openai_key: str, bot_token: str, pause: float = 0, advance_mark: bool = True):
+    """Process messages in order, moving the sync mark past each handled one.
+
+    ``messages`` may be a generator; each message is released once handled.
+    The mark also moves past messages that failed with an error (the error is
+    kept in the posting log), so a broken message is not retried forever.
+    """
+    for msg in messages:
+        try:
+            _process_message(user, settings, session, msg, openai_key, bot_token, pause=pause)
+        except Exception:
+            traceback.print_exc()
+            db.session.rollback()
+            log = PostingLog(user_id=user.id, gmail_message_id=getattr(msg, 'uid', None), subject=getattr(msg, 'subject', None), error=traceback.format_exc())
+            db.session.add(log)
+            db.session.commit()
+        finally:
+            msg.close()
+        if advance_mark and session.message_done(msg):
+            _save_sync_state(settings)
+    if advance_mark and session.sync_done():
+        _save_sync_state(settings)
 
 
 def process_user_inbox(user: User):
@@ -42,14 +399,14 @@ def process_user_inbox(user: User):
         return
 
     master_key = current_app.config.get('MASTER_SECRET_KEY')
-    gmail_pwd = decrypt_secret(settings.gmail_app_password_encrypted, master_key) if settings.gmail_app_password_encrypted else None
     openai_key = decrypt_secret(settings.openai_api_key_encrypted, master_key) if settings.openai_api_key_encrypted else None
     bot_token = decrypt_secret(settings.telegram_bot_token_encrypted, master_key) if settings.telegram_bot_token_encrypted else None
 
     # attach decrypted attrs for client use
-    settings.gmail_app_password_decrypted = gmail_pwd
+    _decrypt_mail_credentials(settings, master_key)
+    session = open_mail_session(settings, current_app.config)
 
-    if not (settings.gmail_address and gmail_pwd and openai_key and bot_token and settings.telegram_channel_username):
+    if not (session.configured and openai_key and bot_token and settings.telegram_channel_username):
         return
 
     # ensure channel id
@@ -61,85 +418,24 @@ def process_user_inbox(user: User):
     except Exception:
         pass
 
-    messages = fetch_new_messages(settings)
-    for msg in messages:
-        try:
-            body = (msg.text_body or '') + '\n' + (msg.html_body or '')
-
-            # Filter only mobile.de-related messages
-            if 'mobile.de' not in (msg.from_addr or '').lower() and 'mobile.de' not in body.lower():
-                # Skip non-mobile.de messages
-                mark_message_seen(settings, msg.uid)
-                continue
-
-            # Filter only mobile.de-related messages/URLs
-            urls = extract_urls(body)
-            mobile_urls = list(set([u for u in urls if 'mobile.de' in u and not any(ext in u.lower() for ext in ['.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.webp'])]))
-
-            if not mobile_urls:
-                # Fallback to old parsing if no URLs
-                raw = {
-                    'title': msg.subject or 'Car listing',
-                    'price': None,
-                    'mileage': None,
-                    'year': None,
-                    'fuel': None,
-                    'gearbox': None,
-                    'description': body,
-                    'url': ''
-                }
-                photos = [a['content'] for a in msg.attachments if a.get('filename') and a['filename'].lower().endswith(('.jpg', '.jpeg', '.png', '.gif'))][:10] if msg.attachments else []
-                text = generate_listing_text(raw, settings.language or 'uk', settings.price_markup_eur or 0, openai_key)
-                ok, err = send_car_post(settings, bot_token, text, photos)
-                log = PostingLog(user_id=user.id, gmail_message_id=msg.uid, subject=msg.subject, car_title=raw['title'], raw_price=str(raw.get('price')), final_price=str(settings.price_markup_eur or ''), sent_to_channel=bool(ok), sent_at=(datetime.utcnow() if ok else None), error=(err if not ok else None))
-                db.session.add(log)
-                db.session.commit()
-            else:
-                # Process each mobile.de URL separately
-                for url in mobile_urls:
-                    listing = parse_mobile_de(url)
-                    if not listing or not listing.get('photos'):
-                        continue
-                    if listing:
-                        raw = {
-                            'title': listing['title'],
-                            'price': listing.get('price'),
-                            'mileage': listing.get('mileage'),
-                            'year': listing.get('year'),
-                            'fuel': listing.get('fuel'),
-                            'gearbox': listing.get('gearbox'),
-                            'description': listing['description'],
-                            'url': url,
-                            'specs': listing.get('specs') or {}
-                        }
-                        photos = listing['photos']
-                        text = generate_listing_text(raw, settings.language or 'uk', settings.price_markup_eur or 0, openai_key)
-                        ok, err = send_car_post(settings, bot_token, text, photos)
-                        log = PostingLog(user_id=user.id, gmail_message_id=msg.uid, subject=msg.subject, car_title=raw['title'], raw_price=str(raw.get('price')), final_price=str(settings.price_markup_eur or ''), sent_to_channel=bool(ok), sent_at=(datetime.utcnow() if ok else None), error=(err if not ok else None))
-                        db.session.add(log)
-                        db.session.commit()
-            # mark seen
-            mark_message_seen(settings, msg.uid)
-        except Exception:
-            traceback.print_exc()
-            log = PostingLog(user_id=user.id, gmail_message_id=getattr(msg, 'uid', None), subject=getattr(msg, 'subject', None), error=traceback.format_exc())
-            db.session.add(log)
-            db.session.commit()
+    with session:
+        _process_messages(user, settings, session, _iter_synced(settings, session), openai_key, bot_token)
 
 
 def process_user_inbox_once(user: User, messages=None):
     """Process inbox for a user once regardless of their auto_post_enabled flag (used for manual checks)."""
     settings = user.settings
     master_key = current_app.config.get('MASTER_SECRET_KEY')
-    gmail_pwd = settings.gmail_app_password_decrypted if hasattr(settings, 'gmail_app_password_decrypted') and settings.gmail_app_password_decrypted else decrypt_secret(settings.gmail_app_password_encrypted, master_key) if settings and settings.gmail_app_password_encrypted else None
     openai_key = settings.openai_api_key_decrypted if hasattr(settings, 'openai_api_key_decrypted') and settings.openai_api_key_decrypted else decrypt_secret(settings.openai_api_key_encrypted, master_key) if settings and settings.openai_api_key_encrypted else None
     bot_token = settings.telegram_bot_token_decrypted if hasattr(settings, 'telegram_bot_token_decrypted') and settings.telegram_bot_token_decrypted else decrypt_secret(settings.telegram_bot_token_encrypted, master_key) if settings and settings.telegram_bot_token_encrypted else None
 
+    if not settings:
+        return
     # attach decrypted attrs for client use
-    if settings:
-        settings.gmail_app_password_decrypted = gmail_pwd
+    _decrypt_mail_credentials(settings, master_key, keep_existing=True)
+    session = open_mail_session(settings, current_app.config)
 
-    if not (settings and settings.gmail_address and gmail_pwd and openai_key and bot_token and settings.telegram_channel_username):
+    if not (session.configured and openai_key and bot_token and settings.telegram_channel_username):
         return
 
     try:
@@ -151,85 +447,15 @@ def process_user_inbox_once(user: User, messages=None):
     except Exception:
         pass
 
-    if messages is None:
-        messages = fetch_new_messages(settings)
-    print(f"DEBUG: Processing {len(messages)} messages")
-    for msg in messages:
-        try:
-            print(f"DEBUG: Processing message UID {msg.uid}, Subject: {msg.subject}")
-            body = (msg.text_body or '') + '\n' + (msg.html_body or '')
-
-            # Filter only mobile.de-related messages
-            if 'mobile.de' not in (msg.from_addr or '').lower() and 'mobile.de' not in body.lower():
-                # Skip non-mobile.de messages
-                print(f"DEBUG: Skipping non-mobile.de message {msg.uid}")
-                mark_message_seen(settings, msg.uid)
-                continue
-
-            # Filter only mobile.de-related messages/URLs
-            urls = extract_urls(body)
-            mobile_urls = list(set([u for u in urls if 'mobile.de' in u and not any(ext in u.lower() for ext in ['.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.webp'])]))
-            print(f"DEBUG: Found {len(mobile_urls)} mobile.de URLs in message {msg.uid}")
-
-            if not mobile_urls:
-                # Fallback to old parsing if no URLs
-                print(f"DEBUG: No URLs found, using fallback parsing for {msg.uid}")
-                raw = {
-                    'title': msg.subject or 'Car listing',
-                    'price': None,
-                    'mileage': None,
-                    'year': None,
-                    'fuel': None,
-                    'gearbox': None,
-                    'description': body,
-                    'url': ''
-                }
-                photos = [a['content'] for a in msg.attachments if a.get('filename') and a['filename'].lower().endswith(('.jpg', '.jpeg', '.png', '.gif'))][:10] if msg.attachments else []
-                text = generate_listing_text(raw, settings.language or 'uk', settings.price_markup_eur or 0, openai_key)
-                ok, err = send_car_post(settings, bot_token, text, photos)
-                print(f"DEBUG: Sent fallback post for {msg.uid}, success: {ok}, error: {err}")
-                log = PostingLog(user_id=user.id, gmail_message_id=msg.uid, subject=msg.subject, car_title=raw['title'], raw_price=str(raw.get('price')), final_price=str(settings.price_markup_eur or ''), sent_to_channel=bool(ok), sent_at=(datetime.utcnow() if ok else None), error=(err if not ok else None))
-                db.session.add(log)
-                db.session.commit()
-                time.sleep(1)  # Rate limit prevention
-            else:
-                # Process each mobile.de URL separately
-                for url in mobile_urls:
-                    print(f"DEBUG: Parsing URL {url} from message {msg.uid}")
-                    listing = parse_mobile_de(url)
-                    if not listing or not listing.get('photos'):
-                        print(f"DEBUG: Skipping URL {url}, no photos or failed parsing")
-                        continue
-                    if listing:
-                        print(f"DEBUG: Parsed listing: {listing['title']}")
-                        raw = {
-                            'title': listing['title'],
-                            'price': listing.get('price'),
-                            'mileage': listing.get('mileage'),
-                            'year': listing.get('year'),
-                            'fuel': listing.get('fuel'),
-                            'gearbox': listing.get('gearbox'),
-                            'description': listing['description'],
-                            'url': url,
-                            'specs': listing.get('specs') or {}
-                        }
-                        photos = listing['photos']
-                        text = generate_listing_text(raw, settings.language or 'uk', settings.price_markup_eur or 0, openai_key)
-                        ok, err = send_car_post(settings, bot_token, text, photos)
-                        print(f"DEBUG: Sent post for {url}, success: {ok}, error: {err}")
-                        log = PostingLog(user_id=user.id, gmail_message_id=msg.uid, subject=msg.subject, car_title=raw['title'], raw_price=str(raw.get('price')), final_price=str(settings.price_markup_eur or ''), sent_to_channel=bool(ok), sent_at=(datetime.utcnow() if ok else None), error=(err if not ok else None))
-                        db.session.add(log)
-                        db.session.commit()
-                        time.sleep(1)  # Rate limit prevention
-                    else:
-                        print(f"DEBUG: Failed to parse listing from {url}")
-            # mark seen
-            mark_message_seen(settings, msg.uid)
-        except Exception:
-            traceback.print_exc()
-            log = PostingLog(user_id=user.id, gmail_message_id=getattr(msg, 'uid', None), subject=getattr(msg, 'subject', None), error=traceback.format_exc())
-            db.session.add(log)
-            db.session.commit()
+    # Messages handed in explicitly (e.g. re-testing old mail) are not part of
+    # the incremental sync and must not move the sync mark.
+    advance_mark = messages is None
+    with session:
+        if messages is None:
+            messages = _iter_synced(settings, session)
+        else:
+            print(f"DEBUG: Processing {len(messages)} messages")
+        _process_messages(user, settings, session, messages, openai_key, bot_token, pause=1, advance_mark=advance_mark)
 
 
 def check_all_inboxes(app=None):
@@ -239,26 +465,35 @@ def check_all_inboxes(app=None):
             users = User.query.all()
             for u in users:
                 try:
-                    process_user_inbox(u)
+                    with inbox_lock(u.id):
+                        process_user_inbox(u)
                 except Exception:
                     pass
-def check_inbox_for_user_id(user_id: int, app=None):
-    """Run a one-off inbox processing for a single user id inside an app context (safe to call from scheduler). Uses the 'once' processor so manual checks run regardless of auto_post flag."""
-    if app is not None:
+            limiter_stats = default_limiter.stats()
+            if limiter_stats:
+                print(f"DEBUG: scrape rate limiter {limiter_stats}")
+
+
+def process_inbox_for_user_id(user_id: int, app):
+    """Run the regular (auto-post) inbox processing for one user, e.g. when IMAP IDLE reports new mail."""
+    with inbox_lock(user_id):
         with app.app_context():
             u = User.query.get(user_id)
             if u:
-                try:
-                    process_user_inbox_once(u)
-                except Exception:
-                    pass
-    else:
+                process_user_inbox(u)
+            db.session.remove()
+
+
+def check_inbox_for_user_id(user_id: int, app=None):
+    """Run a one-off inbox processing for a single user id inside an app context (safe to call from scheduler). Uses the 'once' processor so manual checks run regardless of auto_post flag."""
+    if app is None:
         from flask import current_app
-        with current_app.app_context():
+        app = current_app._get_current_object()
+    with inbox_lock(user_id):
+        with app.app_context():
             u = User.query.get(user_id)
             if u:
                 try:
                     process_user_inbox_once(u)
                 except Exception:
                     pass
-
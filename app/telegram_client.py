@@ -1,17 +1,53 @@
+import hashlib
+import logging
 import requests
 import json
+import re
+from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+
+from .config import Config
+
+# "Bad Request: failed to send message #3 with the error message ..."
+_REJECTED_ITEM_RE = re.compile(r"message #(\d+)")
+# errors for a photo URL Telegram could not download, or a file_id it no longer accepts
+_MEDIA_ERRORS = ('wrong file identifier/http url', 'failed to get http url content', 'webpage_curl_failed',
+                 'webpage_media_empty', 'wrong type of the web page content', 'wrong remote file identifier',
+                 'file_reference_expired', 'wrong file_id')
+# Bot API limits, in UTF-16 code units
+TELEGRAM_CAPTION_LIMIT = 1024
+TELEGRAM_MESSAGE_LIMIT = 4096
+# (connect, read) timeouts in seconds; photo methods upload the bytes or
+# wait while Telegram downloads the URLs itself, so they get a longer read
+TELEGRAM_TIMEOUT = (5, 30)
+TELEGRAM_MEDIA_TIMEOUT = (5, 120)
+_MEDIA_METHODS = ('sendPhoto', 'sendMediaGroup')
+
+logger = logging.getLogger(__name__)
+
+# one keep-alive connection pool for every Bot API call
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=8))
+_session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=8))
+
+
+class TelegramApiError(Exception):
+    def __init__(self, description: str):
+        super().__init__(f"Telegram API error: {description}")
+        self.description = description
 
 
 def _telegram_api_call(token: str, method: str, **kwargs):
-    url = f"https://api.telegram.org/bot{token}/{method}"
+    url = f"{Config.TELEGRAM_API_BASE_URL}/bot{token}/{method}"
+    timeout = TELEGRAM_MEDIA_TIMEOUT if method in _MEDIA_METHODS else TELEGRAM_TIMEOUT
     if 'data' in kwargs:
-        response = requests.post(url, data=kwargs['data'], files=kwargs.get('files'))
+        response = _session.post(url, data=kwargs['data'], files=kwargs.get('files'), timeout=timeout)
     else:
-        response = requests.get(url, params=kwargs)
+        response = _session.get(url, params=kwargs, timeout=timeout)
     if response.status_code == 200:
         return response.json()
     else:
-        raise Exception(f"Telegram API error: {response.text}")
+        raise TelegramApiError(response.text)
 
 
 def ensure_channel_id(user_settings, bot_token: str):
@@ -29,26 +65,246 @@ def ensure_channel_id(user_settings, bot_token: str):
     return None
 
 
-def send_car_post(user_settings, bot_token: str, text: str, photos: list):
+def _utf16_len(text: str) -> int:
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _split_text(text: str, limit: int):
+    """(head, rest): head fits ``limit``, cut at a paragraph, line or word break if possible."""
+    if _utf16_len(text) <= limit:
+        return text, ''
+    units, end = 0, 0
+    for end, ch in enumerate(text):
+        units += 2 if ord(ch) > 0xFFFF else 1
+        if units > limit:
+            break
+    head = text[:end]
+    for sep in ('\n\n', '\n', ' '):
+        cut = head.rfind(sep)
+        if cut > limit // 2:
+            return text[:cut].rstrip(), text[cut:].lstrip()
+    return head, text[end:]
+
+
+def _send_text(bot_token: str, chat_id, text: str):
+    """sendMessage, split into several messages if the text is over Telegram's limit."""
+    while text:
+        chunk, text = _split_text(text, TELEGRAM_MESSAGE_LIMIT)
+        _telegram_api_call(bot_token, 'sendMessage', chat_id=chat_id, text=chunk)
+
+
+def _send_media_group(bot_token: str, chat_id, items: list, caption: str = None):
+    """Album of photos; each item is either an http(s) URL or image bytes.
+
+    ``caption`` goes on the first photo, which Telegram shows as the album caption.
+    """
+    if len(items) == 1:
+        # sendMediaGroup needs 2-10 items
+        data = {'chat_id': chat_id}
+        if caption:
+            data['caption'] = caption
+        if isinstance(items[0], str):
+            return _telegram_api_call(bot_token, 'sendPhoto', data=dict(data, photo=items[0]))
+        return _telegram_api_call(bot_token, 'sendPhoto', data=data,
+                                  files={'photo': ('photo.jpg', items[0], 'image/jpeg')})
+    media = []
+    files = {}
+    for i, item in enumerate(items):
+        if isinstance(item, str):
+            media.append({'type': 'photo', 'media': item})
+        else:
+            media.append({'type': 'photo', 'media': f'attach://photo{i}'})
+            files[f'photo{i}'] = ('photo.jpg', item, 'image/jpeg')
+    if caption:
+        media[0]['caption'] = caption
+    data = {'chat_id': chat_id, 'media': json.dumps(media)}
+    return _telegram_api_call(bot_token, 'sendMediaGroup', data=data, files=files or None)
+
+
+def _album_message_file_id(message: dict):
+    sizes = message.get('photo') or []
+    return sizes[-1]['file_id'] if sizes else None
+
+
+def _media_key(item) -> str:
+    """Cache key of a photo: sha256 of its bytes, or of its URL for by-URL photos."""
+    if isinstance(item, str):
+        item = ('url:' + item).encode('utf-8')
+    return hashlib.sha256(item).hexdigest()
+
+
+def _rejected_items(description: str, items: list) -> list:
+    match = _REJECTED_ITEM_RE.search(description)
+    if match:
+        # the named item is the culprit; an uploaded one cannot be retried
+        idx = int(match.group(1)) - 1
+        return [idx] if 0 <= idx < len(items) and isinstance(items[idx], str) else []
+    if any(err in description for err in _MEDIA_ERRORS):
+        # no item index: retry every item that is still a URL or file_id
+        return [i for i, item in enumerate(items) if isinstance(item, str)]
+    return []
+
+
+def _send_album(bot_token: str, chat_id, sources: list, fetch_photos=None, store=None, caption: str = None):
+    """
+    Send photos (bytes or URLs) as an album, reusing cached Telegram file_ids.
+
+    Photos already sent by this bot go as their cached file_id. If Telegram
+    rejects an item ("message #N" in the error), a stale file_id is evicted
+    and its photo re-sent from the source; a URL Telegram cannot fetch is
+    downloaded with ``fetch_photos(urls) -> [bytes | None]`` and uploaded,
+    or dropped if that fails too. New file_ids are stored afterwards.
+    ``caption`` stays on whichever photo ends up first; if every photo is
+    dropped it is sent as a plain message instead.
+    Returns how many URL photos had to be uploaded as bytes.
+    """
+    bot_id = bot_token.split(':', 1)[0]
+    keys = [_media_key(s) for s in sources]
+    cached = store.get_many(bot_id, keys) if store is not None else {}
+    items = [cached.get(k, s) for k, s in zip(keys, sources)]
+    uploaded = 0
+    for _ in range(2 * len(items) + 1):
+        if not items:
+            if caption:
+                _send_text(bot_token, chat_id, caption)
+            return uploaded
+        try:
+            result = _send_media_group(bot_token, chat_id, items, caption=caption)
+            break
+        except TelegramApiError as e:
+            rejected = _rejected_items(e.description.lower(), items)
+            if not rejected:
+                raise
+            for i in rejected:
+                if keys[i] in cached and items[i] == cached[keys[i]]:
+                    del cached[keys[i]]
+                    store.evict(bot_id, keys[i])
+                    items[i] = sources[i]
+                elif fetch_photos is not None:
+                    items[i] = fetch_photos([items[i]])[0]
+                    uploaded += 1 if items[i] else 0
+                else:
+                    raise
+            kept = [i for i, item in enumerate(items) if item]
+            items, keys, sources = [items[i] for i in kept], [keys[i] for i in kept], [sources[i] for i in kept]
+    else:
+        raise TelegramApiError('sendMediaGroup kept rejecting photos')
+
+    if store is not None:
+        messages = result.get('result') or []
+        messages = messages if isinstance(messages, list) else [messages]
+        fresh = {}
+        for key, item, message in zip(keys, items, messages):
+            file_id = _album_message_file_id(message)
+            if file_id and cached.get(key) != item:
+                fresh[key] = file_id
+        if fresh:
+            store.put_many(bot_id, fresh)
+    return uploaded
+
+
+class DbFileIdStore:
+    """
+    Postgres cache of Telegram file_ids (table telegram_file_ids), keyed by
+    bot id and photo content hash, so a photo posted again (another user's
+    channel, a repost) is not uploaded again.
+
+    Works only inside a Flask app context with TELEGRAM_FILE_ID_CACHE on;
+    entries older than ``ttl_days`` are ignored and Telegram-rejected ones
+    are deleted. Any DB error just skips the cache for that call.
+
+    Every call runs in its own session and transaction, so it never commits
+    or rolls back whatever the caller has pending in ``db.session``.
+    """
+
+    def __init__(self, ttl_days: int = 30):
+        self.ttl_days = ttl_days
+        self.hits = 0
+
+    @staticmethod
+    def _enabled() -> bool:
+        from flask import current_app, has_app_context
+        return has_app_context() and bool(current_app.config.get('TELEGRAM_FILE_ID_CACHE'))
+
+    @staticmethod
+    def _session():
+        from sqlalchemy.orm import Session
+        from .extensions import db
+        return Session(db.engine)
+
+    def get_many(self, bot_id: str, keys: list) -> dict:
+        if not keys or not self._enabled():
+            return {}
+        from .models import TelegramFileId
+        cutoff = datetime.utcnow() - timedelta(days=self.ttl_days)
+        try:
+            with self._session() as session:
+                rows = session.query(TelegramFileId.content_hash, TelegramFileId.file_id).filter(
+                    TelegramFileId.bot_id == int(bot_id),
+                    TelegramFileId.content_hash.in_(keys),
+                    TelegramFileId.created_at >= cutoff).all()
+        except Exception as e:
+            logger.warning("telegram_file_ids lookup failed: %s", e)
+            return {}
+        self.hits += len(rows)
+        return {content_hash: file_id for content_hash, file_id in rows}
+
+    def put_many(self, bot_id: str, file_ids: dict):
+        if not self._enabled():
+            return
+        from .models import TelegramFileId
+        try:
+            with self._session() as session, session.begin():
+                for key, file_id in file_ids.items():
+                    session.merge(TelegramFileId(bot_id=int(bot_id), content_hash=key, file_id=file_id,
+                                                 created_at=datetime.utcnow()))
+        except Exception as e:
+            logger.warning("telegram_file_ids write failed: %s", e)
+
+    def evict(self, bot_id: str, key: str):
+        if not self._enabled():
+            return
+        from .models import TelegramFileId
+        try:
+            with self._session() as session, session.begin():
+                session.query(TelegramFileId).filter_by(bot_id=int(bot_id), content_hash=key).delete()
+        except Exception as e:
+            logger.warning("telegram_file_ids evict failed: %s", e)
+
+
+file_id_store = DbFileIdStore(ttl_days=Config.TELEGRAM_FILE_ID_TTL_DAYS)
+
+
+def send_car_post(user_settings, bot_token: str, text: str, photos: list, photo_urls: list = None, fetch_photos=None):
+    """Send the album and the text.
+
+    With ``photo_urls`` (and ``fetch_photos`` for the fallback) the album is
+    sent by URL and only photos Telegram rejects are uploaded as bytes;
+    otherwise ``photos`` bytes are uploaded. With TELEGRAM_ALBUM_CAPTION the
+    text is the album caption, so a post is one API call; text over the
+    caption limit continues in a follow-up message. Without it the text is
+    always a separate message after the album.
+    """
     chat_id = user_settings.telegram_channel_id or user_settings.telegram_channel_username
     if not chat_id:
         return False, "No chat ID or username"
+    if (photo_urls and fetch_photos is not None or photos) and Config.TELEGRAM_ALBUM_CAPTION:
+        caption, rest = _split_text(text, TELEGRAM_CAPTION_LIMIT)
+    else:
+        caption, rest = None, text
     try:
-        if photos:
+        if photo_urls and fetch_photos is not None:
+            uploaded = _send_album(bot_token, chat_id, photo_urls[:10], fetch_photos, store=file_id_store,
+                                   caption=caption)
+            if uploaded:
+                print(f"DEBUG: {uploaded}/{len(photo_urls[:10])} photos rejected by URL, uploaded as bytes")
+        elif photos:
             # Limit to 10 photos
             photos = photos[:10]
             # Send media group (album)
-            media = []
-            files = {}
-            for i, photo_data in enumerate(photos):
-                media.append({'type': 'photo', 'media': f'attach://photo{i}'})
-                files[f'photo{i}'] = ('photo.jpg', photo_data, 'image/jpeg')
-            data = {'chat_id': chat_id, 'media': json.dumps(media)}
-            _telegram_api_call(bot_token, 'sendMediaGroup', data=data, files=files)
-            # Then send text message
-            _telegram_api_call(bot_token, 'sendMessage', chat_id=chat_id, text=text)
-        else:
-            _telegram_api_call(bot_token, 'sendMessage', chat_id=chat_id, text=text)
+            _send_album(bot_token, chat_id, photos, store=file_id_store, caption=caption)
+        if rest:
+            _send_text(bot_token, chat_id, rest)
         return True, None
     except Exception as e:
         return False, str(e)
@@ -0,0 +1,126 @@
+# app/utils/email_listing.py
+
+import re
+from typing import Dict, List, Optional
+
+from bs4 import BeautifulSoup
+
+from app.utils.listing_extractor import build_listing, image_urls, parse_int
+from app.utils.mobile_urls import DETAILS, REDIRECT, classify_url
+
+# звідки брати дані оголошення (UserSettings.listing_source)
+LISTING_SOURCES = ("website", "email", "hybrid")
+
+_PRICE_RE = re.compile(r"\b(\d{1,3}(?:[.\u00a0]\d{3})+|\d+)\s*€")
+_YEAR_RE = re.compile(r"\b(?:EZ\s*)?(\d{2}/\d{4})\b")
+_MILEAGE_RE = re.compile(r"\b(\d{1,3}(?:[.\u00a0]\d{3})+|\d+)\s*km\b")
+_POWER_RE = re.compile(r"(\d+)\s*kW")
+_FUELS = ("Benzin", "Diesel", "Elektro", "Hybrid (Benzin/Elektro)", "Hybrid (Diesel/Elektro)", "Hybrid",
+          "Autogas (LPG)", "Erdgas (CNG)", "Wasserstoff")
+_GEARBOXES = ("Automatik", "Schaltgetriebe", "Halbautomatik")
+# логотипи, іконки соцмереж, трекінгові пікселі
+_SKIP_IMG_RE = re.compile(r"logo|icon|pixel|spacer|badge|app-?store|google-?play", re.I)
+
+
+def listing_key(url: str) -> str:
+    """Ключ оголошення з листа: ad id для прямих посилань, інакше сам URL."""
+    url = url.strip()
+    kind, ad_id = classify_url(url)
+    return ad_id if kind == DETAILS else url
+
+
+def _card(link):
+    """
+    Картка оголошення: найбільший предок посилання, у якому рівно одна ціна.
+    У mobile.de фото і заголовок картки часто ведуть на різні трекінгові
+    URL у різних комірках, тому картку визначаємо за ціною, а не за посиланням.
+    """
+    card, node = None, link
+    for _ in range(12):
+        node = node.parent
+        if node is None or node.name in ("body", "html", "[document]"):
+            break
+        prices = len(_PRICE_RE.findall(node.get_text(" ", strip=True)))
+        if prices > 1:
+            break
+        if prices == 1:
+            card = node
+    return card
+
+
+def _title(links, card) -> str:
+    """Текст посилання на оголошення, інакше перший заголовок/жирний текст картки."""
+    for el in links + card.find_all(["h1", "h2", "h3", "strong", "b"]):
+        text = el.get_text(" ", strip=True)
+        if text and "€" not in text and not _PRICE_RE.fullmatch(text) and len(text) > 3:
+            return text
+    return ""
+
+
+def _teaser(card) -> Optional[str]:
+    for img in card.find_all("img"):
+        src = img.get("src") or img.get("data-src") or ""
+        width = parse_int(img.get("width"))
+        if src.startswith(("http", "//")) and not _SKIP_IMG_RE.search(src) and not (width and width < 60):
+            return image_urls(src)[0]
+    return None
+
+
+def extract_email_listings(html: str) -> Dict[str, dict]:
+    """
+    Оголошення прямо з HTML листа збереженого пошуку mobile.de, без
+    запитів на сайт: ``{listing_key(url): listing}`` з тими самими ключами,
+    що й extract_listing (title, price, year, mileage, fuel, gearbox,
+    power_kw, description, specs, photo_urls — тут лише тизер).
+    """
+    soup = BeautifulSoup(html or "", "html.parser")
+    cards = {}
+    for a in soup.find_all("a", href=True):
+        kind, _ = classify_url(a["href"].strip())
+        if kind not in (DETAILS, REDIRECT):
+            continue
+        card = _card(a)
+        if card is not None:
+            _, links, keys = cards.setdefault(id(card), (card, [], []))
+            links.append(a)
+            keys.append(listing_key(a["href"]))
+
+    listings = {}
+    for card, links, keys in cards.values():
+        text = card.get_text(" ", strip=True)
+        price = _PRICE_RE.search(text)
+        year = _YEAR_RE.search(text)
+        mileage = _MILEAGE_RE.search(text)
+        power = _POWER_RE.search(text)
+        fuel = next((f for f in _FUELS if f in text), None)
+        gearbox = next((g for g in _GEARBOXES if g in text), None)
+        specs = {label: value for label, value in (
+            ("Erstzulassung", year.group(1) if year else None),
+            ("Kilometerstand", f"{mileage.group(1)} km" if mileage else None),
+            ("Kraftstoffart", fuel),
+            ("Getriebeart", gearbox),
+            ("Leistung", f"{power.group(1)} kW" if power else None),
+        ) if value}
+        title = _title(links, card)
+        if not title:
+            continue
+        teaser = _teaser(card)
+        listing = build_listing(title, parse_int(price.group(1)) if price else None, specs, "",
+                                [teaser] if teaser else [])
+        # усі посилання картки ведуть на те саме оголошення
+        for key in keys:
+            listings.setdefault(key, listing)
+    return listings
+
+
+def unique_listing_urls(urls: List[str], listings: Dict[str, dict]) -> List[str]:
+    """Лишає по одному URL на картку листа (решта — інші посилання тієї ж картки)."""
+    seen, unique = set(), []
+    for url in urls:
+        listing = listings.get(listing_key(url))
+        if listing is not None:
+            if id(listing) in seen:
+                continue
+            seen.add(id(listing))
+        unique.append(url)
+    return unique
@@ -0,0 +1,86 @@
+# app/utils/image_pipeline.py
+
+import io
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from app.config import Config
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # без Pillow фото йдуть у Telegram як є
+    Image = ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+
+class ImageNormalizer:
+    """
+    Готує фото оголошення до завантаження в Telegram.
+
+    - декодує будь-який формат, розвертає за EXIF-орієнтацією;
+    - зменшує до ``max_side`` пікселів по довшій стороні (Telegram і так
+      показує фото не більше 1280 px);
+    - прибирає метадані (EXIF, ICC, коментарі) і кодує як progressive JPEG
+      з якістю ``quality``, тож підпис photo.jpg / image/jpeg стає правдою;
+    - працює в пулі потоків: Pillow відпускає GIL під час декодування,
+      масштабування і кодування, тому мережеві потоки не чекають.
+
+    Фото, яке не вдалося декодувати, повертається без змін; так само JPEG
+    без EXIF, якщо після перекодування він не став би меншим. PNG/WebP і
+    JPEG з EXIF завжди перекодовуються, бо йдуть у Telegram як image/jpeg
+    без метаданих.
+    """
+
+    def __init__(self, max_side: int = 1280, quality: int = 82, max_workers: int = 2):
+        self.max_side = max_side
+        self.quality = quality
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-normalize")
+
+    @property
+    def available(self) -> bool:
+        return Image is not None
+
+    def normalize(self, data: bytes) -> bytes:
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                plain_jpeg = img.format == "JPEG" and not img.info.get("exif")
+                img.draft("RGB", (self.max_side, self.max_side))  # JPEG: декодує одразу зменшеним
+                img = ImageOps.exif_transpose(img)
+                if img.mode in ("RGBA", "LA", "P"):
+                    rgba = img.convert("RGBA")
+                    img = Image.new("RGB", rgba.size, (255, 255, 255))
+                    img.paste(rgba, mask=rgba.getchannel("A"))
+                elif img.mode != "RGB":
+                    img = img.convert("RGB")
+                img.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+                out = io.BytesIO()
+                img.save(out, "JPEG", quality=self.quality, optimize=True, progressive=True)
+            if plain_jpeg and out.tell() >= len(data):
+                return data
+            return out.getvalue()
+        except Exception as exc:
+            logger.debug("Image normalisation failed, keeping original: %s", exc)
+            return data
+
+    def normalize_all(self, photos: List[bytes]) -> Tuple[List[bytes], dict]:
+        """Нормалізує фото паралельно, у тому ж порядку; повертає (фото, статистика)."""
+        bytes_in = sum(len(p) for p in photos)
+        if not photos or not self.available:
+            return list(photos), {"bytes_in": bytes_in, "bytes_out": bytes_in, "seconds": 0.0}
+        started = time.monotonic()
+        result = list(self.executor.map(self.normalize, photos))
+        return result, {
+            "bytes_in": bytes_in,
+            "bytes_out": sum(len(p) for p in result),
+            "seconds": round(time.monotonic() - started, 2),
+        }
+
+
+default_normalizer = ImageNormalizer(
+    max_side=Config.IMAGE_MAX_SIDE,
+    quality=Config.IMAGE_JPEG_QUALITY,
+    max_workers=Config.IMAGE_WORKERS,
+)
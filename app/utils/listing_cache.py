@@ -0,0 +1,177 @@
+# app/utils/listing_cache.py
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Optional, Tuple
+
+from app.utils.ttl_cache import MISSING, TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def _copy(listing: dict) -> dict:
+    """Копія, яку викликач може змінювати, не чіпаючи кеш."""
+    copy = dict(listing)
+    copy["specs"] = dict(listing.get("specs") or {})
+    copy["photos"] = list(listing.get("photos") or [])
+    return copy
+
+
+class ListingCache:
+    """
+    Кеш розпарсених оголошень (dict + байти фото) за ad id mobile.de.
+
+    Два рівні:
+    - пам'ять процесу: TTL LRU на ``max_entries`` оголошень;
+    - опційно диск (``disk_dir``): один файл ``<ad_id>.listing`` на
+      оголошення, спільний для всіх gunicorn-воркерів на хості. Запис
+      атомарний (тимчасовий файл + os.replace), неповний запис читається як
+      промах, TTL — за mtime, понад ``disk_max_entries`` найстаріші записи
+      видаляються.
+
+    ``stats()`` показує, скільки завантажень сторінок і фото кеш заощадив.
+    """
+
+    def __init__(self, ttl: float = 6 * 3600, max_entries: int = 50, disk_dir: Optional[str] = None,
+                 disk_max_entries: int = 1000):
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=max_entries, ttl=ttl)
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self.disk_hits = 0
+        self.saved_photo_bytes = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, ad_id: Optional[str]) -> Optional[dict]:
+        if not ad_id:
+            return None
+        listing = self.memory.get(ad_id)
+        if listing is MISSING:
+            found = self._disk_get(ad_id)
+            if found is None:
+                return None
+            listing, ttl_left = found
+            self.disk_hits += 1
+            # в пам'яті запис живе не довше, ніж лишилось на диску
+            self.memory.set(ad_id, listing, ttl=ttl_left)
+        self.saved_photo_bytes += sum(len(p) for p in listing.get("photos") or [])
+        return _copy(listing)
+
+    def put(self, ad_id: Optional[str], listing: dict):
+        if not ad_id or not listing:
+            return
+        listing = _copy(listing)
+        self.memory.set(ad_id, listing)
+        if self.disk_dir:
+            try:
+                self._disk_put(ad_id, listing)
+            except OSError as exc:
+                logger.warning("Listing cache write failed for %s: %s", ad_id, exc)
+
+    # ---- disk tier ----
+    # Один файл на оголошення: рядок JSON (з розмірами фото), далі байти
+    # фото підряд. Файл пишеться поруч під тимчасовим ім'ям і підміняється
+    # os.replace, тож читач бачить або старий, або новий запис цілком.
+
+    def _path(self, ad_id: str) -> str:
+        return os.path.join(self.disk_dir, f"{ad_id}.listing")
+
+    def _disk_get(self, ad_id: str) -> Optional[Tuple[dict, float]]:
+        """(оголошення, скільки секунд TTL йому лишилось) або None."""
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._path(ad_id), "rb") as f:
+                ttl_left = os.fstat(f.fileno()).st_mtime + self.ttl - time.time()
+                if ttl_left <= 0:
+                    return None
+                data = f.read()
+            header, _, body = data.partition(b"\n")
+            listing = json.loads(header)
+            sizes = listing.pop("photo_sizes")
+        except (OSError, ValueError, KeyError):
+            return None
+        if sum(sizes) != len(body):
+            # обрізаний запис (диск заповнений, чужий файл) — промах
+            return None
+        photos, offset = [], 0
+        for size in sizes:
+            photos.append(body[offset:offset + size])
+            offset += size
+        listing["photos"] = photos
+        return listing, ttl_left
+
+    def _disk_put(self, ad_id: str, listing: dict):
+        meta = {k: v for k, v in listing.items() if k != "photos"}
+        meta["photo_sizes"] = [len(p) for p in listing["photos"]]
+        fd, tmp = tempfile.mkstemp(prefix=f".{ad_id}-", dir=self.disk_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(json.dumps(meta, ensure_ascii=False).encode("utf-8") + b"\n")
+                for photo in listing["photos"]:
+                    f.write(photo)
+            # інший воркер міг записати те саме оголошення паралельно: перемагає останній
+            os.replace(tmp, self._path(ad_id))
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self._puts += 1
+            prune = self._puts % 50 == 0
+        if prune:
+            self._prune()
+
+    def _prune(self):
+        """Видаляє прострочені записи, найстаріші понад ``disk_max_entries`` і покинуті тимчасові файли."""
+        entries = []
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if os.path.isdir(path):
+                # запис старого формату (тека на оголошення)
+                shutil.rmtree(path, ignore_errors=True)
+            elif name.startswith("."):
+                if mtime < cutoff:
+                    self._unlink(path)
+            elif name.endswith(".listing"):
+                entries.append((mtime, path))
+        entries.sort(reverse=True)
+        for i, (mtime, path) in enumerate(entries):
+            if mtime < cutoff or i >= self.disk_max_entries:
+                self._unlink(path)
+
+    @staticmethod
+    def _unlink(path: str):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        stats = self.memory.stats()
+        # промах пам'яті, який знайшовся на диску, — теж заощаджений скрапінг
+        hits = self.memory.hits + self.disk_hits
+        misses = self.memory.misses - self.disk_hits
+        stats.update(
+            disk_hits=self.disk_hits,
+            pages_saved=hits,
+            misses=misses,
+            hit_rate=round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            saved_photo_mb=round(self.saved_photo_bytes / 1024 / 1024, 1),
+        )
+        return stats
@@ -0,0 +1,279 @@
+# app/utils/listing_extractor.py
+
+import json
+import re
+from typing import Iterator, List, Optional
+
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:  # lxml необов'язковий: тоді DOM-шлях іде через BeautifulSoup
+    etree = lxml_html = None
+
+ENGINES = ("structured", "lxml", "soup")
+
+_JSON_LD_RE = re.compile(r"<script[^>]+type=[\"']application/ld\+json[\"'][^>]*>(.*?)</script>", re.S | re.I)
+_NEXT_DATA_RE = re.compile(r"<script[^>]+id=[\"']__NEXT_DATA__[\"'][^>]*>(.*?)</script>", re.S | re.I)
+_APP_STATE_RE = re.compile(r"window\.__INITIAL_STATE__\s*=\s*")
+_TAG_RE = re.compile(r"<[^>]+>")
+_FIRST_NUMBER_RE = re.compile(r"\d+")
+_VEHICLE_TYPES = {"car", "vehicle", "motorcycle", "product"}
+
+if etree is not None:
+    _X_TITLE = etree.XPath("(//h1)[1]")
+    # союз XPath ("a | b")[1] бере перший вузол за порядком у документі, а не
+    # за пріоритетом селектора, тому варіанти перевіряються по черзі
+    _X_PRICE = (etree.XPath("(//*[@data-testid='prime-price'])[1]"), etree.XPath("(//*[@data-testid='price'])[1]"))
+    _X_TECH_ROWS = etree.XPath("//*[@data-testid='vdp-tech-data']//dl")
+    _X_ALL_ROWS = etree.XPath("//dl")
+    _X_DESCRIPTION = (etree.XPath("(//*[@data-testid='description'])[1]"),
+                      etree.XPath("(//section[@id='description'])[1]"))
+    _X_GALLERY_IMGS = etree.XPath("//*[@data-testid='image-gallery']//img")
+    _X_MOBILE_IMGS = etree.XPath("//img[contains(@src, 'mobile.de')]")
+
+
+def parse_int(value) -> Optional[int]:
+    """Число з усіх цифр рядка: "45.000 km" -> 45000; None, якщо цифр немає."""
+    digits = "".join(ch for ch in str(value or "") if ch.isdigit())
+    return int(digits) if digits else None
+
+
+def parse_amount(value) -> Optional[int]:
+    """Ціна з JSON: 12990, "12990.00" або {"amount": ...}."""
+    if isinstance(value, dict):
+        value = value.get("grossAmount") or value.get("amount") or value.get("value")
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(float(str(value)))
+    except (TypeError, ValueError):
+        return parse_int(value)
+
+
+def fields_from_specs(specs: dict) -> dict:
+    """Рік, пробіг, паливо, коробка і потужність з таблиці тех. даних."""
+    fields = {"year": None, "mileage": None, "fuel": None, "gearbox": None, "power_kw": None}
+    for k, v in specs.items():
+        if "Erstzulassung" in k or "year" in k.lower():
+            fields["year"] = v
+        elif "Kilometerstand" in k or "mileage" in k.lower():
+            fields["mileage"] = parse_int(v)
+        elif "Kraftstoffart" in k or "fuel" in k.lower():
+            fields["fuel"] = v
+        elif "Getriebeart" in k or "gearbox" in k.lower():
+            fields["gearbox"] = v
+        elif "Leistung" in k or "power" in k.lower():
+            # "74 kW (101 PS)" -> 74
+            match = _FIRST_NUMBER_RE.search(v or "")
+            fields["power_kw"] = int(match.group()) if match else None
+    return fields
+
+
+def build_listing(title, price, specs, description, photo_urls) -> dict:
+    """Словник оголошення у форматі parse_mobile_de (поля з ``specs``, лише http-фото без дублів)."""
+    listing = {"title": title or "", "price": price}
+    listing.update(fields_from_specs(specs))
+    listing.update({
+        "description": description or "",
+        "specs": specs,
+        "photo_urls": list(dict.fromkeys(u for u in photo_urls if u and u.startswith("http"))),
+    })
+    return listing
+
+
+# ---- structured data (JSON-LD / app state) ----
+
+def json_ld_items(html: str) -> Iterator[dict]:
+    """Усі об'єкти з блоків JSON-LD сторінки, включно з вкладеними в @graph."""
+    for match in _JSON_LD_RE.finditer(html):
+        try:
+            data = json.loads(match.group(1).strip())
+        except ValueError:
+            continue
+        for item in data if isinstance(data, list) else [data]:
+            if isinstance(item, dict):
+                yield item
+                yield from (g for g in item.get("@graph") or [] if isinstance(g, dict))
+
+
+def image_urls(images) -> List[str]:
+    """Абсолютні URL фото з рядка, списку або об'єктів {contentUrl|url|uri|src}."""
+    urls = []
+    for image in images if isinstance(images, list) else [images]:
+        if isinstance(image, dict):
+            image = image.get("contentUrl") or image.get("url") or image.get("uri") or image.get("src")
+        if isinstance(image, str) and image:
+            urls.append("https:" + image if image.startswith("//") else
+                        image if image.startswith("http") else "https://" + image)
+    return urls
+
+
+def _from_json_ld(html: str) -> Optional[dict]:
+    for item in json_ld_items(html):
+        types = item.get("@type")
+        types = [types] if isinstance(types, str) else types or []
+        if not {t.lower() for t in types if isinstance(t, str)} & _VEHICLE_TYPES:
+            continue
+        offers = item.get("offers") or {}
+        if isinstance(offers, list):
+            offers = offers[0] if offers else {}
+        engine = item.get("vehicleEngine") or {}
+        if isinstance(engine, list):
+            engine = engine[0] if engine else {}
+        mileage = item.get("mileageFromOdometer")
+        if isinstance(mileage, dict):
+            mileage = mileage.get("value")
+        power = engine.get("enginePower") or {}
+        if isinstance(power, list):
+            power = next((p for p in power if p.get("unitCode") == "KWT"), power[0] if power else {})
+        power_kw = parse_int(power.get("value")) if isinstance(power, dict) else None
+        if power_kw and isinstance(power, dict) and power.get("unitCode") not in (None, "KWT"):
+            power_kw = round(power_kw * 0.7355)
+        year = item.get("dateVehicleFirstRegistered") or item.get("vehicleModelDate") or item.get("productionDate")
+        fuel = item.get("fuelType") or engine.get("fuelType")
+        gearbox = item.get("vehicleTransmission")
+        specs = {label: str(value) for label, value in (
+            ("Erstzulassung", year), ("Kilometerstand", f"{mileage} km" if mileage else None),
+            ("Kraftstoffart", fuel), ("Getriebeart", gearbox), ("Leistung", f"{power_kw} kW" if power_kw else None),
+        ) if value}
+        return build_listing(item.get("name"), parse_amount(offers.get("price")), specs, item.get("description"),
+                        image_urls(item.get("image")))
+    return None
+
+
+def app_state(html: str):
+    """JSON стану застосунку (__NEXT_DATA__ або window.__INITIAL_STATE__) або None."""
+    match = _NEXT_DATA_RE.search(html)
+    if match:
+        try:
+            return json.loads(match.group(1))
+        except ValueError:
+            pass
+    match = _APP_STATE_RE.search(html)
+    if match:
+        try:
+            return json.JSONDecoder().raw_decode(html, match.end())[0]
+        except ValueError:
+            pass
+    return None
+
+
+def _find_ad(node, depth: int = 0) -> Optional[dict]:
+    """Перший об'єкт стану, схожий на оголошення (title + фото)."""
+    if depth > 12:
+        return None
+    if isinstance(node, dict):
+        if isinstance(node.get("title"), str) and (node.get("galleryImages") or node.get("images")):
+            return node
+        children = node.values()
+    elif isinstance(node, list):
+        children = node
+    else:
+        return None
+    for child in children:
+        found = _find_ad(child, depth + 1)
+        if found is not None:
+            return found
+    return None
+
+
+def _from_app_state(html: str) -> Optional[dict]:
+    ad = _find_ad(app_state(html))
+    if ad is None:
+        return None
+    specs = {}
+    for attr in ad.get("attributes") or []:
+        if isinstance(attr, dict) and attr.get("label") and attr.get("value") is not None:
+            specs[str(attr["label"])] = str(attr["value"])
+    description = ad.get("description") or ad.get("htmlDescription") or ""
+    if "<" in description:
+        description = "\n".join(line.strip() for line in _TAG_RE.sub("\n", description).splitlines() if line.strip())
+    return build_listing(ad["title"], parse_amount(ad.get("price")), specs, description,
+                    image_urls(ad.get("galleryImages") or ad.get("images")))
+
+
+def extract_structured(html: str) -> Optional[dict]:
+    """Дані, які сторінка вже містить у JSON (JSON-LD або стан застосунку)."""
+    for extract in (_from_json_ld, _from_app_state):
+        listing = extract(html)
+        if listing and listing["title"] and (listing["price"] is not None or listing["photo_urls"]):
+            return listing
+    return None
+
+
+# ---- DOM fallbacks (ті самі селектори, що й раніше) ----
+
+def _lx_text(el, sep: str = "") -> str:
+    return sep.join(t.strip() for t in el.itertext() if t.strip())
+
+
+def _lx_first(doc, xpaths) -> list:
+    """Результат першого з ``xpaths``, який щось знайшов (порядок = пріоритет)."""
+    for xpath in xpaths:
+        found = xpath(doc)
+        if found:
+            return found
+    return []
+
+
+def extract_lxml(html: str) -> dict:
+    doc = lxml_html.document_fromstring(html.encode("utf-8"), parser=lxml_html.HTMLParser(encoding="utf-8"))
+    title_el = _X_TITLE(doc)
+    price_el = _lx_first(doc, _X_PRICE)
+    specs = {}
+    for row in _X_TECH_ROWS(doc) or _X_ALL_ROWS(doc):
+        for dt, dd in zip(row.iter("dt"), row.iter("dd")):
+            specs[_lx_text(dt)] = _lx_text(dd)
+    description_el = _lx_first(doc, _X_DESCRIPTION)
+    imgs = _X_GALLERY_IMGS(doc) or _X_MOBILE_IMGS(doc)
+    return build_listing(
+        _lx_text(title_el[0]) if title_el else "",
+        parse_int(_lx_text(price_el[0])) if price_el else None,
+        specs,
+        _lx_text(description_el[0], "\n") if description_el else "",
+        [img.get("src") or img.get("data-src") for img in imgs],
+    )
+
+
+def extract_soup(html: str) -> dict:
+    soup = BeautifulSoup(html, "html.parser")
+    title_el = soup.select_one("h1")
+    price_el = soup.find(attrs={"data-testid": "prime-price"}) or \
+               soup.find(attrs={"data-testid": "price"})
+    specs = {}
+    rows = soup.select("[data-testid='vdp-tech-data'] dl") or soup.select("dl")
+    for row in rows:
+        for dt, dd in zip(row.find_all("dt"), row.find_all("dd")):
+            specs[dt.get_text(strip=True)] = dd.get_text(strip=True)
+    description_el = soup.find(attrs={"data-testid": "description"}) or \
+                     soup.find("section", attrs={"id": "description"})
+    img_tags = soup.select("[data-testid='image-gallery'] img") or \
+               soup.select("img[src*='mobile.de']")
+    return build_listing(
+        title_el.get_text(strip=True) if title_el else "",
+        parse_int(price_el.get_text(strip=True)) if price_el else None,
+        specs,
+        description_el.get_text("\n", strip=True) if description_el else "",
+        [img.get("src") or img.get("data-src") for img in img_tags],
+    )
+
+
+def extract_listing(html: str, engine: str = "auto") -> dict:
+    """
+    Поля оголошення з HTML details-сторінки mobile.de.
+
+    ``auto``: спершу вбудовані JSON-дані, потім lxml (якщо встановлено),
+    інакше BeautifulSoup. Повертає ті самі ключі, що й parse_mobile_de,
+    але з ``photo_urls`` замість завантажених ``photos``, або None, якщо
+    заголовка немає (сторінка-челендж, згода на cookies, порожня сторінка).
+    """
+    if engine in ("auto", "structured"):
+        listing = extract_structured(html)
+        if listing is not None or engine == "structured":
+            return listing
+    if engine == "lxml" or (engine == "auto" and lxml_html is not None):
+        listing = extract_lxml(html)
+    else:
+        listing = extract_soup(html)
+    return listing if listing["title"] else None
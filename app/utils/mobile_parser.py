@@ -1,9 +1,18 @@
 # app/utils/mobile_parser.py
 
 import json
-import requests
-from bs4 import BeautifulSoup
+import threading
+import time
+from typing import Optional
+from app.config import Config
 from app.scrapers.mobile_de_client import MobileDeClient
+from app.scrapers.redirect_resolver import DbRedirectStore, RedirectResolver
+from app.utils.listing_cache import ListingCache
+from app.utils.listing_extractor import extract_listing
+from app.utils.mobile_urls import ad_id_from_url, canonical_details_url
+from app.utils.photo_dedupe import PhotoDeduper, parse_hashes
+from app.utils.photo_fetcher import PhotoFetcher
+from app.utils.ttl_cache import TTLCache
 
 
 HEADERS = {
@@ -23,7 +32,111 @@ HEADERS = {
     "Cache-Control": "max-age=0",
 }
 
-client = MobileDeClient()
+browser_pool = None
+if Config.BROWSER_FALLBACK_ENABLED:
+    from app.scrapers.browser_pool import BrowserPool
+    browser_pool = BrowserPool(
+        size=Config.BROWSER_POOL_SIZE,
+        max_pages=Config.BROWSER_MAX_PAGES,
+        page_timeout=Config.BROWSER_PAGE_TIMEOUT_SECONDS,
+        user_agent=HEADERS["User-Agent"],
+    )
+client = MobileDeClient(browser_pool=browser_pool)
+resolver = RedirectResolver(
+    session=client.session,
+    cache=TTLCache(maxsize=Config.REDIRECT_CACHE_SIZE, ttl=Config.REDIRECT_CACHE_TTL_SECONDS),
+    negative_ttl=Config.REDIRECT_CACHE_NEGATIVE_TTL_SECONDS,
+    store=DbRedirectStore(ttl=Config.REDIRECT_CACHE_TTL_SECONDS, negative_ttl=Config.REDIRECT_CACHE_NEGATIVE_TTL_SECONDS),
+)
+listing_cache = ListingCache(
+    ttl=Config.LISTING_CACHE_TTL_SECONDS,
+    max_entries=Config.LISTING_CACHE_SIZE,
+    disk_dir=Config.LISTING_CACHE_DIR,
+)
+photo_fetcher = PhotoFetcher(
+    max_workers=Config.PHOTO_FETCH_CONCURRENCY,
+    deadline=Config.PHOTO_FETCH_DEADLINE_SECONDS,
+    headers=HEADERS,
+)
+photo_deduper = PhotoDeduper(
+    photo_fetcher,
+    threshold=Config.PHOTO_DEDUPE_THRESHOLD,
+    placeholders=parse_hashes(Config.PHOTO_PLACEHOLDER_HASHES),
+    auto_placeholder_listings=Config.PHOTO_AUTO_PLACEHOLDER_LISTINGS,
+)
+
+
+# причина останнього None з parse_mobile_de у цьому потоці
+_failure = threading.local()
+
+
+def last_failure() -> Optional[dict]:
+    """
+    Чому останній виклик parse_mobile_de у цьому потоці повернув None:
+    ``{"error": str, "retryable": bool}`` або None, якщо він був успішним.
+    ``retryable`` — сторінку не вдалося завантажити (таймаут, 403/429, блок),
+    тобто є сенс спробувати пізніше.
+    """
+    return getattr(_failure, "info", None)
+
+
+def _fail(error: str, retryable: bool = False):
+    _failure.info = {"error": error, "retryable": retryable}
+    return None
+
+
+def dedupe_by_ad_id(urls, resolve=None):
+    """
+    По одному URL на оголошення. Трекінгові посилання розгортаються
+    resolver'ом (результат кешується, parse_mobile_de потім не запитує його
+    знову) і замінюються канонічним details URL; повтори ad id, у тому числі
+    прямих посилань, відкидаються. ``resolve(url) -> bool`` може заборонити
+    розгортання посилання — тоді воно лишається як є.
+    """
+    seen, unique = set(), []
+    for url in urls:
+        ad_id = ad_id_from_url(url)
+        if ad_id is None and (resolve is None or resolve(url)):
+            final = resolver.resolve(url)
+            ad_id = ad_id_from_url(final) if final else None
+            if ad_id:
+                url = canonical_details_url(ad_id)
+        key = ad_id or url
+        if key not in seen:
+            seen.add(key)
+            unique.append(url)
+    return unique
+
+
+def attach_photos(listing: dict, photo_urls: list, listing_key: str) -> bool:
+    """
+    Фото оголошення з галереї ``photo_urls``: паралельно, у порядку галереї,
+    із загальним дедлайном. Дублікати, різні розміри одного фото й логотипи
+    відсіюються за мініатюрами ще до завантаження повних картинок.
+
+    З TELEGRAM_PHOTOS_BY_URL у ``listing`` лягають лише вибрані URL
+    (``photo_urls``, Telegram завантажить їх сам), інакше байти (``photos``).
+    True, якщо галерея повна і оголошення можна кешувати.
+    """
+    started = time.monotonic()
+    if Config.TELEGRAM_PHOTOS_BY_URL:
+        # качаємо лише мініатюри для дедуплікації
+        if Config.PHOTO_DEDUPE_ENABLED:
+            listing["photo_urls"] = photo_deduper.select_unique(photo_urls, limit=10, listing_key=listing_key)
+        else:
+            listing["photo_urls"] = photo_urls[:10]
+        listing["photos"] = []
+        print(f"DEBUG: {len(listing['photo_urls'])} photo URLs selected in {time.monotonic() - started:.1f}s")
+        return True
+    if Config.PHOTO_DEDUPE_ENABLED:
+        photos, expected = photo_deduper.fetch_unique(photo_urls, limit=10, listing_key=listing_key)
+        print(f"DEBUG: photo dedupe {photo_deduper.stats()}")
+    else:
+        photo_urls = photo_urls[:10]
+        photos, expected = photo_fetcher.fetch_all(photo_urls), len(photo_urls)
+    print(f"DEBUG: downloaded {len(photos)}/{expected} photos in {time.monotonic() - started:.1f}s")
+    listing["photos"] = photos
+    return len(photos) == expected
 
 
 def parse_mobile_de(url: str):
@@ -32,111 +145,43 @@ def parse_mobile_de(url: str):
 
     Робить:
     - завантажує HTML сторінки оголошення;
-    - витягує title, price, specs, description, photos з HTML;
+    - витягує title, price, specs, description, photos (listing_extractor:
+      вбудований JSON, інакше lxml / BeautifulSoup);
     - повертає dict або None, якщо не вдалось розпарсити.
     """
 
+    _failure.info = None
     print(f"DEBUG: parse_mobile_de() fetching {url}")
-    try:
-        # First, get the final URL by following redirects
-        resp = requests.get(url, headers=HEADERS, timeout=20, allow_redirects=True)
-    except Exception as e:
-        print("DEBUG: request failed:", e)
-        return None
-
-    final_url = resp.url
+    # Resolve tracking redirects via Location headers only (cached), so the
+    # listing page itself is downloaded once, by the client below
+    final_url = resolver.resolve(url)
     print(f"DEBUG: final url {final_url}")
 
-    if "/fahrzeuge/details.html" not in final_url:
-        print(f"DEBUG: final url is not a details page, skipping: {final_url}")
-        return None
+    if not final_url:
+        print(f"DEBUG: {url} does not lead to a details page, skipping")
+        return _fail("does not lead to a details page")
+
+    # те саме оголошення часто приходить кільком користувачам за хвилини
+    ad_id = ad_id_from_url(final_url)
+    cached = listing_cache.get(ad_id)
+    if cached is not None:
+        print(f"DEBUG: listing {ad_id} served from cache {listing_cache.stats()}")
+        return cached
 
     # Now fetch the HTML using the client with proper headers and session
     html = client.fetch(final_url, referer=url)
     if html is None:
         print(f"DEBUG: failed to fetch HTML for {final_url}")
-        return None
-
-    soup = BeautifulSoup(html, "html.parser")
-
-    # ---- title ----
-    title_el = soup.select_one("h1")
-    title = title_el.get_text(strip=True) if title_el else ""
-
-    # ---- price ----
-    price_el = soup.find(attrs={"data-testid": "prime-price"}) or \
-               soup.find(attrs={"data-testid": "price"})
-    price = None
-    if price_el:
-        txt = price_el.get_text(strip=True)
-        # залишаємо тільки цифри
-        digits = "".join(ch for ch in txt if ch.isdigit())
-        if digits:
-            price = int(digits)
-
-    # ---- technical data block ----
-    specs = {}
-    # приклад – береш конкретний селектор з твоєї сторінки:
-    rows = soup.select("[data-testid='vdp-tech-data'] dl") or \
-           soup.select("dl")  # TODO: замінити на реальний селектор
-    for row in rows:
-        dts = row.find_all("dt")
-        dds = row.find_all("dd")
-        for dt, dd in zip(dts, dds):
-            k = dt.get_text(strip=True)
-            v = dd.get_text(strip=True)
-            specs[k] = v
-
-    # З цих specs можна витягнути рік, пробіг, паливо, коробку – по ключам або regex
-    year = None
-    mileage = None
-    fuel = None
-    gearbox = None
-    power_kw = None
-    for k, v in specs.items():
-        if "Erstzulassung" in k or "year" in k.lower():
-            year = v
-        elif "Kilometerstand" in k or "mileage" in k.lower():
-            digits = "".join(ch for ch in v if ch.isdigit())
-            if digits:
-                mileage = int(digits)
-        elif "Kraftstoffart" in k or "fuel" in k.lower():
-            fuel = v
-        elif "Getriebeart" in k or "gearbox" in k.lower():
-            gearbox = v
-        elif "Leistung" in k or "power" in k.lower():
-            digits = "".join(ch for ch in v if ch.isdigit())
-            if digits:
-                power_kw = int(digits)
-
-    description_el = soup.find(attrs={"data-testid": "description"}) or \
-                     soup.find("section", attrs={"id": "description"})
-    description = description_el.get_text("\n", strip=True) if description_el else ""
+        return _fail(f"failed to fetch {final_url}", retryable=True)
+
+    listing = extract_listing(html)
+    if listing is None:
+        print(f"DEBUG: no listing data found in {final_url}")
+        return _fail(f"no listing data in {final_url}")
 
     # ---- photos ----
-    photos = []
-    img_tags = soup.select("[data-testid='image-gallery'] img") or \
-               soup.select("img[src*='mobile.de']")
-    for img in img_tags[:10]:
-        img_url = img.get("src") or img.get("data-src")
-        if not img_url or not img_url.startswith("http"):
-            continue
-        try:
-            img_resp = requests.get(img_url, headers=HEADERS, timeout=20)
-            if img_resp.status_code == 200:
-                photos.append(img_resp.content)
-        except Exception as e:
-            print("DEBUG: image download error:", e)
-
-    return {
-        "title": title,
-        "price": price,
-        "year": year,
-        "mileage": mileage,
-        "fuel": fuel,
-        "gearbox": gearbox,
-        "power_kw": power_kw,
-        "description": description,
-        "specs": specs,
-        "photos": photos,
-    }
\ No newline at end of file
+    complete = attach_photos(listing, listing.pop("photo_urls"), ad_id or final_url)
+    # неповну галерею (дедлайн, помилки CDN) не кешуємо — наступний раз спробуємо ще
+    if listing["title"] and complete:
+        listing_cache.put(ad_id, listing)
+    return listing
\ No newline at end of file
@@ -0,0 +1,210 @@
+# app/utils/mobile_search.py
+
+import re
+import time
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+from app.config import Config
+from app.utils.listing_extractor import (
+    app_state, build_listing, image_urls, json_ld_items, parse_amount, parse_int,
+)
+from app.utils.mobile_parser import attach_photos, client, listing_cache, parse_mobile_de
+from app.utils.mobile_urls import ad_id_from_url, canonical_details_url
+from app.utils.photo_dedupe import full_size_image
+
+SEARCH_BASE_URL = "https://suchen.mobile.de/"
+
+# короткі ключі атрибутів у стані сторінки пошуку -> підписи з тех. даних
+_ATTR_LABELS = {
+    "fr": "Erstzulassung", "firstRegistration": "Erstzulassung",
+    "ml": "Kilometerstand", "mileage": "Kilometerstand",
+    "ft": "Kraftstoffart", "fuel": "Kraftstoffart",
+    "tr": "Getriebeart", "transmission": "Getriebeart",
+    "pw": "Leistung", "power": "Leistung",
+}
+_AD_ID_RE = re.compile(r"^\d{6,12}$")
+_PRICE_RE = re.compile(r"(\d[\d.\s]*)\s*€")
+_YEAR_RE = re.compile(r"\b(?:EZ\s*)?(\d{2}/\d{4})\b")
+_MILEAGE_RE = re.compile(r"(\d[\d.]*)\s*km\b")
+
+
+def _summary(ad_id, title, price, specs, thumbnail) -> dict:
+    summary = build_listing(title, price, specs, "", [thumbnail] if thumbnail else [])
+    summary.update(ad_id=ad_id, url=canonical_details_url(ad_id), thumbnail=thumbnail)
+    return summary
+
+
+# ---- structured data ----
+
+def _is_result(node: dict) -> bool:
+    ad_id = str(node.get("id") or node.get("adId") or "")
+    return bool(_AD_ID_RE.match(ad_id)) and isinstance(node.get("title"), str) and \
+        ("price" in node or "previewImage" in node or "images" in node)
+
+
+def _walk_results(node, found: Dict[str, dict], depth: int = 0):
+    if depth > 12:
+        return
+    if isinstance(node, dict):
+        if _is_result(node):
+            found.setdefault(str(node.get("id") or node.get("adId")), node)
+            return
+        children = node.values()
+    elif isinstance(node, list):
+        children = node
+    else:
+        return
+    for child in children:
+        _walk_results(child, found, depth + 1)
+
+
+def _from_app_state(html: str) -> List[dict]:
+    found: Dict[str, dict] = {}
+    _walk_results(app_state(html), found)
+    summaries = []
+    for ad_id, item in found.items():
+        attrs = item.get("attr") or item.get("attributes") or {}
+        specs = {}
+        if isinstance(attrs, dict):
+            specs = {_ATTR_LABELS[k]: str(v) for k, v in attrs.items() if k in _ATTR_LABELS and v}
+        images = image_urls(item.get("previewImage") or item.get("images") or [])
+        summaries.append(_summary(ad_id, item["title"], parse_amount(item.get("price")), specs,
+                                  images[0] if images else None))
+    return summaries
+
+
+def _from_json_ld(html: str) -> List[dict]:
+    summaries = []
+    for data in json_ld_items(html):
+        for element in data.get("itemListElement") or []:
+            item = element.get("item", element) if isinstance(element, dict) else None
+            if not isinstance(item, dict):
+                continue
+            ad_id = ad_id_from_url(item.get("url") or "")
+            if not ad_id:
+                continue
+            offers = item.get("offers") or {}
+            if isinstance(offers, list):
+                offers = offers[0] if offers else {}
+            mileage = item.get("mileageFromOdometer")
+            if isinstance(mileage, dict):
+                mileage = mileage.get("value")
+            specs = {label: str(value) for label, value in (
+                ("Erstzulassung", item.get("dateVehicleFirstRegistered")),
+                ("Kilometerstand", f"{mileage} km" if mileage else None),
+                ("Kraftstoffart", item.get("fuelType")),
+            ) if value}
+            images = image_urls(item.get("image") or [])
+            summaries.append(_summary(ad_id, item.get("name"), parse_amount(offers.get("price")), specs,
+                                      images[0] if images else None))
+    return summaries
+
+
+# ---- DOM fallback ----
+
+def _from_soup(html: str) -> List[dict]:
+    soup = BeautifulSoup(html, "html.parser")
+    summaries = {}
+    for link in soup.select("a[href*='details.html'], a[href*='auto-inserat']"):
+        ad_id = ad_id_from_url(urljoin(SEARCH_BASE_URL, link.get("href", "")))
+        if not ad_id or ad_id in summaries:
+            continue
+        title_el = link.find(["h2", "h3"])
+        title = title_el.get_text(" ", strip=True) if title_el else link.get("title") or ""
+        text = link.get_text(" ", strip=True)
+        price = _PRICE_RE.search(text)
+        year = _YEAR_RE.search(text)
+        mileage = _MILEAGE_RE.search(text)
+        specs = {label: value for label, value in (
+            ("Erstzulassung", year.group(1) if year else None),
+            ("Kilometerstand", f"{mileage.group(1)} km" if mileage else None),
+        ) if value}
+        img = link.find("img")
+        thumbnail = (img.get("src") or img.get("data-src")) if img else None
+        summaries[ad_id] = _summary(ad_id, title, parse_int(price.group(1)) if price else None, specs,
+                                    image_urls(thumbnail)[0] if thumbnail else None)
+    return list(summaries.values())
+
+
+def extract_search_results(html: str) -> List[dict]:
+    """
+    Короткі дані всіх оголошень зі сторінки результатів пошуку mobile.de:
+    ad_id, url, title, price, year, mileage (+ fuel, gearbox, power_kw, якщо
+    є) і thumbnail. Спершу вбудований JSON, інакше розмітка карток.
+    """
+    for extract in (_from_app_state, _from_json_ld, _from_soup):
+        summaries = [s for s in extract(html) if s["title"]]
+        if summaries:
+            return summaries
+    return []
+
+
+def _missing_fields(summary: dict, detail_fields: Iterable[str]) -> List[str]:
+    missing = [f for f in ("title", "price") if not summary.get(f)]
+    if not summary["photo_urls"]:
+        missing.append("photos")
+    # картка пошуку зазвичай несе лише одне прев'ю
+    if "gallery" in detail_fields and len(summary["photo_urls"]) < 2:
+        missing.append("gallery")
+    if "description" in detail_fields and not summary.get("description"):
+        missing.append("description")
+    return missing
+
+
+def _complete(summary: dict, detail_fields: Iterable[str]) -> Optional[dict]:
+    """
+    Оголошення з summary; сторінку оголошення (через parse_mobile_de, тобто
+    з кешем оголошень) відкриваємо лише за відсутніми полями. Фото картки
+    йдуть тим самим шляхом, що й фото сторінки (attach_photos).
+    """
+    cached = listing_cache.get(summary["ad_id"])
+    if cached is not None:
+        return cached
+    missing = _missing_fields(summary, detail_fields)
+    if missing:
+        print(f"DEBUG: ad {summary['ad_id']} needs its details page for {missing}")
+        listing = parse_mobile_de(summary["url"])
+        if listing is not None:
+            # поля з результатів пошуку заповнюють те, чого не знайшлося на сторінці
+            for key in ("title", "price", "year", "mileage", "fuel", "gearbox", "power_kw"):
+                if listing.get(key) in (None, "") and summary.get(key) not in (None, ""):
+                    listing[key] = summary[key]
+            return listing
+    listing = {k: v for k, v in summary.items() if k not in ("ad_id", "url", "thumbnail", "photo_urls")}
+    # неповне оголошення з картки в кеш не кладемо: воно витіснило б сторінку оголошення
+    attach_photos(listing, [full_size_image(u) for u in summary["photo_urls"]], summary["ad_id"])
+    return listing
+
+
+def parse_search_listings(search_url: str, ad_ids: Optional[Iterable[str]] = None,
+                          detail_fields: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+    """
+    Завантажує сторінку результатів пошуку один раз і повертає
+    ``{ad_id: listing}`` (ключі як у parse_mobile_de) для ``ad_ids``
+    (або для всіх оголошень на сторінці).
+
+    Сторінки оголошень завантажуються лише для тих, у кого в результатах
+    пошуку немає назви/ціни/фото, або для полів із ``detail_fields``
+    (``gallery``, ``description``; за замовчуванням Config.SEARCH_DETAIL_FIELDS).
+    """
+    detail_fields = Config.SEARCH_DETAIL_FIELDS if detail_fields is None else list(detail_fields)
+    print(f"DEBUG: parse_search_listings() fetching {search_url}")
+    started = time.monotonic()
+    html = client.fetch(search_url)
+    if html is None:
+        print(f"DEBUG: failed to fetch search results {search_url}")
+        return {}
+    summaries = {s["ad_id"]: s for s in extract_search_results(html)}
+    wanted = list(summaries) if ad_ids is None else [a for a in ad_ids if a in summaries]
+    print(f"DEBUG: search page has {len(summaries)} ads, {len(wanted)} wanted")
+
+    listings = {}
+    for ad_id in wanted:
+        listing = _complete(summaries[ad_id], detail_fields)
+        if listing is not None:
+            listings[ad_id] = listing
+    print(f"DEBUG: built {len(listings)} listings from search results in {time.monotonic() - started:.1f}s")
+    return listings
@@ -0,0 +1,135 @@
+# app/utils/mobile_urls.py
+
+import html
+import re
+from typing import Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+DETAILS_URL = "https://suchen.mobile.de/fahrzeuge/details.html?id={ad_id}"
+
+# Результати класифікації
+DETAILS = "details"      # посилання на оголошення, ad id відомий
+REDIRECT = "redirect"    # трекінгове посилання (mobile.de чи сторонній трекер), треба розгорнути
+SKIP = "skip"            # усе інше, жодних запитів
+
+# хости самого сайту: посилання без ad id на них — це навігація, а не редирект
+_SITE_HOSTS = {"mobile.de", "www.mobile.de", "suchen.mobile.de", "m.mobile.de", "static.mobile.de"}
+_ID_PARAMS = ("id", "adId", "adid", "ad_id")
+_AD_ID_RE = re.compile(r"^\d{6,12}$")
+# /auto-inserat/<slug>/<id>.html (старий формат), /<lang>/<...>/<...>.html?id=<id> (локалізований)
+_INSERAT_RE = re.compile(r"/auto-inserat/[^/]+/(\d{6,12})\.html")
+# перевіряється лише шлях (у query трекінгових посилань випадкові токени)
+_SKIP_PATH_RE = re.compile(
+    r"(?<![a-z0-9])(unsubscribe|unsub_center|subscription_center|profile_center|abmelden|abbestellen|"
+    r"austragen|opt-?out|einstellungen|settings|preferences|newsletter|my-mobile|mein-mobile|impressum|"
+    r"datenschutz|privacy|agb|hilfe|help|faq|pixel|beacon)(?![a-z0-9])"
+)
+# піксель відкриття листа (SendGrid /wf/open, /open.aspx) — лише як останній сегмент шляху
+_OPEN_PIXEL_RE = re.compile(r"/open(\.aspx|\.gif)?/?$")
+_SKIP_HOSTS = (
+    "apps.apple.com", "itunes.apple.com", "play.google.com", "app.adjust.com",
+    "facebook.com", "instagram.com", "youtube.com", "twitter.com", "x.com", "tiktok.com", "linkedin.com",
+)
+_ASSET_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico", ".webp", ".css", ".js")
+# один прохід: значення href="..."/href='...' або голий URL у тексті
+_URL_RE = re.compile(r"""href\s*=\s*(?:"([^"]*)"|'([^']*)')|(https?://[^\s<>"']+)""", re.IGNORECASE)
+
+
+def extract_urls(text: str) -> List[str]:
+    """
+    Усі http(s)-посилання з тексту або HTML листа, без дублікатів, у порядку
+    появи. Один прохід regex замість повного дерева BeautifulSoup.
+    """
+    urls = {}
+    for match in _URL_RE.finditer(text or ""):
+        href = match.group(1) if match.group(1) is not None else match.group(2)
+        if href is None:
+            href = match.group(3).rstrip(".,;:!?)]}")
+        url = html.unescape(href).strip()
+        if url.lower().startswith(("http://", "https://")):
+            urls.setdefault(url, None)
+    return list(urls)
+
+
+def _host_matches(host: str, domains: Iterable[str]) -> bool:
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+
+def ad_id_from_url(url: str) -> Optional[str]:
+    """Ad id з посилання на оголошення mobile.de або None."""
+    parts = urlsplit((url or "").replace("&amp;", "&"))
+    host = parts.hostname or ""
+    if not _host_matches(host, ("mobile.de",)):
+        return None
+    match = _INSERAT_RE.search(parts.path)
+    if match:
+        return match.group(1)
+    if not parts.path.endswith(".html"):
+        return None
+    query = parse_qs(parts.query)
+    for name in _ID_PARAMS:
+        for value in query.get(name, []):
+            if _AD_ID_RE.match(value):
+                return value
+    return None
+
+
+def canonical_details_url(ad_id: str) -> str:
+    return DETAILS_URL.format(ad_id=ad_id)
+
+
+def classify_url(url: str) -> Tuple[str, Optional[str]]:
+    """(DETAILS | REDIRECT | SKIP, ad_id) без жодного мережевого запиту."""
+    if not url or not url.lower().startswith(("http://", "https://")):
+        return SKIP, None
+    ad_id = ad_id_from_url(url)
+    if ad_id:
+        return DETAILS, ad_id
+    parts = urlsplit(url)
+    # трекер, що несе саме посилання в параметрі (google.com/url?q=..., ...&url=...)
+    for values in parse_qs(parts.query).values():
+        for value in values:
+            ad_id = ad_id_from_url(value) if value.lower().startswith(("http://", "https://")) else None
+            if ad_id:
+                return DETAILS, ad_id
+    host = (parts.hostname or "").lower()
+    path = parts.path.lower()
+    if _host_matches(host, _SKIP_HOSTS) or path.endswith(_ASSET_EXTENSIONS):
+        return SKIP, None
+    if _SKIP_PATH_RE.search(path) or _OPEN_PIXEL_RE.search(path):
+        return SKIP, None
+    if host in _SITE_HOSTS:
+        return SKIP, None
+    # невідомий хост може бути стороннім трекером (SendGrid, Google redirect...),
+    # що веде на оголошення: вирішує resolver (Location без тіла, з кешем)
+    return REDIRECT, None
+
+
+def is_search_url(url: str) -> bool:
+    """Посилання на сторінку результатів збереженого пошуку."""
+    parts = urlsplit(url or "")
+    host = (parts.hostname or "").lower()
+    return _host_matches(host, ("mobile.de",)) and parts.path.lower().endswith("/search.html")
+
+
+def search_urls(urls: Iterable[str]) -> List[str]:
+    """Прямі посилання на результати пошуку з листа, без дублікатів."""
+    return list(dict.fromkeys(url for url in urls if is_search_url(url)))
+
+
+def listing_urls(urls: Iterable[str]) -> List[str]:
+    """
+    Посилання на оголошення з листа: канонічні details URL, по одному на
+    ad id, у порядку появи, а за ними трекінгові посилання. Ті можуть вести
+    на вже знайдені оголошення — їх зводить до ad id
+    mobile_parser.dedupe_by_ad_id після розгортання.
+    """
+    details, redirects, seen = [], [], set()
+    for url in urls:
+        kind, ad_id = classify_url(url)
+        if kind == DETAILS and ad_id not in seen:
+            seen.add(ad_id)
+            details.append(canonical_details_url(ad_id))
+        elif kind == REDIRECT and url not in redirects:
+            redirects.append(url)
+    return details + redirects
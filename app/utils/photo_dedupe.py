@@ -0,0 +1,219 @@
+# app/utils/photo_dedupe.py
+
+import io
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from app.utils.photo_fetcher import PhotoFetcher
+
+try:
+    from PIL import Image
+except ImportError:  # без Pillow лишається тільки дедуплікація за URL
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# CDN mobile.de віддає будь-який розмір тієї ж картинки через ?rule=mo-<px>
+_CDN_HOSTS = ("classistatic.de",)
+_RULE_RE = re.compile(r"rule=mo-\d+")
+
+
+def dhash(data: bytes, size: int = 8) -> Optional[int]:
+    """64-бітний difference hash: сусідні пікселі сірого зображення (size+1)×size."""
+    if Image is None or not data:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.draft("L", (size * 4, size * 4))
+            small = img.convert("L").resize((size + 1, size), Image.LANCZOS)
+            pixels = list(small.getdata())
+    except Exception as exc:
+        logger.debug("Cannot hash image: %s", exc)
+        return None
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _is_cdn(url: str) -> bool:
+    host = (urlsplit(url).hostname or "").lower()
+    return any(host == h or host.endswith("." + h) for h in _CDN_HOSTS)
+
+
+def variant_key(url: str) -> str:
+    """Однаковий для різних розмірів однієї картинки на CDN."""
+    parts = urlsplit(url)
+    if _is_cdn(url):
+        return f"{parts.hostname}{parts.path}".lower()
+    return url
+
+
+def full_size_image(url: Optional[str]) -> Optional[str]:
+    """Мініатюра з CDN (...?rule=mo-240.jpg) -> та сама картинка у великому розмірі."""
+    return _RULE_RE.sub("rule=mo-1024", url) if url else url
+
+
+def thumbnail_url(url: str, rule: str = "mo-160") -> Optional[str]:
+    """Маленька версія картинки з CDN або None, якщо CDN її не вміє."""
+    if not _is_cdn(url):
+        return None
+    if _RULE_RE.search(url):
+        return _RULE_RE.sub(f"rule={rule}", url)
+    return f"{url}{'&' if '?' in url else '?'}rule={rule}.jpg"
+
+
+def parse_hashes(values: Iterable[str]) -> set:
+    hashes = set()
+    for value in values:
+        try:
+            hashes.add(int(value, 16))
+        except ValueError:
+            logger.warning("Ignoring invalid photo hash %r", value)
+    return hashes
+
+
+class PhotoDeduper:
+    """
+    Відсіює дублікати й заглушки серед фото оголошення до завантаження повних
+    картинок.
+
+    1. Варіанти однієї картинки різного розміру (той самий шлях на CDN)
+       зводяться до одного URL без жодного запиту.
+    2. Для картинок з CDN спершу качаються мініатюри (~5 KB); за їх dHash
+       відкидаються майже однакові фото (відстань Геммінга ≤ ``threshold``)
+       і відомі заглушки/логотипи (``placeholders``).
+    3. Хеш, який трапився в ``auto_placeholder_listings`` різних оголошеннях,
+       вважається логотипом/бейджем дилера і надалі теж відкидається.
+    4. Повні картинки качаються лише для тих, що лишились (до ``limit``).
+
+    Фото не з CDN хешуються після повного завантаження. Пам'ятаються
+    ``max_hashes`` хешів; найдавніше бачені витісняються першими.
+    """
+
+    def __init__(self, fetcher: PhotoFetcher, threshold: int = 6, placeholders: Iterable[int] = (),
+                 auto_placeholder_listings: int = 3, thumbnail_rule: str = "mo-160", max_hashes: int = 20000):
+        self.fetcher = fetcher
+        self.threshold = threshold
+        self.placeholders = set(placeholders)
+        self.auto_placeholder_listings = auto_placeholder_listings
+        self.thumbnail_rule = thumbnail_rule
+        self.max_hashes = max_hashes
+        self._hash_listings = OrderedDict()
+        self._lock = threading.Lock()
+        self.dropped_duplicates = 0
+        self.dropped_placeholders = 0
+
+    def _is_placeholder(self, value: int) -> bool:
+        if any(hamming(value, p) <= self.threshold for p in self.placeholders):
+            return True
+        with self._lock:
+            return len(self._hash_listings.get(value, ())) >= self.auto_placeholder_listings
+
+    def _remember(self, hashes: Iterable[int], listing_key: str):
+        with self._lock:
+            for value in hashes:
+                seen = self._hash_listings.setdefault(value, set())
+                self._hash_listings.move_to_end(value)
+                if len(seen) < self.auto_placeholder_listings:
+                    seen.add(listing_key)
+            while len(self._hash_listings) > self.max_hashes:
+                self._hash_listings.popitem(last=False)
+
+    def _keep(self, value: Optional[int], kept: List[int]) -> bool:
+        if value is None:
+            return True
+        if self._is_placeholder(value):
+            with self._lock:
+                self.dropped_placeholders += 1
+            return False
+        if any(hamming(value, k) <= self.threshold for k in kept):
+            with self._lock:
+                self.dropped_duplicates += 1
+            return False
+        kept.append(value)
+        return True
+
+    @staticmethod
+    def _candidates(urls: Iterable[str], count: int) -> List[str]:
+        candidates, seen = [], set()
+        for url in urls:
+            key = variant_key(url)
+            if key not in seen:
+                seen.add(key)
+                candidates.append(full_size_image(url))
+        return candidates[:count]
+
+    def _by_thumbnails(self, candidates: List[str], limit: int, kept_hashes: List[int]) -> List[str]:
+        """Кандидати, що пройшли перевірку мініатюр; не-CDN пропускаються як є."""
+        thumbs = {u: thumbnail_url(u, self.thumbnail_rule) for u in candidates}
+        thumb_urls = [t for t in thumbs.values() if t]
+        # мініатюри маленькі: короткий дедлайн, щоб не затримувати повні фото
+        thumb_data = dict(zip(thumb_urls, self.fetcher.fetch_all(
+            thumb_urls, deadline=min(5, self.fetcher.deadline), keep_missing=True)))
+        wanted = []
+        for url in candidates:
+            thumb = thumbs[url]
+            if thumb is None or self._keep(dhash(thumb_data.get(thumb)), kept_hashes):
+                wanted.append(url)
+            if len(wanted) >= limit:
+                break
+        return wanted
+
+    def select_unique(self, urls: Iterable[str], limit: int = 10, listing_key: str = "") -> List[str]:
+        """
+        URL унікальних фото в порядку галереї, без завантаження повних
+        картинок (для публікації за URL). Фото не з CDN не перевіряються.
+        """
+        candidates = self._candidates(urls, limit * 2)
+        if Image is None:
+            return candidates[:limit]
+        kept_hashes = []
+        wanted = self._by_thumbnails(candidates, limit, kept_hashes)
+        self._remember(kept_hashes, listing_key)
+        return wanted
+
+    def fetch_unique(self, urls: Iterable[str], limit: int = 10, listing_key: str = "") -> Tuple[List[bytes], int]:
+        """
+        Унікальні фото оголошення в порядку галереї: (фото, скільки мало бути).
+        Менше фото, ніж друге число, означає, що частину не вдалося завантажити.
+        """
+        candidates = self._candidates(urls, limit * 2)
+        if Image is None:
+            wanted = candidates[:limit]
+            return self.fetcher.fetch_all(wanted), len(wanted)
+
+        kept_hashes = []
+        wanted = self._by_thumbnails(candidates, limit, kept_hashes)
+        full = self.fetcher.fetch_all(wanted, keep_missing=True)
+        photos, expected = [], 0
+        for url, data in zip(wanted, full):
+            # фото не з CDN хешуємо після повного завантаження
+            if thumbnail_url(url, self.thumbnail_rule) is None and data is not None \
+                    and not self._keep(dhash(data), kept_hashes):
+                continue
+            expected += 1
+            if data is not None:
+                photos.append(data)
+        self._remember(kept_hashes, listing_key)
+        return photos, expected
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "dropped_duplicates": self.dropped_duplicates,
+                "dropped_placeholders": self.dropped_placeholders,
+                "known_hashes": len(self._hash_listings),
+            }
+
@@ -0,0 +1,87 @@
+# app/utils/photo_fetcher.py
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Iterable, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.scrapers.rate_limiter import HostRateLimiter, default_limiter
+
+logger = logging.getLogger(__name__)
+
+
+class PhotoFetcher:
+    """
+    Паралельне завантаження фото оголошення через спільну keep-alive сесію.
+
+    - пул з'єднань розміром із кількість потоків, тож з'єднання до CDN
+      перевикористовуються між фото й між оголошеннями;
+    - на все оголошення діє загальний дедлайн: що не встигло — пропускається;
+    - результат у порядку галереї, без фото, які не вдалося завантажити.
+    """
+
+    def __init__(self, max_workers: int = 6, deadline: float = 20, connect_timeout: float = 5,
+                 headers: Optional[dict] = None, chunk_size: int = 64 * 1024,
+                 rate_limiter: Optional[HostRateLimiter] = None):
+        self.max_workers = max_workers
+        self.deadline = deadline
+        self.connect_timeout = connect_timeout
+        self.chunk_size = chunk_size
+        self.rate_limiter = rate_limiter or default_limiter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="photo-fetch")
+
+    def _get(self, url: str, deadline_at: float) -> Optional[bytes]:
+        if not self.rate_limiter.acquire(url, timeout=deadline_at - time.monotonic()):
+            return None
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            return None
+        try:
+            with self.session.get(url, stream=True, timeout=(min(self.connect_timeout, remaining), remaining)) as resp:
+                self.rate_limiter.on_response(url, resp.status_code, resp.headers.get("Retry-After"))
+                if resp.status_code != 200:
+                    logger.debug("Photo %s returned %s", url, resp.status_code)
+                    return None
+                chunks = []
+                for chunk in resp.iter_content(self.chunk_size):
+                    # повільний CDN не повинен тримати оголошення довше дедлайну
+                    if time.monotonic() > deadline_at:
+                        logger.debug("Photo %s exceeded the listing deadline", url)
+                        return None
+                    chunks.append(chunk)
+                return b"".join(chunks)
+        except requests.RequestException as exc:
+            logger.debug("Photo download failed for %s: %s", url, exc)
+            return None
+
+    def fetch_all(self, urls: Iterable[str], deadline: Optional[float] = None,
+                  keep_missing: bool = False) -> List[Optional[bytes]]:
+        """
+        Завантажує фото паралельно; повертає їх у порядку ``urls``.
+        З ``keep_missing`` на місці незавантажених фото стоїть None.
+        """
+        urls = list(urls)
+        if not urls:
+            return []
+        deadline = self.deadline if deadline is None else deadline
+        deadline_at = time.monotonic() + deadline
+        futures = [self.executor.submit(self._get, url, deadline_at) for url in urls]
+        done, not_done = wait(futures, timeout=deadline)
+        for future in not_done:
+            future.cancel()
+        photos = []
+        for future in futures:
+            if future in done and future.exception() is None and future.result():
+                photos.append(future.result())
+            elif keep_missing:
+                photos.append(None)
+        return photos
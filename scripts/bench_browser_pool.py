@@ -0,0 +1,69 @@
+"""Exercise the headless-browser fallback against a local HTML server.
+
+Usage: python scripts/bench_browser_pool.py [pages] [pool size]
+
+Serves three pages from 127.0.0.1: /blocked (HTTP 403), /challenge (a bot
+check page) and /ok (a plain details page). MobileDeClient must return the
+plain page directly and go through the pool for the other two. Prints
+per-page latency plus the pool stats (latency, JS heap, recycles).
+Needs selenium and a local Chrome.
+"""
+from dotenv import load_dotenv
+import os, sys, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+load_dotenv('.env.local')
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app.scrapers.browser_pool import BrowserPool
+from app.scrapers.mobile_de_client import MobileDeClient
+from app.scrapers.rate_limiter import HostRateLimiter
+
+pages = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+size = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+OK = b'<html><head><title>Peugeot 308</title></head><body><h1>Peugeot 308</h1></body></html>'
+CHALLENGE = b'<html><body><div id="px-captcha"></div></body></html>'
+# the browser gets the real page: only the plain requests UA is blocked
+BROWSER_MARK = 'HeadlessChrome'
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        from_browser = BROWSER_MARK in self.headers.get('User-Agent', '')
+        status, body = 200, OK
+        if not from_browser and self.path.startswith('/blocked'):
+            status, body = 403, b'Forbidden'
+        elif not from_browser and self.path.startswith('/challenge'):
+            body = CHALLENGE
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+base = f'http://127.0.0.1:{server.server_port}'
+
+# no user_agent override: Chrome identifies as HeadlessChrome, which the server lets through
+pool = BrowserPool(size=size, max_pages=max(2, pages // 2))
+client = MobileDeClient(rate_limiter=HostRateLimiter(rate=50, burst=50, max_rate=100), browser_pool=pool)
+time.sleep(3)  # let the pool warm up
+
+try:
+    for path in ('/ok', '/blocked', '/challenge'):
+        for i in range(pages):
+            start = time.perf_counter()
+            html = client.fetch(f'{base}{path}?n={i}')
+            ok = html is not None and 'Peugeot 308' in html
+            print(f'{path:<11} #{i:<3} {"ok " if ok else "FAIL"} {(time.perf_counter() - start) * 1000:7.1f} ms')
+    print('pool:', pool.stats())
+finally:
+    pool.close()
+    server.shutdown()
@@ -0,0 +1,65 @@
+"""Compare the old regex + BeautifulSoup URL extraction with the single-pass one.
+
+Usage: python scripts/bench_extract_urls.py <dir with saved .eml files> [repeat]
+
+Save a few mobile.de saved-search mails from Gmail ("Download message")
+into a directory and point the script at it.
+"""
+from dotenv import load_dotenv
+import os, re, sys, time
+load_dotenv('.env.local')
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from bs4 import BeautifulSoup
+from app.gmail_client import _parse_message
+from app.utils.mobile_urls import extract_urls, listing_urls
+
+
+def extract_urls_soup(text):
+    """The previous tasks.extract_urls, kept here for comparison."""
+    urls = set()
+    urls.update(re.findall(r'https?://[^\s<>"\']+', text))
+    try:
+        soup = BeautifulSoup(text, 'html.parser')
+        for a in soup.find_all('a', href=True):
+            href = a['href']
+            if href.startswith('http'):
+                urls.add(href)
+    except Exception:
+        pass
+    return list(urls)
+
+
+if len(sys.argv) < 2:
+    print(__doc__)
+    raise SystemExit(1)
+
+corpus_dir = sys.argv[1]
+repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+bodies = []
+for name in sorted(os.listdir(corpus_dir)):
+    if name.lower().endswith('.eml'):
+        with open(os.path.join(corpus_dir, name), 'rb') as f:
+            msg = _parse_message(name, f.read(), lean=True)
+        bodies.append((msg.text_body or '') + '\n' + (msg.html_body or ''))
+if not bodies:
+    print('No .eml files found in', corpus_dir)
+    raise SystemExit(1)
+
+print(f'{len(bodies)} messages, {sum(len(b) for b in bodies) / 1024:.0f} KiB of text, {repeat} rounds')
+timings = {}
+for label, func in (('soup', extract_urls_soup), ('single-pass', extract_urls)):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        found = [func(body) for body in bodies]
+    timings[label] = time.perf_counter() - start
+    per_msg = timings[label] / (repeat * len(bodies)) * 1000
+    print(f'{label}: {timings[label]:.3f}s total, {per_msg:.2f} ms/message')
+print(f"speedup: {timings['soup'] / timings['single-pass']:.1f}x")
+
+# both must lead to the same listings
+diff = [i for i, body in enumerate(bodies)
+        if set(listing_urls(extract_urls_soup(body))) != set(listing_urls(extract_urls(body)))]
+print('listing mismatches:', diff or 'none')
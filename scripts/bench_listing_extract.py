@@ -0,0 +1,58 @@
+"""Benchmark the listing extraction engines on a saved details page.
+
+Usage: python scripts/bench_listing_extract.py [saved details page] [repeat]
+
+Defaults to scripts/fixtures/mobile_de_details.html. If a hand-checked
+<page minus .html>.golden.json sits next to the page, extract_listing is
+compared with it; scripts/test_listing_extract.py checks every engine.
+"""
+from dotenv import load_dotenv
+import json, os, sys, time
+load_dotenv('.env.local')
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app.utils import listing_extractor as lx
+
+args = sys.argv[1:]
+page = args[0] if args else os.path.join(ROOT, 'scripts', 'fixtures', 'mobile_de_details.html')
+repeat = int(args[1]) if len(args) > 1 else 10
+golden_path = os.path.splitext(page)[0] + '.golden.json'
+
+with open(page, encoding='utf-8', errors='ignore') as f:
+    html = f.read()
+print(f'{page}: {len(html) / 1024:.0f} KiB, {repeat} rounds')
+
+engines = [('soup', lx.extract_soup), ('structured', lx.extract_structured)]
+if lx.lxml_html is not None:
+    engines.append(('lxml', lx.extract_lxml))
+else:
+    print('lxml not installed, skipping the lxml engine')
+
+results, timings = {}, {}
+for name, extract in engines:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results[name] = extract(html)
+    timings[name] = time.perf_counter() - start
+    print(f'{name}: {timings[name] / repeat * 1000:.1f} ms/page')
+for name in timings:
+    if name != 'soup':
+        print(f"{name} speedup vs soup: {timings['soup'] / timings[name]:.1f}x")
+
+if results['structured'] is None:
+    print('structured: page embeds no JSON-LD / app-state listing')
+if 'lxml' in results:
+    print('lxml matches soup:', results['lxml'] == results['soup'])
+
+auto = lx.extract_listing(html)
+if auto is None:
+    print('extract_listing: no listing on this page')
+    sys.exit(1)
+if os.path.exists(golden_path):
+    with open(golden_path, encoding='utf-8') as f:
+        golden = json.load(f)
+    fields = [k for k in golden if golden[k] != auto.get(k)]
+    print('golden check:', 'OK' if not fields else f'mismatch in {fields}')
+print('extract_listing:', json.dumps({k: v for k, v in auto.items() if k != 'description'}, ensure_ascii=False)[:500])
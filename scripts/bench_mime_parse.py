@@ -0,0 +1,51 @@
+"""Compare the full (policy.default) and lean (compat32) MIME parsers.
+
+Usage: python scripts/bench_mime_parse.py <dir with saved .eml files> [repeat]
+
+Save a few mobile.de notification mails from Gmail ("Download message")
+into a directory and point the script at it.
+"""
+from dotenv import load_dotenv
+import os, sys, time
+load_dotenv('.env.local')
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app.gmail_client import _parse_message
+
+if len(sys.argv) < 2:
+    print(__doc__)
+    raise SystemExit(1)
+
+corpus_dir = sys.argv[1]
+repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+corpus = []
+for name in sorted(os.listdir(corpus_dir)):
+    if name.lower().endswith('.eml'):
+        with open(os.path.join(corpus_dir, name), 'rb') as f:
+            corpus.append(f.read())
+if not corpus:
+    print('No .eml files found in', corpus_dir)
+    raise SystemExit(1)
+
+total_bytes = sum(len(raw) for raw in corpus)
+print(f'{len(corpus)} messages, {total_bytes / 1024:.0f} KiB, {repeat} rounds')
+
+results = {}
+for lean in (False, True):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parsed = [_parse_message(i, raw, lean=lean) for i, raw in enumerate(corpus)]
+    elapsed = time.perf_counter() - start
+    results[lean] = (elapsed, parsed)
+    per_msg = elapsed / (repeat * len(corpus)) * 1000
+    print(f"{'lean' if lean else 'full'}: {elapsed:.3f}s total, {per_msg:.2f} ms/message")
+
+full, lean = results[False], results[True]
+print(f'speedup: {full[0] / lean[0]:.1f}x')
+mismatches = [
+    a.uid for a, b in zip(full[1], lean[1])
+    if a.html_body != b.html_body or a.text_body != b.text_body or len(a.attachments) != len(b.attachments)
+]
+print('body mismatches:', mismatches or 'none')
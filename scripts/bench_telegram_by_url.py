@@ -0,0 +1,131 @@
+"""Compare byte upload and by-URL publishing against a local Telegram Bot API stand-in.
+
+Usage: python scripts/bench_telegram_by_url.py [photos] [photo KiB]
+
+Starts two local servers: an image host (one of the photos returns 404) and
+a minimal Bot API stand-in that downloads URL media itself, rejects the
+ones it cannot fetch with "failed to send message #N", and counts the bytes
+it receives as uploads. Prints, per mode, how many photo bytes went through
+this process and how long publishing took.
+"""
+from dotenv import load_dotenv
+import json, os, sys, threading, time
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+load_dotenv('.env.local')
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import requests
+
+from app.config import Config
+from app import telegram_client
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+size_kib = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+BROKEN = 3  # this photo 404s for the stand-in, so it must be uploaded as bytes
+PHOTO = os.urandom(size_kib * 1024)
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    # only the stand-in (playing Telegram's fetcher) gets the 404
+    def do_GET(self):
+        if self.path == f'/img/{BROKEN}.jpg' and self.headers.get('X-Fetcher') == 'telegram':
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(PHOTO)))
+        self.end_headers()
+        self.wfile.write(PHOTO)
+
+    def log_message(self, *args):
+        pass
+
+
+uploaded_bytes = [0]
+
+
+class BotApiHandler(BaseHTTPRequestHandler):
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _form(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        uploaded_bytes[0] += len(body)
+        ctype = self.headers.get('Content-Type', '')
+        if not ctype.startswith('multipart/'):
+            return {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        msg = BytesParser(policy=default_policy).parsebytes(
+            f'Content-Type: {ctype}\r\n\r\n'.encode() + body)
+        return {part.get_param('name', header='content-disposition'): part.get_content()
+                for part in msg.iter_parts()}
+
+    def do_GET(self):
+        self._reply(200, {'ok': True, 'result': {'message_id': 1}})
+
+    def do_POST(self):
+        form = self._form()
+        method = self.path.rsplit('/', 1)[-1]
+        media = json.loads(form.get('media', '[]')) if method == 'sendMediaGroup' else \
+            [{'media': form['photo']}] if isinstance(form.get('photo'), str) else []
+        for i, item in enumerate(media, start=1):
+            if str(item['media']).startswith('http'):
+                resp = requests.get(item['media'], headers={'X-Fetcher': 'telegram'})
+                if resp.status_code != 200:
+                    self._reply(400, {'ok': False, 'error_code': 400, 'description':
+                                      f'Bad Request: failed to send message #{i} with the error message "WEBPAGE_CURL_FAILED"'})
+                    return
+        self._reply(200, {'ok': True, 'result': [{'message_id': 1}]})
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+images = serve(ImageHandler)
+bot_api = serve(BotApiHandler)
+Config.TELEGRAM_API_BASE_URL = f'http://127.0.0.1:{bot_api.server_port}'
+urls = [f'http://127.0.0.1:{images.server_port}/img/{i}.jpg' for i in range(count)]
+
+
+class Settings:
+    telegram_channel_id = -100123
+    telegram_channel_username = '@bench'
+
+
+downloaded = [0]
+
+
+def fetch(urls_to_fetch):
+    data = [requests.get(u).content for u in urls_to_fetch]
+    downloaded[0] += sum(len(d) for d in data)
+    return data
+
+
+for mode in ('bytes', 'url'):
+    uploaded_bytes[0] = downloaded[0] = 0
+    start = time.perf_counter()
+    if mode == 'bytes':
+        ok, err = telegram_client.send_car_post(Settings, 'TOKEN', 'bench', fetch(urls))
+    else:
+        ok, err = telegram_client.send_car_post(Settings, 'TOKEN', 'bench', [], photo_urls=urls, fetch_photos=fetch)
+    elapsed = time.perf_counter() - start
+    print(f'{mode:>5}: ok={ok} err={err} downloaded {downloaded[0] / 1024:.0f} KiB, '
+          f'uploaded {uploaded_bytes[0] / 1024:.0f} KiB, {elapsed * 1000:.0f} ms')
+
+images.shutdown()
+bot_api.shutdown()
@@ -18,6 +18,18 @@ print('Creating tables in schema:', DB_SCHEMA)
 cur.execute(f"CREATE TABLE IF NOT EXISTS {DB_SCHEMA}.users (\n    id SERIAL PRIMARY KEY,\n    email VARCHAR(255) NOT NULL UNIQUE,\n    password_hash VARCHAR(255) NOT NULL\n);")
 cur.execute(f"CREATE TABLE IF NOT EXISTS {DB_SCHEMA}.posting_logs (\n    id SERIAL PRIMARY KEY,\n    user_id INTEGER REFERENCES {DB_SCHEMA}.users(id),\n    gmail_message_id VARCHAR(255),\n    subject VARCHAR(1024),\n    car_title VARCHAR(1024),\n    raw_price VARCHAR(64),\n    final_price VARCHAR(64),\n    sent_to_channel BOOLEAN,\n    sent_at TIMESTAMP,\n    error TEXT,\n    created_at TIMESTAMP\n);")
 cur.execute(f"CREATE TABLE IF NOT EXISTS {DB_SCHEMA}.user_settings (\n    id SERIAL PRIMARY KEY,\n    user_id INTEGER REFERENCES {DB_SCHEMA}.users(id),\n    gmail_address VARCHAR(255),\n    gmail_app_password_encrypted TEXT,\n    telegram_bot_token_encrypted TEXT,\n    telegram_channel_username VARCHAR(255),\n    telegram_channel_id BIGINT,\n    openai_api_key_encrypted TEXT,\n    language VARCHAR(8),\n    price_markup_eur INTEGER,\n    auto_post_enabled BOOLEAN,\n    UNIQUE(user_id)\n);")
+cur.execute(f"CREATE TABLE IF NOT EXISTS {DB_SCHEMA}.resolved_urls (\n    url_hash VARCHAR(64) PRIMARY KEY,\n    url TEXT NOT NULL,\n    final_url TEXT,\n    resolved_at TIMESTAMP\n);")
+cur.execute(f"CREATE TABLE IF NOT EXISTS {DB_SCHEMA}.scrape_retries (\n    id SERIAL PRIMARY KEY,\n    user_id INTEGER NOT NULL REFERENCES {DB_SCHEMA}.users(id),\n    url TEXT NOT NULL,\n    gmail_message_id VARCHAR(255),\n    subject VARCHAR(1024),\n    attempts INTEGER NOT NULL DEFAULT 0,\n    next_attempt_at TIMESTAMP NOT NULL,\n    last_error TEXT,\n    created_at TIMESTAMP,\n    UNIQUE(user_id, url)\n);")
+cur.execute(f"CREATE INDEX IF NOT EXISTS ix_scrape_retries_next_attempt_at ON {DB_SCHEMA}.scrape_retries (next_attempt_at);")
+cur.execute(f"CREATE TABLE IF NOT EXISTS {DB_SCHEMA}.telegram_file_ids (\n    bot_id BIGINT NOT NULL,\n    content_hash VARCHAR(64) NOT NULL,\n    file_id TEXT NOT NULL,\n    created_at TIMESTAMP,\n    PRIMARY KEY (bot_id, content_hash)\n);")
+
+# columns added after the initial schema
+cur.execute(f"ALTER TABLE {DB_SCHEMA}.user_settings ADD COLUMN IF NOT EXISTS imap_uidvalidity BIGINT;")
+cur.execute(f"ALTER TABLE {DB_SCHEMA}.user_settings ADD COLUMN IF NOT EXISTS imap_last_uid BIGINT;")
+cur.execute(f"ALTER TABLE {DB_SCHEMA}.user_settings ADD COLUMN IF NOT EXISTS mail_backend VARCHAR(16) DEFAULT 'imap';")
+cur.execute(f"ALTER TABLE {DB_SCHEMA}.user_settings ADD COLUMN IF NOT EXISTS gmail_refresh_token_encrypted TEXT;")
+cur.execute(f"ALTER TABLE {DB_SCHEMA}.user_settings ADD COLUMN IF NOT EXISTS gmail_history_id BIGINT;")
+cur.execute(f"ALTER TABLE {DB_SCHEMA}.user_settings ADD COLUMN IF NOT EXISTS listing_source VARCHAR(16) DEFAULT 'website';")
 
 conn.commit()
 print('Tables created (if not existed).')
@@ -0,0 +1,173 @@
+"""BrowserPool and MobileDeClient's browser fallback against a local HTML server.
+
+Usage: python scripts/test_browser_pool.py  (or python -m pytest scripts/test_browser_pool.py)
+
+No Chrome needed: FakeDriver implements the few WebDriver calls the pool
+makes (get, page_source, execute_script, quit) with a plain HTTP request
+that identifies as HeadlessChrome. The server on 127.0.0.1 answers /blocked
+with 403 and /challenge with a bot-check page unless the browser asks.
+"""
+from dotenv import load_dotenv
+import os, sys, threading, time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+load_dotenv('.env.local')
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app.scrapers.browser_pool import BrowserPool
+from app.scrapers.mobile_de_client import MobileDeClient
+from app.scrapers.rate_limiter import HostRateLimiter
+
+OK = b'<html><head><title>Peugeot 308</title></head><body><h1>Peugeot 308</h1></body></html>'
+CHALLENGE = b'<html><body><div id="px-captcha"></div></body></html>'
+BROWSER_MARK = 'HeadlessChrome'
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        from_browser = BROWSER_MARK in self.headers.get('User-Agent', '')
+        status, body = 200, OK
+        if not from_browser and self.path.startswith('/blocked'):
+            status, body = 403, b'Forbidden'
+        elif not from_browser and self.path.startswith('/challenge'):
+            body = CHALLENGE
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+BASE = f'http://127.0.0.1:{server.server_port}'
+
+
+class FakeDriver:
+    started = 0
+    active = 0
+    max_active = 0
+    guard = threading.Lock()
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.page_source = None
+        self.quit_called = False
+        with FakeDriver.guard:
+            FakeDriver.started += 1
+
+    def get(self, url):
+        with FakeDriver.guard:
+            FakeDriver.active += 1
+            FakeDriver.max_active = max(FakeDriver.max_active, FakeDriver.active)
+        try:
+            if self.fail_on and self.fail_on in url:
+                raise RuntimeError('renderer crashed')
+            time.sleep(0.05)
+            req = urllib.request.Request(url, headers={'User-Agent': f'Mozilla/5.0 {BROWSER_MARK}/122.0'})
+            with urllib.request.urlopen(req, timeout=5) as resp:
+                self.page_source = resp.read().decode()
+        finally:
+            with FakeDriver.guard:
+                FakeDriver.active -= 1
+
+    def execute_script(self, script):
+        return 64 * 1024 * 1024
+
+    def quit(self):
+        self.quit_called = True
+
+
+def _reset():
+    FakeDriver.started = FakeDriver.active = FakeDriver.max_active = 0
+
+
+def _client(pool):
+    return MobileDeClient(rate_limiter=HostRateLimiter(rate=100, burst=100, max_rate=200), browser_pool=pool)
+
+
+def test_fallback_only_for_blocked_pages():
+    _reset()
+    pool = BrowserPool(size=1, prewarm=False, driver_factory=FakeDriver)
+    client = _client(pool)
+    assert client.fetch(f'{BASE}/ok') == OK.decode()
+    assert pool.stats()['pages'] == 0
+    assert client.fetch(f'{BASE}/blocked') == OK.decode()
+    assert client.fetch(f'{BASE}/challenge') == OK.decode()
+    stats = pool.stats()
+    assert stats['pages'] == 2
+    assert stats['avg_js_heap_mb'] == 64.0
+    # one warm browser served both
+    assert FakeDriver.started == 1
+    pool.close()
+
+
+def test_no_pool_no_fallback():
+    assert _client(None).fetch(f'{BASE}/blocked') is None
+
+
+def test_prewarm_and_recycle():
+    _reset()
+    pool = BrowserPool(size=1, max_pages=2, driver_factory=FakeDriver)
+    deadline = time.monotonic() + 5
+    while pool.stats()['idle'] < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pool.stats()['idle'] == 1
+    for _ in range(4):
+        assert pool.fetch(f'{BASE}/ok') == OK.decode()
+    stats = pool.stats()
+    assert stats['pages'] == 4
+    assert stats['recycled'] == 2
+    assert stats['browsers'] <= 1
+    pool.close()
+
+
+def test_broken_browser_is_replaced():
+    _reset()
+    drivers = iter([FakeDriver(fail_on='/ok'), FakeDriver()])
+    pool = BrowserPool(size=1, prewarm=False, driver_factory=lambda: next(drivers))
+    assert pool.fetch(f'{BASE}/ok') is None
+    deadline = time.monotonic() + 5
+    while pool.stats()['idle'] < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pool.fetch(f'{BASE}/ok') == OK.decode()
+    stats = pool.stats()
+    assert stats['failures'] == 1 and stats['recycled'] == 1 and stats['pages'] == 1
+    pool.close()
+
+
+def test_failed_start_frees_the_slot():
+    def broken():
+        raise RuntimeError('chrome not found')
+
+    pool = BrowserPool(size=1, prewarm=False, driver_factory=broken)
+    assert pool.fetch(f'{BASE}/ok') is None
+    assert pool.fetch(f'{BASE}/ok') is None
+    assert pool.stats()['browsers'] == 0 and pool.stats()['failures'] == 2
+
+
+def test_size_limits_concurrent_browsers():
+    _reset()
+    pool = BrowserPool(size=2, prewarm=False, driver_factory=FakeDriver)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pool.fetch(f'{BASE}/ok'))) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [OK.decode()] * 6
+    assert FakeDriver.started == 2
+    assert FakeDriver.max_active <= 2
+    pool.close()
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name, 'OK')
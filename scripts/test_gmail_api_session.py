@@ -0,0 +1,191 @@
+"""GmailApiSession against a canned Gmail REST API (no network).
+
+Usage: python scripts/test_gmail_api_session.py  (or python -m pytest scripts/test_gmail_api_session.py)
+
+FakeGmailHttp replaces the session's requests.Session and answers the
+OAuth token, history, profile, messages.list, batch and batchModify
+endpoints from an in-memory mailbox. Covers the multipart/mixed batch
+parser, the incremental history sync, the expired-history full resync and
+messages whose download keeps failing.
+"""
+from dotenv import load_dotenv
+import base64, json, os, re, sys
+from urllib.parse import urlsplit
+load_dotenv('.env.local')
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app.gmail_api_client import GmailApiSession
+
+BASE = 'https://gmail.test'
+TOKEN_URL = 'https://oauth.test/token'
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, payload=None, content=None, headers=None):
+        self.status_code = status_code
+        self.content = content if content is not None else json.dumps(payload or {}).encode()
+        self.text = self.content.decode('utf-8', 'replace')
+        self.headers = headers or {'Content-Type': 'application/json'}
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def _b64url(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip('=')
+
+
+def _message(message_id: str, sender: str, subject: str, html: str) -> dict:
+    return {'id': message_id, 'labelIds': ['INBOX', 'UNREAD'], 'payload': {
+        'mimeType': 'multipart/alternative',
+        'headers': [{'name': 'From', 'value': sender}, {'name': 'Subject', 'value': subject}],
+        'parts': [{'mimeType': 'text/html', 'filename': '',
+                   'headers': [{'name': 'Content-Type', 'value': 'text/html; charset="utf-8"'}],
+                   'body': {'data': _b64url(html), 'size': len(html)}}],
+    }}
+
+
+def batch_response(items, boundary='batch_test_boundary'):
+    """Canned multipart/mixed batch reply; ``items`` are (content id, status, json)."""
+    parts = []
+    for content_id, status, payload in items:
+        reason = {200: 'OK', 404: 'Not Found', 429: 'Too Many Requests'}[status]
+        parts.append(f'--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n'
+                     f'HTTP/1.1 {status} {reason}\r\nContent-Type: application/json; charset=UTF-8\r\n'
+                     f'Vary: Origin\r\n\r\n{json.dumps(payload)}\r\n')
+    body = ''.join(parts) + f'--{boundary}--\r\n'
+    return FakeResponse(content=body.encode(), headers={'Content-Type': f'multipart/mixed; boundary={boundary}'})
+
+
+class FakeGmailHttp:
+    def __init__(self, messages, history=(), history_id=500, expired_below=0, failing=()):
+        self.messages = {m['id']: m for m in messages}
+        self.history = list(history)      # (history id, message id), oldest first
+        self.history_id = history_id
+        self.expired_below = expired_below
+        self.failing = set(failing)       # ids whose full download always fails
+        self.unread = [m['id'] for m in messages]
+        self.calls = []
+
+    def post(self, url, data=None, timeout=None):
+        assert url == TOKEN_URL
+        return FakeResponse(payload={'access_token': 'token'})
+
+    def request(self, method, url, headers=None, timeout=None, params=None, data=None, json=None):
+        path = urlsplit(url).path
+        self.calls.append((method, path))
+        if path == '/gmail/v1/users/me/history':
+            if int(params['startHistoryId']) < self.expired_below:
+                return FakeResponse(404, {'error': {'code': 404, 'message': 'Requested entity was not found.'}})
+            records = [{'id': str(h), 'messagesAdded': [{'message': {'id': m}}]}
+                       for h, m in self.history if h > int(params['startHistoryId'])]
+            return FakeResponse(payload={'history': records, 'historyId': str(self.history_id)})
+        if path == '/gmail/v1/users/me/profile':
+            return FakeResponse(payload={'historyId': str(self.history_id)})
+        if path == '/gmail/v1/users/me/messages':
+            # newest first, like Gmail
+            return FakeResponse(payload={'messages': [{'id': m} for m in reversed(self.unread)]})
+        if path == '/batch/gmail/v1':
+            items = []
+            for i, (message_id, query) in enumerate(re.findall(r'GET /gmail/v1/users/me/messages/(\w+)\?(\S+)', data.decode())):
+                if message_id in self.failing and 'format=full' in query:
+                    items.append((f'item{i}', 429, {'error': {'code': 429}}))
+                else:
+                    items.append((f'item{i}', 200, self.messages[message_id]))
+            return batch_response(reversed(items))
+        if path == '/gmail/v1/users/me/messages/batchModify':
+            return FakeResponse(payload={})
+        raise AssertionError(f'unexpected call {method} {path}')
+
+    def close(self):
+        pass
+
+
+class Settings:
+    mail_backend = 'gmail_api'
+    gmail_refresh_token_decrypted = 'refresh'
+
+    def __init__(self, history_id=None):
+        self.gmail_history_id = history_id
+
+
+def _session(settings, http, server_filter=False):
+    session = GmailApiSession(settings, 'client', 'secret', server_filter=server_filter,
+                              base_url=BASE, token_url=TOKEN_URL)
+    session.http = http
+    return session
+
+
+def _run(session):
+    """What _process_messages does with the sync state."""
+    uids = []
+    for msg in session.iter_new_messages():
+        uids.append(msg.uid)
+        session.message_done(msg)
+        session.mark_seen(msg.uid)
+    session.sync_done()
+    session.close()
+    return uids
+
+
+MAILBOX = [
+    _message('m1', 'mobile.de <noreply@mobile.de>', 'Neue Angebote', '<a href="https://suchen.mobile.de/fahrzeuge/details.html?id=111111111">Golf</a>'),
+    _message('m2', 'Freund <friend@example.com>', 'Fwd: Golf', 'Schau mal: https://suchen.mobile.de/fahrzeuge/details.html?id=222222222'),
+    _message('m3', 'mobile.de <noreply@mobile.de>', 'Neue Angebote', '<a href="https://suchen.mobile.de/fahrzeuge/details.html?id=333333333">Passat</a>'),
+]
+
+
+def test_parse_batch():
+    resp = batch_response([('item2', 200, {'id': 'c'}), ('item0', 404, {'error': {}}), ('item1', 200, {'id': 'b'})])
+    assert sorted(GmailApiSession._parse_batch(resp)) == [(0, 404, {}), (1, 200, {'id': 'b'}), (2, 200, {'id': 'c'})]
+
+
+def test_history_sync():
+    http = FakeGmailHttp(MAILBOX, history=[(101, 'm1'), (102, 'm2'), (103, 'm3')], history_id=110)
+    settings = Settings(history_id=100)
+    uids = _run(_session(settings, http))
+    assert uids == ['m1', 'm2', 'm3']
+    assert settings.gmail_history_id == 110
+    session = _session(Settings(100), FakeGmailHttp(MAILBOX, history=[(101, 'm1')]))
+    assert 'id=111111111' in next(session.iter_new_messages()).html_body
+
+
+def test_server_filter_skips_other_senders():
+    http = FakeGmailHttp(MAILBOX, history=[(101, 'm1'), (102, 'm2'), (103, 'm3')], history_id=110)
+    assert _run(_session(Settings(100), http, server_filter=True)) == ['m1', 'm3']
+
+
+def test_expired_history_resyncs_unread_mail():
+    http = FakeGmailHttp(MAILBOX, history_id=900, expired_below=500)
+    settings = Settings(history_id=42)
+    uids = _run(_session(settings, http))
+    assert uids == ['m1', 'm2', 'm3']
+    assert ('GET', '/gmail/v1/users/me/profile') in http.calls
+    assert settings.gmail_history_id == 900
+
+
+def test_failed_download_keeps_mark_below_it():
+    http = FakeGmailHttp(MAILBOX, history=[(101, 'm1'), (102, 'm2'), (103, 'm3')], history_id=110, failing={'m2'})
+    settings = Settings(history_id=100)
+    assert _run(_session(settings, http)) == ['m1', 'm3']
+    assert settings.gmail_history_id == 101
+    # next cycle: m2 downloads again
+    http.failing.clear()
+    assert 'm2' in _run(_session(settings, http))
+    assert settings.gmail_history_id == 110
+
+
+def test_failed_download_during_resync_resyncs_again():
+    http = FakeGmailHttp(MAILBOX, history_id=900, failing={'m3'})
+    settings = Settings()
+    assert _run(_session(settings, http)) == ['m1', 'm2']
+    assert settings.gmail_history_id is None
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name, 'OK')
@@ -0,0 +1,138 @@
+"""COMPRESS=DEFLATE (RFC 4978) on GmailIMAP against a scripted in-memory server.
+
+Usage: python scripts/test_imap_compress.py  (or python -m pytest scripts/test_imap_compress.py)
+
+FakeImapSocket stands in for the TLS socket: it answers CAPABILITY,
+COMPRESS, SELECT, NOOP and UID FETCH, switches both directions to raw
+deflate after COMPRESS, and hands data back in small recv() chunks so that
+compressed blocks and IMAP lines never line up.
+"""
+from dotenv import load_dotenv
+import os, sys, zlib
+load_dotenv('.env.local')
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app.gmail_client import GmailIMAP
+
+BODY = b'Subject: Neues Angebot\r\n\r\n' + b'<tr><td>VW Golf 2.0 TDI, 18.990 EUR</td></tr>\r\n' * 2000
+
+
+class FakeImapSocket:
+    def __init__(self, offer_compress=True, chunk=7, exists_after_compress=False):
+        self.offer_compress = offer_compress
+        self.chunk = chunk
+        self.exists_after_compress = exists_after_compress
+        self.outbuf = bytearray(b'* PREAUTH [CAPABILITY IMAP4rev1] test server ready\r\n')
+        self.inbuf = b''
+        self.deflate = self.inflate = None
+        self.wire_in = self.wire_out = 0
+
+    def _reply(self, data: bytes):
+        if self.deflate is not None:
+            data = self.deflate.compress(data) + self.deflate.flush(zlib.Z_SYNC_FLUSH)
+        self.outbuf += data
+
+    def sendall(self, data):
+        self.wire_in += len(data)
+        if self.inflate is not None:
+            data = self.inflate.decompress(data)
+        self.inbuf += data
+        while b'\r\n' in self.inbuf:
+            line, self.inbuf = self.inbuf.split(b'\r\n', 1)
+            self._command(line)
+
+    def _command(self, line: bytes):
+        tag, _, command = line.partition(b' ')
+        command = command.upper()
+        if command == b'CAPABILITY':
+            caps = b'IMAP4rev1 COMPRESS=DEFLATE' if self.offer_compress else b'IMAP4rev1'
+            self._reply(b'* CAPABILITY ' + caps + b'\r\n' + tag + b' OK done\r\n')
+        elif command == b'COMPRESS DEFLATE':
+            self._reply(tag + b' OK DEFLATE active\r\n')
+            self.deflate = zlib.compressobj(9, zlib.DEFLATED, -15)
+            self.inflate = zlib.decompressobj(-15)
+            if self.exists_after_compress:
+                # lands in the same recv() as the tagged OK
+                self._reply(b'* 3 EXISTS\r\n')
+        elif command.startswith(b'SELECT'):
+            self._reply(b'* 1 EXISTS\r\n* OK [UIDVALIDITY 1] ok\r\n' + tag + b' OK [READ-WRITE] SELECT done\r\n')
+        elif command == b'NOOP':
+            self._reply(tag + b' OK NOOP done\r\n')
+        elif command.startswith(b'UID FETCH'):
+            self._reply(b'* 1 FETCH (UID 7 BODY[] {%d}\r\n' % len(BODY) + BODY + b')\r\n' + tag + b' OK FETCH done\r\n')
+        else:
+            self._reply(tag + b' BAD unknown command\r\n')
+
+    def recv(self, size):
+        data = bytes(self.outbuf[:min(size, self.chunk)])
+        del self.outbuf[:len(data)]
+        self.wire_out += len(data)
+        return data
+
+    def settimeout(self, timeout):
+        pass
+
+    def gettimeout(self):
+        return None
+
+    def shutdown(self, how):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeGmailIMAP(GmailIMAP):
+    def __init__(self, fake_sock):
+        self._fake_sock = fake_sock
+        super().__init__('imap.test', 993)
+
+    def open(self, host='', port=993, timeout=None):
+        self.host, self.port = host, port
+        self._rbuf = bytearray()
+        self._compressor = None
+        self._decompressor = None
+        self.sock = self._fake_sock
+
+
+def _fetch_body(mail):
+    assert mail.select('INBOX')[0] == 'OK'
+    typ, data = mail.uid('FETCH', '7', '(BODY[])')
+    assert typ == 'OK', (typ, data)
+    return data[0][1]
+
+
+def test_compressed_fetch():
+    sock = FakeImapSocket()
+    mail = FakeGmailIMAP(sock)
+    assert mail.enable_compression()
+    before = sock.wire_out
+    assert _fetch_body(mail) == BODY
+    assert sock.wire_out - before < len(BODY) / 10, 'FETCH was not compressed'
+    # the client side is compressed too: the server could inflate the commands
+    assert mail.noop()[0] == 'OK'
+
+
+def test_data_read_past_compress_ok():
+    sock = FakeImapSocket(chunk=65536, exists_after_compress=True)
+    mail = FakeGmailIMAP(sock)
+    assert mail.enable_compression()
+    assert mail.noop()[0] == 'OK'
+    assert mail.untagged_responses.get('EXISTS') == [b'3']
+
+
+def test_server_without_compress():
+    sock = FakeImapSocket(offer_compress=False)
+    mail = FakeGmailIMAP(sock)
+    assert not mail.enable_compression()
+    assert sock.deflate is None
+    assert _fetch_body(mail) == BODY
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name, 'OK')
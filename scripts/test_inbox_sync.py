@@ -0,0 +1,191 @@
+"""IMAP UID sync: UIDVALIDITY baseline, high-water mark, mark persistence (no network).
+
+Usage: python scripts/test_inbox_sync.py  (or python -m pytest scripts/test_inbox_sync.py)
+
+FakeMailbox answers the few UID commands ImapSession sends (FETCH (UID),
+SEARCH, STORE) from a list of UIDs with unread and mobile.de flags; message
+bodies are not downloaded. _process_messages runs against an in-memory
+SQLite database, with _process_message replaced by a recorder.
+"""
+from dotenv import load_dotenv
+import os, re, sys
+load_dotenv('.env.local')
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.pool import StaticPool
+from app import tasks
+from app.extensions import db
+from app.gmail_client import ImapSession
+from app.models import DB_SCHEMA, PostingLog, User, UserSettings
+
+app = Flask(__name__)
+app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://',
+                  SQLALCHEMY_ENGINE_OPTIONS={'poolclass': StaticPool, 'connect_args': {'check_same_thread': False}})
+db.init_app(app)
+with app.app_context():
+    event.listen(db.engine, 'connect', lambda conn, _: conn.execute(f"ATTACH DATABASE ':memory:' AS {DB_SCHEMA}"))
+    db.create_all()
+
+
+class FakeMailbox:
+    def __init__(self, uids, unseen=(), from_mobile=None, uidvalidity=1):
+        self.uids = sorted(uids)
+        self.unseen = set(unseen)
+        self.from_mobile = set(self.uids if from_mobile is None else from_mobile)
+        self.uidvalidity = uidvalidity
+        self.capabilities = ()
+
+    def add(self, uid, unseen=True):
+        self.uids.append(uid)
+        if unseen:
+            self.unseen.add(uid)
+        self.from_mobile.add(uid)
+
+    def response(self, code):
+        value = self.uidvalidity if code == 'UIDVALIDITY' else max(self.uids, default=0) + 1
+        return code, [str(value).encode()]
+
+    def uid(self, command, *args):
+        if command == 'FETCH':
+            first = args[0].split(':')[0]
+            found = [] if first == '*' else [u for u in self.uids if u >= int(first)]
+            # like a real server, "n:*" and "*" always include the newest message
+            found = found or self.uids[-1:]
+            return 'OK', [b'%d (UID %d)' % (i + 1, u) for i, u in enumerate(found)]
+        if command == 'SEARCH':
+            criteria = args[1]
+            found = self.uids
+            if 'UNSEEN' in criteria:
+                found = [u for u in found if u in self.unseen]
+            if 'FROM "mobile.de"' in criteria:
+                found = [u for u in found if u in self.from_mobile]
+            m = re.match(r'UID (\d+):(\d+|\*)', criteria)
+            if m:
+                upper = int(m.group(2)) if m.group(2) != '*' else float('inf')
+                found = [u for u in found if int(m.group(1)) <= u <= upper]
+            return 'OK', [' '.join(map(str, found)).encode()]
+        return 'OK', [None]
+
+
+class Msg:
+    def __init__(self, uid):
+        self.uid = uid
+        self.subject = f'Neues Angebot {uid}'
+
+    def close(self):
+        pass
+
+
+class Session(ImapSession):
+    """ImapSession on a FakeMailbox; messages are stand-ins carrying only a UID."""
+
+    def __init__(self, settings, mailbox, **kwargs):
+        super().__init__(settings, **kwargs)
+        self._mail = mailbox
+
+    def _iter_fetch(self, uids, match=None):
+        return (Msg(uid) for uid in uids)
+
+
+def _user() -> int:
+    with app.app_context():
+        user = User(email=f'sync{User.query.count()}@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(UserSettings(user_id=user.id, gmail_address=user.email))
+        db.session.commit()
+        return user.id
+
+
+def _sync(session, stop_after=None):
+    uids = []
+    for msg in session.iter_new_messages():
+        uids.append(msg.uid)
+        session.message_done(msg)
+        if len(uids) == stop_after:
+            break
+    session.sync_done()
+    return uids
+
+
+def _session(mailbox, last_uid=None, uidvalidity=None, **kwargs):
+    settings = type('Settings', (), {})()
+    settings.gmail_address, settings.gmail_app_password_decrypted = 'me@example.com', 'app-password'
+    settings.imap_last_uid, settings.imap_uidvalidity = last_uid, uidvalidity
+    return Session(settings, mailbox, **kwargs)
+
+
+def test_first_sync_takes_the_unread_set_once():
+    mailbox = FakeMailbox(range(1, 11), unseen={7, 9})
+    session = _session(mailbox)
+    assert _sync(session) == [7, 9]
+    # read mail after the last unread message is not new mail either
+    assert session.user_settings.imap_last_uid == 10
+    assert session.user_settings.imap_uidvalidity == 1
+    assert _sync(session) == []
+    mailbox.add(11, unseen=False)
+    assert _sync(session) == [11]
+
+
+def test_uidvalidity_change_resets_the_baseline():
+    mailbox = FakeMailbox(range(1, 6), unseen={4}, uidvalidity=2)
+    session = _session(mailbox, last_uid=500, uidvalidity=1)
+    assert _sync(session) == [4]
+    assert (session.user_settings.imap_uidvalidity, session.user_settings.imap_last_uid) == (2, 5)
+
+
+def test_newest_message_below_the_mark_is_not_fetched_again():
+    session = _session(FakeMailbox(range(1, 11)), last_uid=10, uidvalidity=1)
+    assert _sync(session) == []
+    assert session.user_settings.imap_last_uid == 10
+
+
+def test_filtered_sync_skips_to_the_ceiling_only_when_complete():
+    mailbox = FakeMailbox(range(1, 21), from_mobile={12, 15})
+    session = _session(mailbox, last_uid=10, uidvalidity=1, server_filter=True)
+    # the cycle stops after the first message: UID 15 must not be skipped
+    assert _sync(session, stop_after=1) == [12]
+    assert session.user_settings.imap_last_uid == 12
+    assert _sync(session) == [15]
+    assert session.user_settings.imap_last_uid == 20
+
+
+def test_process_messages_persists_the_mark_past_failures():
+    user_id = _user()
+    mailbox = FakeMailbox(range(1, 11), unseen={4, 6, 9})
+    handled = []
+
+    def process(user, settings, session, msg, openai_key, bot_token, pause=0):
+        handled.append(msg.uid)
+        if msg.uid == 6:
+            raise RuntimeError('broken message')
+
+    original, tasks._process_message = tasks._process_message, process
+    try:
+        with app.app_context():
+            for _ in range(2):
+                user = db.session.get(User, user_id)
+                settings = user.settings
+                settings.gmail_app_password_decrypted = 'app-password'
+                session = Session(settings, mailbox)
+                tasks._process_messages(user, settings, session, tasks._iter_synced(settings, session), None, None)
+                db.session.remove()
+            settings = db.session.get(User, user_id).settings
+            assert settings.imap_last_uid == 10
+            errors = PostingLog.query.filter_by(user_id=user_id).all()
+            assert [(log.gmail_message_id, 'broken message' in log.error) for log in errors] == [('6', True)]
+    finally:
+        tasks._process_message = original
+    # the failed message was not retried by the second sync
+    assert handled == [4, 6, 9]
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name, 'OK')
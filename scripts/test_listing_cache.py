@@ -0,0 +1,107 @@
+"""ListingCache disk tier shared by several workers (no network).
+
+Usage: python scripts/test_listing_cache.py  (or python -m pytest scripts/test_listing_cache.py)
+
+Each ListingCache instance stands for one gunicorn worker with a cold
+memory tier; they all share one disk_dir.
+"""
+from dotenv import load_dotenv
+import os, sys, tempfile, threading, time
+load_dotenv('.env.local')
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app.utils.listing_cache import ListingCache
+
+
+def _listing(n: int) -> dict:
+    return {'title': f'Golf {n}', 'price': n, 'specs': {'Kilometerstand': f'{n} km'},
+            'description': 'Scheckheft\nNichtraucher', 'photos': [bytes([n % 256]) * (1000 + n), b'\n' * n]}
+
+
+def _worker(disk_dir, ttl=100):
+    return ListingCache(ttl=ttl, disk_dir=disk_dir)
+
+
+def test_disk_entry_shared_between_workers():
+    disk = tempfile.mkdtemp()
+    _worker(disk).put('392817465', _listing(7))
+    other = _worker(disk)
+    assert other.get('392817465') == _listing(7)
+    assert other.disk_hits == 1
+    # the copy handed out is the caller's to change
+    other.get('392817465')['photos'].clear()
+    assert other.get('392817465')['photos'] == _listing(7)['photos']
+
+
+def test_promoted_entry_keeps_remaining_ttl():
+    disk = tempfile.mkdtemp()
+    _worker(disk).put('1', _listing(1))
+    path = os.path.join(disk, '1.listing')
+    os.utime(path, (time.time() - 99.5,) * 2)
+    other = _worker(disk)
+    assert other.get('1') is not None
+    time.sleep(0.7)
+    assert other.get('1') is None
+
+
+def test_truncated_entry_is_a_miss():
+    disk = tempfile.mkdtemp()
+    _worker(disk).put('2', _listing(2))
+    path = os.path.join(disk, '2.listing')
+    with open(path, 'rb') as f:
+        data = f.read()
+    for cut in (len(data) - 1, data.index(b'\n') + 1, 10):
+        with open(path, 'wb') as f:
+            f.write(data[:cut])
+        assert _worker(disk).get('2') is None, cut
+
+
+def test_concurrent_writers_never_mix_entries():
+    disk = tempfile.mkdtemp()
+    stop = threading.Event()
+    bad = []
+
+    def write(n):
+        cache = _worker(disk)
+        while not stop.is_set():
+            cache.put('3', _listing(n))
+
+    def read():
+        while not stop.is_set():
+            listing = _worker(disk).get('3')
+            if listing is not None and listing != _listing(listing['price']):
+                bad.append(listing['title'])
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in (11, 22, 33)]
+    threads += [threading.Thread(target=read) for _ in range(3)]
+    for t in threads:
+        t.start()
+    time.sleep(1)
+    stop.set()
+    for t in threads:
+        t.join()
+    assert not bad, bad
+    assert not [n for n in os.listdir(disk) if n.startswith('.')], 'temporary files left behind'
+
+
+def test_prune_keeps_newest():
+    disk = tempfile.mkdtemp()
+    cache = ListingCache(ttl=100, disk_dir=disk, disk_max_entries=10)
+    for n in range(60):
+        cache.put(str(1000 + n), _listing(n))
+        os.utime(os.path.join(disk, f'{1000 + n}.listing'), (time.time() - 60 + n,) * 2)
+    # a stale temporary file of a crashed writer
+    stale = os.path.join(disk, '.999-abandoned')
+    open(stale, 'wb').close()
+    os.utime(stale, (time.time() - 1000,) * 2)
+    cache._prune()
+    assert sorted(os.listdir(disk)) == [f'{1000 + n}.listing' for n in range(50, 60)]
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name, 'OK')
@@ -0,0 +1,74 @@
+"""classify_url / listing_urls: which e-mail links reach the scraper (no network).
+
+Usage: python scripts/test_mobile_urls.py  (or python -m pytest scripts/test_mobile_urls.py)
+"""
+from dotenv import load_dotenv
+import os, sys
+load_dotenv('.env.local')
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app.utils.mobile_urls import DETAILS, REDIRECT, SKIP, classify_url, listing_urls
+
+CANONICAL = 'https://suchen.mobile.de/fahrzeuge/details.html?id=392817465'
+
+
+def test_details_links():
+    for url in (
+        'https://suchen.mobile.de/fahrzeuge/details.html?id=392817465&utm_source=email',
+        'https://m.mobile.de/fahrzeuge/details.html?adId=392817465',
+        'https://www.mobile.de/auto-inserat/vw-golf-2-0-tdi/392817465.html',
+        'https://suchen.mobile.de/ru/%D1%82%D1%80%D0%B0%D0%BD%D1%81%D0%BF%D0%BE%D1%80%D1%82/details.html?id=392817465',
+    ):
+        assert classify_url(url) == (DETAILS, '392817465'), url
+
+
+def test_wrapped_listing_link_needs_no_request():
+    wrapped = 'https://www.google.com/url?q=https%3A%2F%2Fsuchen.mobile.de%2Ffahrzeuge%2Fdetails.html%3Fid%3D392817465'
+    assert classify_url(wrapped) == (DETAILS, '392817465')
+
+
+def test_tracking_links_go_to_the_resolver():
+    for url in (
+        'https://click.mobile.de/ls/click?upn=abc123',
+        'https://u123456.ct.sendgrid.net/ls/click?upn=xyz',
+        'https://tracking.example-mailer.com/open/c/9f8e7d',
+        'https://t.example.com/r/openListing?u=1',
+        'https://t.example.com/opener/5',
+    ):
+        assert classify_url(url) == (REDIRECT, None), url
+
+
+def test_skipped_without_io():
+    for url in (
+        'https://www.mobile.de/',
+        'https://suchen.mobile.de/fahrzeuge/search.html?isSearchRequest=true',
+        'https://click.mobile.de/unsubscribe?u=1',
+        'https://u123456.ct.sendgrid.net/wf/open?upn=abc',
+        'https://news.mobile.de/open.aspx?id=1',
+        'https://img.classistatic.de/api/v1/mo-prod/images/3a/logo.png',
+        'https://apps.apple.com/de/app/mobile-de/id378563358',
+        'https://www.facebook.com/mobile.de',
+        'https://www.mobile.de/service/datenschutz',
+        'mailto:kundenservice@mobile.de',
+    ):
+        assert classify_url(url)[0] == SKIP, url
+
+
+def test_listing_urls_order_and_dedupe():
+    urls = [
+        'https://click.mobile.de/ls/click?upn=1',
+        'https://suchen.mobile.de/fahrzeuge/details.html?id=392817465&ref=a',
+        'https://www.mobile.de/auto-inserat/vw-golf/392817465.html',
+        'https://click.mobile.de/ls/click?upn=1',
+        'https://click.mobile.de/unsubscribe',
+    ]
+    assert listing_urls(urls) == [CANONICAL, 'https://click.mobile.de/ls/click?upn=1']
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name, 'OK')
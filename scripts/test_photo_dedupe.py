@@ -0,0 +1,115 @@
+"""PhotoDeduper: learned placeholders, hash memory and near-duplicate photos (no network).
+
+Usage: python scripts/test_photo_dedupe.py  (or python -m pytest scripts/test_photo_dedupe.py)
+
+The hash-memory tests feed integer hashes straight in. The image tests
+need Pillow: Gallery stands in for PhotoFetcher and serves generated
+images by CDN path, so thumbnails and full sizes are the same picture.
+"""
+from dotenv import load_dotenv
+import io, os, random, sys
+load_dotenv('.env.local')
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import pytest
+
+from app.utils.photo_dedupe import PhotoDeduper, variant_key
+
+CDN = 'https://img.classistatic.de/api/v1/mo-prod/images'
+
+
+def test_hash_seen_in_several_listings_becomes_a_placeholder():
+    deduper = PhotoDeduper(fetcher=None, auto_placeholder_listings=3)
+    logo, photo = 0xF0F0F0F0F0F0F0F0, 0x0123456789ABCDEF
+    for listing in ('a', 'b'):
+        deduper._remember([logo], listing)
+    # the same listing seen again is not another dealer
+    deduper._remember([logo, photo], 'b')
+    assert not deduper._is_placeholder(logo)
+    deduper._remember([logo], 'c')
+    assert deduper._is_placeholder(logo)
+    assert not deduper._is_placeholder(photo)
+    assert not deduper._keep(logo, [])
+    assert deduper.stats()['dropped_placeholders'] == 1
+
+
+def test_configured_placeholder_matches_nearby_hashes():
+    logo = 0xFFFF0000FFFF0000
+    deduper = PhotoDeduper(fetcher=None, threshold=6, placeholders=[logo])
+    assert deduper._is_placeholder(logo ^ 0b101)
+    assert not deduper._is_placeholder(logo ^ 0xFF)
+
+
+def test_hash_memory_is_bounded_and_keeps_recent_hashes():
+    deduper = PhotoDeduper(fetcher=None, auto_placeholder_listings=2, max_hashes=2)
+    deduper._remember([1], 'a')
+    deduper._remember([2], 'a')
+    # seeing 1 again makes 2 the oldest
+    deduper._remember([1], 'b')
+    deduper._remember([3], 'b')
+    assert deduper.stats()['known_hashes'] == 2
+    assert deduper._is_placeholder(1)
+    deduper._remember([2], 'c')
+    assert not deduper._is_placeholder(2)
+
+
+class Gallery:
+    """PhotoFetcher stand-in: image bytes by CDN path, any ?rule= size."""
+
+    deadline = 20
+
+    def __init__(self, images):
+        self.images = {variant_key(f'{CDN}/{name}'): data for name, data in images.items()}
+        self.fetched = []
+
+    def fetch_all(self, urls, deadline=None, keep_missing=False):
+        self.fetched.extend(urls)
+        return [self.images.get(variant_key(u)) for u in urls]
+
+
+def _image(seed, quality=90, size=(320, 240)):
+    Image = pytest.importorskip('PIL.Image')
+    rnd = random.Random(seed)
+    # one block per dHash cell, so re-encoding barely moves the hash
+    img = Image.new('L', (9, 8))
+    img.putdata([rnd.randrange(256) for _ in range(9 * 8)])
+    out = io.BytesIO()
+    img.resize(size).convert('RGB').save(out, 'JPEG', quality=quality)
+    return out.getvalue()
+
+
+def test_dealer_logo_is_learned_across_listings():
+    images = {'logo': _image('logo')}
+    images.update({f'car{n}': _image(n) for n in range(8)})
+    deduper = PhotoDeduper(Gallery(images), auto_placeholder_listings=3)
+    for n in range(3):
+        urls = [f'{CDN}/logo?rule=mo-1024.jpg', f'{CDN}/car{2 * n}?rule=mo-1024.jpg', f'{CDN}/car{2 * n + 1}?rule=mo-1024.jpg']
+        assert len(deduper.select_unique(urls, listing_key=str(n))) == 3
+    urls = [f'{CDN}/car6?rule=mo-1024.jpg', f'{CDN}/logo?rule=mo-1024.jpg', f'{CDN}/car7?rule=mo-1024.jpg']
+    assert deduper.select_unique(urls, listing_key='3') == [urls[0], urls[2]]
+    assert deduper.stats()['dropped_placeholders'] == 1
+
+
+def test_recompressed_copy_is_a_duplicate():
+    images = {'front': _image('front'), 'front-copy': _image('front', quality=60, size=(640, 480)),
+              'back': _image('back')}
+    gallery = Gallery(images)
+    urls = [f'{CDN}/{name}?rule=mo-1024.jpg' for name in ('front', 'front-copy', 'back')]
+    photos, expected = PhotoDeduper(gallery).fetch_unique(urls, listing_key='1')
+    assert expected == 2
+    assert photos == [images['front'], images['back']]
+    # only the survivors were downloaded in full
+    assert [u for u in gallery.fetched if 'mo-1024' in u] == [urls[0], urls[2]]
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            try:
+                test()
+            except pytest.skip.Exception as exc:
+                print(name, 'SKIPPED:', exc)
+                continue
+            print(name, 'OK')
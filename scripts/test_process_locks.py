@@ -0,0 +1,84 @@
+"""Scheduler-lock takeover and inbox-lock exclusion across processes.
+
+Usage: python scripts/test_process_locks.py  (or python -m pytest scripts/test_process_locks.py)
+
+The other gunicorn worker is played by a child process that takes the
+same flock and is then SIGKILLed, as an OOM kill or a recycled worker
+would be. Locks live in a fresh PROCESS_LOCK_DIR. POSIX only (fcntl).
+"""
+from dotenv import load_dotenv
+import os, subprocess, sys, tempfile, threading, time
+load_dotenv('.env.local')
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app.config import Config
+from app import process_locks
+from app.process_locks import ProcessLock, inbox_lock
+
+Config.PROCESS_LOCK_DIR = tempfile.mkdtemp(prefix='avto-bot-locks-')
+
+HOLDER = """
+import fcntl, sys, time
+lock_file = open(sys.argv[1], 'a')
+fcntl.flock(lock_file, fcntl.LOCK_EX)
+print('held', flush=True)
+time.sleep(60)
+"""
+
+
+def _other_worker(name):
+    """A child process holding the flock of ``name`` until it is killed."""
+    child = subprocess.Popen([sys.executable, '-c', HOLDER, process_locks._lock_path(name)],
+                             stdout=subprocess.PIPE, text=True)
+    assert child.stdout.readline().strip() == 'held'
+    return child
+
+
+def test_first_process_starts_at_once():
+    started = []
+    lock = ProcessLock('test-free')
+    assert lock.when_acquired(lambda: started.append(True))
+    assert started == [True] and lock.held
+    # acquiring again in the holder is a no-op
+    assert lock.acquire()
+
+
+def test_waiting_worker_takes_over_when_holder_dies():
+    holder = _other_worker('test-takeover')
+    started = threading.Event()
+    lock = ProcessLock('test-takeover')
+    try:
+        assert not lock.when_acquired(started.set)
+        assert not started.wait(0.5), 'started while another process held the lock'
+        assert not lock.held
+    finally:
+        holder.kill()
+        holder.wait()
+    assert started.wait(5), 'background jobs did not move to the waiting worker'
+    assert lock.held
+
+
+def test_inbox_lock_waits_for_other_process():
+    holder = _other_worker('inbox-42')
+    entered = threading.Event()
+
+    def run():
+        with inbox_lock(42):
+            entered.set()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert not entered.wait(0.5), 'inbox run overlapped another process'
+    holder.kill()
+    holder.wait()
+    assert entered.wait(5)
+    thread.join(5)
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name, 'OK')
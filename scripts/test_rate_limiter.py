@@ -0,0 +1,77 @@
+"""HostRateLimiter shared by several worker processes (no network).
+
+Usage: python scripts/test_rate_limiter.py  (or python -m pytest scripts/test_rate_limiter.py)
+
+The gunicorn workers are played by forked processes that share one
+shared_dir. POSIX only (fork, fcntl).
+"""
+from dotenv import load_dotenv
+import multiprocessing, os, sys, tempfile, time
+load_dotenv('.env.local')
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app.scrapers.rate_limiter import HostRateLimiter
+
+URL = 'https://suchen.mobile.de/fahrzeuge/details.html?id=392817465'
+
+
+def _limiter(shared_dir, rate=20.0):
+    return HostRateLimiter(rate=rate, burst=1, max_rate=rate, increase=0, shared_dir=shared_dir)
+
+
+def _worker(shared_dir, requests):
+    limiter = _limiter(shared_dir)
+    for _ in range(requests):
+        limiter.acquire(URL)
+
+
+def _run_workers(shared_dir, workers=3, requests=10):
+    ctx = multiprocessing.get_context('fork')
+    procs = [ctx.Process(target=_worker, args=(shared_dir, requests)) for _ in range(workers)]
+    started = time.monotonic()
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+        assert p.exitcode == 0
+    return time.monotonic() - started
+
+
+def test_rate_is_shared_between_processes():
+    # 30 requests at 20 req/s with a burst of 1 take ~1.45s in total;
+    # three independent buckets would finish in ~0.45s
+    elapsed = _run_workers(tempfile.mkdtemp())
+    assert elapsed >= 1.3, elapsed
+
+
+def test_without_shared_dir_each_process_has_its_own_bucket():
+    elapsed = _run_workers(None)
+    assert elapsed < 1.3, elapsed
+
+
+def test_throttle_pauses_other_workers():
+    shared = tempfile.mkdtemp()
+    one, other = _limiter(shared), _limiter(shared)
+    assert one.acquire(URL)
+    one.on_response(URL, 429, retry_after='1')
+    assert not other.acquire(URL, timeout=0.5)
+    assert other.stats()['suchen.mobile.de']['blocked_for'] > 0.4
+    assert other.acquire(URL, timeout=1)
+    # the halved rate reached the other worker too
+    assert other.stats()['suchen.mobile.de']['rate'] == 10.0
+
+
+def test_other_hosts_are_independent():
+    shared = tempfile.mkdtemp()
+    one, other = _limiter(shared), _limiter(shared)
+    one.on_response(URL, 429, retry_after='5')
+    assert other.acquire('https://img.classistatic.de/api/v1/1.jpg', timeout=0.1)
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name, 'OK')
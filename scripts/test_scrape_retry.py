@@ -0,0 +1,177 @@
+"""Scrape retry queue: backoff, enqueue and the retry_failed_scrapes job (no network).
+
+Usage: python scripts/test_scrape_retry.py  (or python -m pytest scripts/test_scrape_retry.py)
+
+Runs against an in-memory SQLite database. parse_mobile_de, last_failure
+and _post_listing are replaced by stand-ins, so a test decides whether
+the details page comes back and what the failure looks like.
+"""
+from dotenv import load_dotenv
+import os, sys
+from datetime import datetime, timedelta
+load_dotenv('.env.local')
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.pool import StaticPool
+from app import tasks
+from app.extensions import db
+from app.models import DB_SCHEMA, PostingLog, ScrapeRetry, User, UserSettings
+from app.security import encrypt_secret
+
+MASTER_KEY = 'test-master-key'
+URL = 'https://suchen.mobile.de/fahrzeuge/details.html?id=392817465'
+LISTING = {'title': 'VW Golf 2.0 TDI', 'description': 'Scheckheft', 'photo_urls': ['https://img.test/1.jpg']}
+
+app = Flask(__name__)
+app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://',
+                  SQLALCHEMY_ENGINE_OPTIONS={'poolclass': StaticPool, 'connect_args': {'check_same_thread': False}},
+                  MASTER_SECRET_KEY=MASTER_KEY, SCRAPE_RETRY_BASE_SECONDS=300,
+                  SCRAPE_RETRY_MAX_DELAY_SECONDS=6 * 3600, SCRAPE_RETRY_MAX_ATTEMPTS=3, SCRAPE_RETRY_BATCH=10)
+db.init_app(app)
+with app.app_context():
+    event.listen(db.engine, 'connect', lambda conn, _: conn.execute(f"ATTACH DATABASE ':memory:' AS {DB_SCHEMA}"))
+    db.create_all()
+
+
+class Scraper:
+    """parse_mobile_de / last_failure / _post_listing stand-ins."""
+
+    def __init__(self, listing=None, failure=None):
+        self.listing = listing
+        self.failure = failure
+        self.posted = []
+
+    def __enter__(self):
+        self.saved = tasks.parse_mobile_de, tasks.last_failure, tasks._post_listing
+        tasks.parse_mobile_de = lambda url: self.listing
+        tasks.last_failure = lambda: self.failure
+        tasks._post_listing = lambda user, settings, url, listing, *args: self.posted.append((url, listing['title']))
+        return self
+
+    def __exit__(self, *exc):
+        tasks.parse_mobile_de, tasks.last_failure, tasks._post_listing = self.saved
+
+
+def _user(auto_post=True) -> int:
+    user = User(email=f'retry{User.query.count()}@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(UserSettings(user_id=user.id, auto_post_enabled=auto_post,
+                                openai_api_key_encrypted=encrypt_secret('sk-test', MASTER_KEY),
+                                telegram_bot_token_encrypted=encrypt_secret('123:TOKEN', MASTER_KEY)))
+    db.session.commit()
+    return user.id
+
+
+def _queued(user_id, attempts=0, due_in=-1) -> int:
+    item = ScrapeRetry(user_id=user_id, url=URL, gmail_message_id='17', subject='Neues Angebot',
+                       attempts=attempts, next_attempt_at=datetime.utcnow() + timedelta(seconds=due_in))
+    db.session.add(item)
+    db.session.commit()
+    return item.id
+
+
+def _run():
+    tasks.retry_failed_scrapes(app)
+
+
+def test_retry_delay_backs_off_with_jitter():
+    with app.app_context():
+        for attempts, full in ((0, 300), (1, 600), (3, 2400), (10, 6 * 3600)):
+            delays = [tasks._retry_delay(attempts) for _ in range(200)]
+            assert all(full / 2 <= d <= full for d in delays), attempts
+            # the random half spreads retries of one outage apart
+            assert max(delays) - min(delays) > full / 4, attempts
+
+
+def test_enqueue_once_per_user_and_url():
+    with app.app_context():
+        user_id = _user()
+        before = datetime.utcnow()
+        tasks._enqueue_retry(user_id, URL, '17', 'Neues Angebot', 'HTTP 503')
+        tasks._enqueue_retry(user_id, URL, '18', 'Neues Angebot', 'HTTP 503')
+        items = ScrapeRetry.query.filter_by(user_id=user_id).all()
+        assert len(items) == 1
+        item = items[0]
+        assert (item.attempts, item.gmail_message_id, item.last_error) == (0, '17', 'HTTP 503')
+        assert before + timedelta(seconds=150) <= item.next_attempt_at <= datetime.utcnow() + timedelta(seconds=300)
+
+
+def test_success_posts_and_dequeues():
+    with app.app_context():
+        item_id = _queued(_user())
+    with Scraper(listing=LISTING) as scraper:
+        _run()
+    assert scraper.posted == [(URL, 'VW Golf 2.0 TDI')]
+    with app.app_context():
+        assert db.session.get(ScrapeRetry, item_id) is None
+
+
+def test_retryable_failure_is_rescheduled():
+    with app.app_context():
+        item_id = _queued(_user())
+    with Scraper(failure={'error': 'HTTP 429', 'retryable': True}) as scraper:
+        _run()
+    assert scraper.posted == []
+    with app.app_context():
+        item = db.session.get(ScrapeRetry, item_id)
+        assert (item.attempts, item.last_error) == (1, 'HTTP 429')
+        assert item.next_attempt_at >= datetime.utcnow() + timedelta(seconds=290)
+
+
+def test_not_due_item_waits():
+    with app.app_context():
+        item_id = _queued(_user(), due_in=600)
+    with Scraper(listing=LISTING) as scraper:
+        _run()
+    assert scraper.posted == []
+    with app.app_context():
+        assert db.session.get(ScrapeRetry, item_id).attempts == 0
+
+
+def test_gives_up_after_max_attempts_or_permanent_error():
+    for attempts, failure in ((2, {'error': 'HTTP 503', 'retryable': True}),
+                              (0, {'error': 'HTTP 404', 'retryable': False})):
+        with app.app_context():
+            user_id = _user()
+            item_id = _queued(user_id, attempts=attempts)
+        with Scraper(failure=failure):
+            _run()
+        with app.app_context():
+            assert db.session.get(ScrapeRetry, item_id) is None
+            log = PostingLog.query.filter_by(user_id=user_id).one()
+            assert not log.sent_to_channel
+            assert log.error == f"scrape failed after {attempts + 1} retries: {failure['error']}"
+
+
+def test_page_without_photos_is_not_retried():
+    with app.app_context():
+        user_id = _user()
+        item_id = _queued(user_id)
+    with Scraper(listing={'title': 'VW Golf', 'description': ''}) as scraper:
+        _run()
+    assert scraper.posted == []
+    with app.app_context():
+        assert db.session.get(ScrapeRetry, item_id) is None
+        assert 'no title or photos' in PostingLog.query.filter_by(user_id=user_id).one().error
+
+
+def test_user_who_turned_auto_post_off_is_dropped():
+    with app.app_context():
+        item_id = _queued(_user(auto_post=False))
+    with Scraper(listing=LISTING) as scraper:
+        _run()
+    assert scraper.posted == []
+    with app.app_context():
+        assert db.session.get(ScrapeRetry, item_id) is None
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name, 'OK')
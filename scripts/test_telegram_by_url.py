@@ -0,0 +1,317 @@
+"""send_car_post against a local Telegram Bot API stand-in (no network).
+
+Usage: python scripts/test_telegram_by_url.py  (or python -m pytest scripts/test_telegram_by_url.py)
+
+The stand-in records every call, and rejects photo URLs containing
+"broken" and uploads starting with it the way Telegram does
+("failed to send message #N ...").
+Covers albums sent by URL, the byte-upload fallback for rejected photos,
+single-photo posts, where the text ends up (album caption or message) and
+the file_id cache (in-memory SQLite), including stale file_ids.
+"""
+from dotenv import load_dotenv
+import json, os, sys, threading
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+load_dotenv('.env.local')
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.pool import StaticPool
+from app.config import Config
+from app import telegram_client
+from app.extensions import db
+from app.models import DB_SCHEMA, TelegramFileId
+
+calls = []
+
+
+class BotApiHandler(BaseHTTPRequestHandler):
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _form(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        ctype = self.headers.get('Content-Type', '')
+        if not ctype.startswith('multipart/'):
+            return {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        msg = BytesParser(policy=default_policy).parsebytes(f'Content-Type: {ctype}\r\n\r\n'.encode() + body)
+        return {part.get_param('name', header='content-disposition'): part.get_content()
+                for part in msg.iter_parts()}
+
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        path, _, query = self.path.partition('?')
+        method = path.rsplit('/', 1)[-1]
+        form = self._form() if self.command == 'POST' else {k: v[0] for k, v in parse_qs(query).items()}
+        calls.append((method, form))
+        if method == 'sendMediaGroup':
+            media = json.loads(form['media'])
+        elif method == 'sendPhoto':
+            media = [{'media': form['photo']}]
+        else:
+            media = []
+        file_ids = []
+        for i, item in enumerate(media, start=1):
+            source = item['media']
+            if isinstance(source, str) and source.startswith('attach://'):
+                source = form[source[len('attach://'):]]
+            if source.startswith(b'broken') if isinstance(source, bytes) else 'broken' in source:
+                self._reply(400, {'ok': False, 'error_code': 400, 'description':
+                                  f'Bad Request: failed to send message #{i} with the error message "WEBPAGE_CURL_FAILED"'})
+                return
+            # a file_id sent again comes back unchanged
+            file_ids.append(source if isinstance(source, str) and source.startswith('fid:')
+                            else 'fid:' + (source.decode() if isinstance(source, bytes) else source))
+        messages = [{'message_id': i, 'photo': [{'file_id': 'thumb'}, {'file_id': fid}]} for i, fid in enumerate(file_ids)]
+        result = messages if method == 'sendMediaGroup' else {'message_id': 1}
+        self._reply(200, {'ok': True, 'result': result})
+
+    def log_message(self, *args):
+        pass
+
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), BotApiHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+Config.TELEGRAM_API_BASE_URL = f'http://127.0.0.1:{server.server_port}'
+
+# file_id cache tests run inside this app; the other tests have no app
+# context, so the cache is off for them
+app = Flask(__name__)
+app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', TELEGRAM_FILE_ID_CACHE=True,
+                  SQLALCHEMY_ENGINE_OPTIONS={'poolclass': StaticPool, 'connect_args': {'check_same_thread': False}})
+db.init_app(app)
+with app.app_context():
+    event.listen(db.engine, 'connect', lambda conn, _: conn.execute(f"ATTACH DATABASE ':memory:' AS {DB_SCHEMA}"))
+    db.create_all()
+
+
+class Settings:
+    telegram_channel_id = -100123
+    telegram_channel_username = '@test'
+
+
+URLS = [f'https://img.test/{i}.jpg' for i in range(3)]
+
+
+class Fetcher:
+    """fetch_photos stand-in; ``missing`` URLs cannot be downloaded either."""
+
+    def __init__(self, missing=()):
+        self.missing = set(missing)
+        self.fetched = []
+
+    def __call__(self, urls):
+        self.fetched.extend(urls)
+        return [None if u in self.missing else b'jpeg:' + u.encode() for u in urls]
+
+
+def _post(text, photos=(), photo_urls=None, fetch_photos=None, album_caption=True):
+    calls.clear()
+    Config.TELEGRAM_ALBUM_CAPTION = album_caption
+    ok, err = telegram_client.send_car_post(Settings, '123:TOKEN', text, list(photos), photo_urls=photo_urls,
+                                            fetch_photos=fetch_photos)
+    assert ok, err
+    return list(calls)
+
+
+def test_album_by_url_with_caption():
+    fetch = Fetcher()
+    sent = _post('VW Golf, 18.990 EUR', photo_urls=URLS, fetch_photos=fetch)
+    assert [m for m, _ in sent] == ['sendMediaGroup']
+    media = json.loads(sent[0][1]['media'])
+    assert [item['media'] for item in media] == URLS
+    assert media[0]['caption'] == 'VW Golf, 18.990 EUR' and 'caption' not in media[1]
+    assert fetch.fetched == []
+
+
+def test_rejected_url_is_uploaded():
+    urls = [URLS[0], 'https://img.test/broken.jpg', URLS[2]]
+    fetch = Fetcher()
+    sent = _post('VW Golf', photo_urls=urls, fetch_photos=fetch)
+    assert [m for m, _ in sent] == ['sendMediaGroup', 'sendMediaGroup']
+    assert fetch.fetched == ['https://img.test/broken.jpg']
+    form = sent[1][1]
+    media = json.loads(form['media'])
+    assert [item['media'] for item in media] == [URLS[0], 'attach://photo1', URLS[2]]
+    assert form['photo1'] == b'jpeg:https://img.test/broken.jpg'
+    assert media[0]['caption'] == 'VW Golf'
+
+
+def test_undownloadable_photo_is_dropped():
+    urls = ['https://img.test/broken.jpg', URLS[1], URLS[2]]
+    sent = _post('VW Golf', photo_urls=urls, fetch_photos=Fetcher(missing=urls[:1]))
+    media = json.loads(sent[-1][1]['media'])
+    # the caption moves to the new first photo
+    assert [item['media'] for item in media] == URLS[1:]
+    assert media[0]['caption'] == 'VW Golf'
+
+
+def test_every_photo_dropped_sends_text():
+    urls = ['https://img.test/broken.jpg']
+    sent = _post('VW Golf', photo_urls=urls, fetch_photos=Fetcher(missing=urls))
+    assert [m for m, _ in sent] == ['sendPhoto', 'sendMessage']
+    assert sent[-1][1]['text'] == 'VW Golf'
+
+
+def test_single_photo_uses_send_photo():
+    sent = _post('VW Golf', photo_urls=URLS[:1], fetch_photos=Fetcher())
+    assert [m for m, _ in sent] == ['sendPhoto']
+    assert sent[0][1] == {'chat_id': '-100123', 'caption': 'VW Golf', 'photo': URLS[0]}
+
+
+def test_long_text_continues_in_message():
+    text = ('Ausstattung: Navi, Sitzheizung, Tempomat. ' * 40).strip()
+    sent = _post(text, photo_urls=URLS, fetch_photos=Fetcher())
+    assert [m for m, _ in sent] == ['sendMediaGroup', 'sendMessage']
+    caption = json.loads(sent[0][1]['media'])[0]['caption']
+    assert len(caption) <= telegram_client.TELEGRAM_CAPTION_LIMIT
+    assert text.startswith(caption)
+
+
+def test_caption_limit_counts_utf16_units():
+    # every car emoji is two UTF-16 units: 600 of them are over the 1024 limit
+    text = 'Top-Zustand ' + '\U0001F697' * 600
+    sent = _post(text, photo_urls=URLS, fetch_photos=Fetcher())
+    assert [m for m, _ in sent] == ['sendMediaGroup', 'sendMessage']
+    caption = json.loads(sent[0][1]['media'])[0]['caption']
+    assert telegram_client._utf16_len(caption) <= telegram_client.TELEGRAM_CAPTION_LIMIT
+    assert caption + sent[1][1]['text'] == text
+    assert telegram_client._utf16_len(caption) == telegram_client.TELEGRAM_CAPTION_LIMIT
+
+
+def test_overflow_past_message_limit_is_split_again():
+    paragraphs = ['Ausstattung %d: ' % n + 'Navi, Sitzheizung, Tempomat. ' * 30 for n in range(8)]
+    text = '\n\n'.join(paragraphs)
+    sent = _post(text, photo_urls=URLS, fetch_photos=Fetcher())
+    assert [m for m, _ in sent] == ['sendMediaGroup', 'sendMessage', 'sendMessage']
+    caption = json.loads(sent[0][1]['media'])[0]['caption']
+    messages = [form['text'] for _, form in sent[1:]]
+    assert all(len(m) <= telegram_client.TELEGRAM_MESSAGE_LIMIT for m in messages)
+    # cut at paragraph breaks, no word lost
+    assert caption == paragraphs[0].rstrip()
+    assert all(m.startswith('Ausstattung') for m in messages)
+    assert ' '.join([caption] + messages).split() == text.split()
+
+
+def test_split_text_breaks():
+    split = telegram_client._split_text
+    assert split('VW Golf', 10) == ('VW Golf', '')
+    assert split('A' * 70 + '\n\n' + 'B' * 70, 100) == ('A' * 70, 'B' * 70)
+    assert split('A' * 70 + '\nB' * 20, 100)[0].count('\n') == 14
+    # a break in the first half would waste the caption: hard cut instead
+    assert split('A' * 10 + ' ' + 'B' * 200, 100) == ('A' * 10 + ' ' + 'B' * 89, 'B' * 111)
+    # an emoji is never cut in half
+    head, rest = split('\U0001F697' * 60, 101)
+    assert (len(head), len(rest)) == (50, 10)
+
+
+def test_caption_off_sends_text_separately():
+    sent = _post('VW Golf', photo_urls=URLS, fetch_photos=Fetcher(), album_caption=False)
+    assert [m for m, _ in sent] == ['sendMediaGroup', 'sendMessage']
+    assert all('caption' not in item for item in json.loads(sent[0][1]['media']))
+
+
+def test_byte_photos():
+    sent = _post('VW Golf', photos=[b'one', b'two'])
+    assert [m for m, _ in sent] == ['sendMediaGroup']
+    form = sent[0][1]
+    assert [item['media'] for item in json.loads(form['media'])] == ['attach://photo0', 'attach://photo1']
+    assert form['photo0'] == b'one' and form['photo1'] == b'two'
+
+
+
+def test_rejected_upload_is_not_blamed_on_urls():
+    calls.clear()
+    fetch = Fetcher()
+    try:
+        telegram_client._send_album('TOKEN', -100123, [b'broken jpeg'] + URLS[1:], fetch)
+    except telegram_client.TelegramApiError as e:
+        # the error names the uploaded photo: nothing to retry, the URLs stay untouched
+        assert 'message #1' in e.description
+    else:
+        raise AssertionError('rejected upload was not reported')
+    assert [m for m, _ in calls] == ['sendMediaGroup']
+    assert fetch.fetched == []
+    items = [b'jpeg', URLS[0]]
+    assert telegram_client._rejected_items('bad request: failed to send message #1 with the error message '
+                                           '"wrong file identifier/http url specified"', items) == []
+    assert telegram_client._rejected_items('bad request: failed to send message #2 ...', items) == [1]
+
+
+
+def _cached_file_ids():
+    rows = db.session.query(TelegramFileId.content_hash, TelegramFileId.file_id).all()
+    return dict(rows)
+
+
+def _clear_file_ids():
+    db.session.query(TelegramFileId).delete()
+    db.session.commit()
+
+
+def test_file_ids_are_cached_and_reused():
+    with app.app_context():
+        _clear_file_ids()
+        _post('VW Golf', photo_urls=URLS, fetch_photos=Fetcher())
+        cached = _cached_file_ids()
+        assert cached == {telegram_client._media_key(u): 'fid:' + u for u in URLS}
+        sent = _post('VW Golf', photo_urls=URLS, fetch_photos=Fetcher())
+        assert [item['media'] for item in json.loads(sent[0][1]['media'])] == ['fid:' + u for u in URLS]
+
+
+def test_stale_file_id_is_evicted_and_resent():
+    with app.app_context():
+        _clear_file_ids()
+        key = telegram_client._media_key(URLS[1])
+        telegram_client.file_id_store.put_many('123', {key: 'fid:broken-expired'})
+        fetch = Fetcher()
+        sent = _post('VW Golf', photo_urls=URLS, fetch_photos=fetch)
+        assert [[item['media'] for item in json.loads(form['media'])] for _, form in sent] == [
+            [URLS[0], 'fid:broken-expired', URLS[2]], URLS]
+        # re-sent from its URL, no download needed, and the fresh file_id replaced the stale one
+        assert fetch.fetched == []
+        assert _cached_file_ids()[key] == 'fid:' + URLS[1]
+
+
+def test_stale_file_id_is_evicted_when_the_photo_is_gone():
+    with app.app_context():
+        _clear_file_ids()
+        gone = 'https://img.test/broken.jpg'
+        key = telegram_client._media_key(gone)
+        telegram_client.file_id_store.put_many('123', {key: 'fid:broken-expired'})
+        sent = _post('VW Golf', photo_urls=[gone] + URLS[1:], fetch_photos=Fetcher(missing=[gone]))
+        assert [item['media'] for item in json.loads(sent[-1][1]['media'])] == URLS[1:]
+        assert key not in _cached_file_ids()
+
+
+def test_stale_file_id_of_uploaded_photo():
+    with app.app_context():
+        _clear_file_ids()
+        key = telegram_client._media_key(b'two')
+        telegram_client.file_id_store.put_many('123', {key: 'fid:broken-expired'})
+        sent = _post('VW Golf', photos=[b'one', b'two'])
+        assert [m for m, _ in sent] == ['sendMediaGroup', 'sendMediaGroup']
+        form = sent[-1][1]
+        assert [item['media'] for item in json.loads(form['media'])] == ['attach://photo0', 'attach://photo1']
+        assert form['photo1'] == b'two'
+        assert _cached_file_ids()[key] == 'fid:two'
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name, 'OK')